@@ -1,19 +1,36 @@
 import os
 import urllib.parse
+import datetime
 import sqlalchemy
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
 from dotenv import load_dotenv
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from typing import Optional
-from fastapi import FastAPI, HTTPException, Query  # Query might be missing
-# LangChain Imports
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_community.utilities import SQLDatabase
-from langchain_community.agent_toolkits import create_sql_agent
-from langchain_core.prompts import PromptTemplate
-from langchain_core.runnables import RunnablePassthrough
-from langchain_core.output_parsers import StrOutputParser
+from fastapi import FastAPI, HTTPException, Query, Depends  # Query might be missing
+import asyncio
+from contextlib import asynccontextmanager
+# LangChain is imported inside init_agent, which runs in a background task after startup.
+from config.compression import CompressionMiddleware
+from services.data_version import bump_data_version, get_data_version
+from services.cache import chart_cache, chart_cache_key
+from services.readiness import init_agent_in_background, readiness_report
+from services.account_purge import request_account_deletion, run_account_purges
+from services.transaction_search import build_filters, search_transactions
+from services.subscriptions import get_user_subscriptions, run_subscription_refresh
+from services.anomalies import get_anomalies, score_transactions
+from services.change_feed import change_feed
+from services.live_updates import transactions_delta, totals_delta
+from services.template_insights import get_insights, insight_pipeline
+from services.dashboard_overview import parse_fields, get_overview
+from services.executors import work_executor, ExecutorBusyError, TaskTimeoutError
+from services.forecasting import forecast_net_worth
+from services.agent_sql_log import agent_query_log, logged_sql_database, start_turn, set_tool_input, current_turn
+from services.profiling import ProfilingMiddleware, PROFILE_SAMPLE_HZ, stack_sampler
+from config.rate_limiter import rate_limit
+from api.v1.router import live_router
+from api.v1.endpoints import admin
 
 # Load environment variables from the .env file
 load_dotenv()
@@ -45,16 +62,25 @@ def get_engine():
 # ==================================================
 full_chain = None
 
+def query_sql_agent(sql_agent_executor, question: str) -> str:
+    set_tool_input(question)
+    return sql_agent_executor.invoke({"input": question})["output"]
+
 def init_agent():
     """Initializes the three-agent sequential chain with privacy enforcement."""
     global full_chain
-    if "GOOGLE_API_KEY" not in os.environ or not os.environ["GOOGLE_API_KEY"]:
-        raise ValueError("Error: GOOGLE_API_KEY environment variable not set or empty.")
-
     print("🚀 Initializing Privacy-Aware Sequential AI Agent...")
-    llm = ChatGoogleGenerativeAI(model="gemini-2.5-flash", temperature=0)
+    from langchain_community.agent_toolkits import create_sql_agent
+    from langchain_core.prompts import PromptTemplate
+    from langchain_core.runnables import RunnablePassthrough
+    from langchain_core.output_parsers import StrOutputParser
+    from services.llm_router import build_chat_model
+
+    llm = build_chat_model()
+    # Reformulating the question is a short step, so it goes to the smaller model tier.
+    cheap_llm = build_chat_model("cheap")
     db_engine = get_engine()
-    db = SQLDatabase(db_engine)
+    db = logged_sql_database(db_engine)
 
     # --- Chain 1: Query Reformulator with Privacy Awareness ---
     reformulate_template = """
@@ -69,7 +95,7 @@ def init_agent():
     Reformulated Question (respecting privacy permissions):
     """
     reformulate_prompt = PromptTemplate.from_template(reformulate_template)
-    query_reformulator_chain = reformulate_prompt | llm | StrOutputParser()
+    query_reformulator_chain = reformulate_prompt | cheap_llm | StrOutputParser()
 
     # --- Chain 2: SQL Agent (unchanged) ---
     sql_agent_executor = create_sql_agent(llm, db=db, agent_type="openai-tools", verbose=True)
@@ -104,7 +130,7 @@ def init_agent():
             "permission_instructions": lambda x: x["permission_instructions"]
         }
         | RunnablePassthrough.assign(
-            sql_data=lambda x: sql_agent_executor.invoke({"input": x["reformulated_question"]})["output"]
+            sql_data=lambda x: query_sql_agent(sql_agent_executor, x["reformulated_question"])
         )
         | response_synthesizer_chain
     )
@@ -114,10 +140,39 @@ def init_agent():
 # ==================================================
 # 4. FastAPI Server
 # ==================================================
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Serve straight away; the chain is built in the background and retried until the DB and LLM are reachable.
+    agent_init = asyncio.create_task(init_agent_in_background(init_agent, lambda _: None))
+    account_purges = asyncio.create_task(run_account_purges())
+    subscription_refresh = asyncio.create_task(run_subscription_refresh())
+    agent_sql_logging = asyncio.create_task(agent_query_log.run())
+    template_insights = asyncio.create_task(insight_pipeline.run(run_chain_turn, lambda: full_chain is not None))
+    work_executor.start()
+    change_feed.start()
+    stack_sampler.bind(app)
+    stack_sampler.start(PROFILE_SAMPLE_HZ)
+    yield
+    agent_init.cancel()
+    account_purges.cancel()
+    subscription_refresh.cancel()
+    agent_sql_logging.cancel()
+    template_insights.cancel()
+    await change_feed.stop()
+    await work_executor.stop()
+    stack_sampler.stop()
+
+# Same per-route, per-plan buckets as main.py's api_router (see config/rate_limiter.py);
+# health checks are not limited.
+DEFAULT_RATE_LIMIT = [Depends(rate_limit("default"))]
+AI_CHAT_RATE_LIMIT = [*DEFAULT_RATE_LIMIT, Depends(rate_limit("ai_chat"))]
+
 app = FastAPI(
     title="AI Personal Finance Assistant",
     description="An API that allows natural language questions about financial data.",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 # API Request/Response Models
@@ -131,6 +186,17 @@ def health_check():
     """Root endpoint to check API status."""
     return {"status": "✅ API is running. Use /ask to query, /ping-db to test DB."}
 
+@app.get("/livez")
+def livez():
+    """Liveness: the process is up and serving. Never touches the database."""
+    return {"status": "alive"}
+
+@app.get("/readyz")
+def readyz():
+    """Readiness: database reachable (and the AI chain built, if READYZ_REQUIRE_AGENT is set)."""
+    ready, report = readiness_report()
+    return report if ready else ORJSONResponse(status_code=503, content=report)
+
 @app.get("/ping-db")
 def ping_db():
     """Check if the database connection is alive."""
@@ -142,7 +208,7 @@ def ping_db():
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"❌ Database connection failed: {e}")
 
-@app.post("/ask")
+@app.post("/ask", dependencies=AI_CHAT_RATE_LIMIT)
 async def ask_agent(request: QueryRequest):
     """Ask a natural language question for a specific user."""
     if not agent_executor:
@@ -163,7 +229,7 @@ async def ask_agent(request: QueryRequest):
         print(f"❌ Error while processing question: {e}")
         raise HTTPException(status_code=500, detail=f"An internal error occurred: {e}")
 
-@app.post("/reload-agent")
+@app.post("/reload-agent", dependencies=[Depends(rate_limit("reload_agent"))])
 def reload_agent():
     """Reload the AI Agent manually without restarting the server."""
     try:
@@ -172,7 +238,7 @@ def reload_agent():
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"❌ Failed to reload agent: {e}")
 
-@app.get("/api/v1/users/me")
+@app.get("/api/v1/users/me", dependencies=DEFAULT_RATE_LIMIT)
 async def get_current_user(user_id: str):
     """Get current user info for dashboard with permissions"""
     try:
@@ -183,7 +249,7 @@ async def get_current_user(user_id: str):
                     SELECT user_id, name, credit_score, epf_balance,
                            perm_assets, perm_liabilities, perm_transactions,
                            perm_investments, perm_credit_score, perm_epf_balance
-                    FROM Users WHERE user_id = :user_id
+                    FROM Users WHERE user_id = :user_id AND deleted_at IS NULL
                 """),
                 {"user_id": user_id}
             ).fetchone()
@@ -208,7 +274,7 @@ async def get_current_user(user_id: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/api/v1/users/update-permissions")
+@app.post("/api/v1/users/update-permissions", dependencies=DEFAULT_RATE_LIMIT)
 async def update_ai_permissions(permissions: dict, user_id: str):
     """Update AI access permissions for user data"""
     try:
@@ -234,10 +300,11 @@ async def update_ai_permissions(permissions: dict, user_id: str):
                 "perm_credit_score": permissions.get("perm_credit_score", True),
                 "perm_epf_balance": permissions.get("perm_epf_balance", True)
             })
-            conn.commit()
             
             if result.rowcount == 0:
                 raise HTTPException(status_code=404, detail="User not found")
+            bump_data_version(conn, user_id, "users")
+            conn.commit()
             
             return {
                 "message": "AI permissions updated successfully",
@@ -247,7 +314,7 @@ async def update_ai_permissions(permissions: dict, user_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.post("/api/v1/users/update-profile")
+@app.post("/api/v1/users/update-profile", dependencies=DEFAULT_RATE_LIMIT)
 async def update_user_profile(request: dict, user_id: str):
     """Update user credit score and EPF balance"""
     try:
@@ -264,10 +331,11 @@ async def update_user_profile(request: dict, user_id: str):
                 "credit_score": request.get("credit_score"),
                 "epf_balance": request.get("epf_balance")
             })
-            conn.commit()
             
             if result.rowcount == 0:
                 raise HTTPException(status_code=404, detail="User not found")
+            bump_data_version(conn, user_id, "users")
+            conn.commit()
             
             return {
                 "message": "Profile updated successfully",
@@ -276,7 +344,7 @@ async def update_user_profile(request: dict, user_id: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/api/v1/dashboard/summary")
+@app.get("/api/v1/dashboard/summary", dependencies=DEFAULT_RATE_LIMIT)
 async def get_dashboard_summary(user_id: str = "user_001"):
     """Get financial summary for dashboard"""
     try:
@@ -401,7 +469,7 @@ def format_permission_instructions(permissions: dict) -> str:
     
     return "\n".join(instructions)
 
-@app.post("/api/v1/transactions")
+@app.post("/api/v1/transactions", dependencies=DEFAULT_RATE_LIMIT)
 async def add_transaction(request: dict):
     """Add new transaction"""
     try:
@@ -414,28 +482,32 @@ async def add_transaction(request: dict):
         engine = get_engine()
         with engine.connect() as conn:
             stmt = sqlalchemy.text("""
-                INSERT INTO transactions (user_id, date, description, category, amount, type)
-                VALUES (:user_id, :date, :description, :category, :amount, :type)
+                INSERT INTO transactions (user_id, date, description, category, amount, type, anomaly_score, is_anomaly)
+                VALUES (:user_id, :date, :description, :category, :amount, :type, :anomaly_score, :is_anomaly)
             """)
             
-            conn.execute(stmt, {
+            transaction = {
                 "user_id": user_id,
                 "date": request["date"],
                 "description": request["description"], 
                 "category": request["category"],
                 "amount": request["amount"],
                 "type": request["type"]
-            })
+            }
+            score_transactions(conn, user_id, [transaction])
+            conn.execute(stmt, transaction)
+            bump_data_version(conn, user_id, "transactions", transactions_delta([transaction]))
             conn.commit()
             
             # logger.info("✅ Transaction added successfully")
-            return {"message": "Transaction added successfully", "status": "success"}
+            return {"message": "Transaction added successfully", "status": "success",
+                    "anomaly_score": transaction["anomaly_score"], "is_anomaly": transaction["is_anomaly"]}
     except Exception as e:
         # logger.error(f"❌ Error adding transaction: {e}")
         # logger.error(f"❌ Traceback: {traceback.format_exc()}")
         raise HTTPException(status_code=500, detail=str(e))
     
-@app.post("/api/v1/assets")
+@app.post("/api/v1/assets", dependencies=DEFAULT_RATE_LIMIT)
 async def add_asset(request: dict):
     """Add new asset"""
     try:
@@ -456,6 +528,7 @@ async def add_asset(request: dict):
                 "type": request["type"],
                 "value": request["value"]
             })
+            bump_data_version(conn, user_id, "assets", totals_delta("total_assets", request["value"]))
             conn.commit()
             
             return {"message": "Asset added successfully", "status": "success"}
@@ -463,7 +536,7 @@ async def add_asset(request: dict):
         #logger.error(f"❌ Error adding asset: {e}")
         raise HTTPException(status_code=500, detail=str(e))
     
-@app.post("/api/v1/investments")
+@app.post("/api/v1/investments", dependencies=DEFAULT_RATE_LIMIT)
 async def add_investment(request: dict):
     """Add new investment with purchase date"""
     try:
@@ -491,6 +564,7 @@ async def add_investment(request: dict):
                 "current_value": request["current_value"],
                 "purchase_date": request.get("purchase_date")
             })
+            bump_data_version(conn, user_id, "investments", totals_delta("investment_portfolio", request["current_value"], request["type"]))
             conn.commit()
             
             print("✅ Investment added successfully")
@@ -500,7 +574,7 @@ async def add_investment(request: dict):
         raise HTTPException(status_code=500, detail=str(e))
     
 
-@app.post("/api/v1/liabilities")
+@app.post("/api/v1/liabilities", dependencies=DEFAULT_RATE_LIMIT)
 async def add_liability(request: dict):
     """Add new liability"""
     try:
@@ -525,6 +599,7 @@ async def add_liability(request: dict):
                 "type": request["type"],
                 "outstanding_balance": request["outstanding_balance"]
             })
+            bump_data_version(conn, user_id, "liabilities", totals_delta("total_liabilities", request["outstanding_balance"]))
             conn.commit()
             
             print("✅ Liability added successfully")
@@ -534,222 +609,47 @@ async def add_liability(request: dict):
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.get("/api/v1/dashboard")
-async def get_dashboard_overview(user_id: str):
-    """Complete dashboard data - summary, charts, transactions, everything!"""
+@app.get("/api/v1/dashboard", dependencies=DEFAULT_RATE_LIMIT)
+async def get_dashboard_overview(user_id: str, fields: Optional[str] = None):
+    """Dashboard sections in one query; `fields` picks them (summary, recent, monthly, categories, investments, assets, liabilities, stats)."""
+    try:
+        selected = parse_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     try:
         engine = get_engine()
         with engine.connect() as conn:
-            # 1. USER BASIC INFO
-            user_info = conn.execute(
-                sqlalchemy.text("SELECT name, credit_score, epf_balance FROM Users WHERE user_id = :user_id"),
-                {"user_id": user_id}
-            ).fetchone()
-            
-            if not user_info:
-                raise HTTPException(status_code=404, detail="User not found")
-
-            # 2. FINANCIAL SUMMARY
-            total_assets = conn.execute(
-                sqlalchemy.text("SELECT COALESCE(SUM(value), 0) FROM Assets WHERE user_id = :user_id"),
-                {"user_id": user_id}
-            ).fetchone()[0]
-
-            total_liabilities = conn.execute(
-                sqlalchemy.text("SELECT COALESCE(SUM(outstanding_balance), 0) FROM Liabilities WHERE user_id = :user_id"),
-                {"user_id": user_id}
-            ).fetchone()[0]
-
-            total_investments = conn.execute(
-                sqlalchemy.text("SELECT COALESCE(SUM(current_value), 0) FROM Investments WHERE user_id = :user_id"),
-                {"user_id": user_id}
-            ).fetchone()[0]
-
-            # 3. RECENT TRANSACTIONS (Last 10)
-            recent_transactions = conn.execute(
-                sqlalchemy.text("""
-                    SELECT date, description, category, amount, type 
-                    FROM Transactions 
-                    WHERE user_id = :user_id 
-                    ORDER BY date DESC 
-                    LIMIT 10
-                """),
-                {"user_id": user_id}
-            ).fetchall()
-
-            transactions_list = []
-            for row in recent_transactions:
-                transactions_list.append({
-                    "date": str(row[0]),
-                    "name": row[1],
-                    "category": row[2],
-                    "amount": float(row[3]),
-                    "type": row[4]
-                })
-
-            # 4. MONTHLY CHART DATA (Last 6 months)
-            monthly_data = conn.execute(
-                sqlalchemy.text("""
-                    SELECT 
-                        DATE_TRUNC('month', date) as month,
-                        SUM(CASE WHEN type = 'income' THEN amount ELSE 0 END) as income,
-                        SUM(CASE WHEN type = 'expense' THEN ABS(amount) ELSE 0 END) as expenses
-                    FROM Transactions 
-                    WHERE user_id = :user_id 
-                        AND date >= CURRENT_DATE - INTERVAL '6 months'
-                    GROUP BY DATE_TRUNC('month', date)
-                    ORDER BY month
-                """),
-                {"user_id": user_id}
-            ).fetchall()
-
-            monthly_chart = []
-            for row in monthly_data:
-                monthly_chart.append({
-                    "month": row[0].strftime("%Y-%m"),
-                    "income": float(row[1]),
-                    "expenses": float(row[2])
-                })
-
-            # 5. CATEGORY BREAKDOWN (Expenses by category)
-            category_data = conn.execute(
-                sqlalchemy.text("""
-                    SELECT category, SUM(ABS(amount)) as total
-                    FROM Transactions 
-                    WHERE user_id = :user_id 
-                        AND type = 'expense'
-                        AND date >= CURRENT_DATE - INTERVAL '30 days'
-                    GROUP BY category
-                    ORDER BY total DESC
-                    LIMIT 8
-                """),
-                {"user_id": user_id}
-            ).fetchall()
-
-            category_breakdown = []
-            for row in category_data:
-                category_breakdown.append({
-                    "category": row[0],
-                    "amount": float(row[1])
-                })
-
-            # 6. INVESTMENT BREAKDOWN
-            investment_data = conn.execute(
-                sqlalchemy.text("""
-                    SELECT type, SUM(current_value) as total_value, COUNT(*) as count
-                    FROM Investments 
-                    WHERE user_id = :user_id
-                    GROUP BY type
-                    ORDER BY total_value DESC
-                """),
-                {"user_id": user_id}
-            ).fetchall()
-
-            investment_breakdown = []
-            for row in investment_data:
-                investment_breakdown.append({
-                    "type": row[0],
-                    "value": float(row[1]),
-                    "count": int(row[2])
-                })
-
-            # 7. ASSET BREAKDOWN
-            asset_data = conn.execute(
-                sqlalchemy.text("""
-                    SELECT type, SUM(value) as total_value, COUNT(*) as count
-                    FROM Assets 
-                    WHERE user_id = :user_id
-                    GROUP BY type
-                    ORDER BY total_value DESC
-                """),
-                {"user_id": user_id}
-            ).fetchall()
-
-            asset_breakdown = []
-            for row in asset_data:
-                asset_breakdown.append({
-                    "type": row[0],
-                    "value": float(row[1]),
-                    "count": int(row[2])
-                })
-
-            # 8. LIABILITY BREAKDOWN
-            liability_data = conn.execute(
-                sqlalchemy.text("""
-                    SELECT type, SUM(outstanding_balance) as total_balance, COUNT(*) as count
-                    FROM Liabilities 
-                    WHERE user_id = :user_id
-                    GROUP BY type
-                    ORDER BY total_balance DESC
-                """),
-                {"user_id": user_id}
-            ).fetchall()
-
-            liability_breakdown = []
-            for row in liability_data:
-                liability_breakdown.append({
-                    "type": row[0],
-                    "balance": float(row[1]),
-                    "count": int(row[2])
-                })
-
-            # 9. STATS COUNTERS
-            transaction_count = conn.execute(
-                sqlalchemy.text("SELECT COUNT(*) FROM Transactions WHERE user_id = :user_id"),
-                {"user_id": user_id}
-            ).fetchone()[0]
-
-            asset_count = conn.execute(
-                sqlalchemy.text("SELECT COUNT(*) FROM Assets WHERE user_id = :user_id"),
-                {"user_id": user_id}
-            ).fetchone()[0]
-
-            investment_count = conn.execute(
-                sqlalchemy.text("SELECT COUNT(*) FROM Investments WHERE user_id = :user_id"),
-                {"user_id": user_id}
-            ).fetchone()[0]
-
-            liability_count = conn.execute(
-                sqlalchemy.text("SELECT COUNT(*) FROM Liabilities WHERE user_id = :user_id"),
-                {"user_id": user_id}
-            ).fetchone()[0]
-
-            # Calculate net worth
-            net_worth = float(total_assets) + float(total_investments) - float(total_liabilities)
-
-            return {
-                "user_info": {
-                    "name": user_info[0],
-                    "credit_score": user_info[1],
-                    "epf_balance": float(user_info[2])
-                },
-                "financial_summary": {
-                    "total_assets": float(total_assets),
-                    "total_liabilities": float(total_liabilities),
-                    "total_investments": float(total_investments),
-                    "net_worth": net_worth,
-                    "epf_balance": float(user_info[2])
-                },
-                "recent_transactions": transactions_list,
-                "monthly_chart_data": monthly_chart,
-                "category_breakdown": category_breakdown,
-                "investment_breakdown": investment_breakdown,
-                "asset_breakdown": asset_breakdown,
-                "liability_breakdown": liability_breakdown,
-                "stats": {
-                    "transaction_count": transaction_count,
-                    "asset_count": asset_count,
-                    "investment_count": investment_count,
-                    "liability_count": liability_count,
-                    "total_records": transaction_count + asset_count + investment_count + liability_count
-                }
-            }
+            overview = get_overview(conn, user_id, selected)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if overview is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return overview
 
+@app.get("/api/v1/analytics/forecast", dependencies=DEFAULT_RATE_LIMIT)
+async def get_net_worth_forecast(
+    user_id: str,
+    months: int = Query(12, ge=1, le=60),
+    simulations: int = Query(2000, ge=100, le=20000),
+    seed: Optional[int] = None
+):
+    """Monte Carlo net worth projection (p10/p50/p90 per month), simulated in a worker process."""
+    try:
+        return await forecast_net_worth(get_engine(), user_id, months, simulations, seed)
+    except ExecutorBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except TaskTimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/v1/analytics/executor/stats", dependencies=DEFAULT_RATE_LIMIT)
+async def get_executor_stats():
+    """Pending tasks, queue wait and run times of this worker's process and I/O pools."""
+    return work_executor.status()
+
 # Add to your agent.py
-@app.get("/api/v1/transactions/all")
+@app.get("/api/v1/transactions/all", dependencies=DEFAULT_RATE_LIMIT)
 async def get_all_transactions(
     user_id: str,
     page: int = Query(1, ge=1),
@@ -766,16 +666,17 @@ async def get_all_transactions(
         with engine.connect() as conn:
             print("✅ DEBUG: Database connection established")
             
-            # Simple query first to test
-            test_query = "SELECT COUNT(*) FROM transactions WHERE user_id = :user_id"
-            print(f"🔍 DEBUG: Testing with query: {test_query}")
+            # Search term and category filters (full-text/fuzzy, see services/transaction_search.py)
+            where, filter_params = build_filters(user_id, search=search, category=category)
             
-            test_result = conn.execute(sqlalchemy.text(test_query), {"user_id": user_id})
+            count_query = f"SELECT COUNT(*) FROM transactions WHERE {where}"
+            print(f"🔍 DEBUG: Testing with query: {count_query}")
+            
+            test_result = conn.execute(sqlalchemy.text(count_query), filter_params)
             count = test_result.fetchone()[0]
             print(f"✅ DEBUG: Found {count} transactions for user")
             
-            # Simple select query
-            query = """
+            query = f"""
                 SELECT 
                     date,
                     description,
@@ -783,13 +684,13 @@ async def get_all_transactions(
                     amount,
                     type
                 FROM transactions 
-                WHERE user_id = :user_id
+                WHERE {where}
                 ORDER BY date DESC 
                 LIMIT :limit OFFSET :offset
             """
             
             offset = (page - 1) * limit
-            params = {"user_id": user_id, "limit": limit, "offset": offset}
+            params = {**filter_params, "limit": limit, "offset": offset}
             
             print(f"🔍 DEBUG: Executing main query with params: {params}")
             
@@ -821,7 +722,64 @@ async def get_all_transactions(
         print(f"❌ TRACEBACK: {traceback.format_exc()}")
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
-@app.get("/api/v1/dashboard/charts")
+@app.get("/api/v1/transactions/search", dependencies=DEFAULT_RATE_LIMIT)
+async def search_user_transactions(
+    user_id: str,
+    q: Optional[str] = Query(None, max_length=200),
+    category: Optional[str] = None,
+    min_amount: Optional[float] = None,
+    max_amount: Optional[float] = None,
+    date_from: Optional[datetime.date] = None,
+    date_to: Optional[datetime.date] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100)
+):
+    """Search transactions (full-text, fuzzy and substring) with filters and keyset pagination."""
+    try:
+        engine = get_engine()
+        with engine.connect() as conn:
+            return search_transactions(
+                conn, user_id, limit=limit, cursor=cursor, search=q, category=category,
+                min_amount=min_amount, max_amount=max_amount, date_from=date_from, date_to=date_to
+            )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+@app.get("/api/v1/transactions/anomalies", dependencies=DEFAULT_RATE_LIMIT)
+async def get_transaction_anomalies(user_id: str, limit: int = Query(20, ge=1, le=100)):
+    """Transactions flagged as unusual for their category when they were written."""
+    try:
+        engine = get_engine()
+        with engine.connect() as conn:
+            return get_anomalies(conn, user_id, limit)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+@app.get("/api/v1/subscriptions", dependencies=DEFAULT_RATE_LIMIT)
+async def get_subscriptions(user_id: str):
+    """Recurring payments and incomes detected in the user's transactions (see services/subscriptions.py)."""
+    try:
+        return get_user_subscriptions(user_id, refresh=False)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+async def cached_chart(chart: str, user_id: str, period: str, compute):
+    """Serves a chart from the two-tier cache, keyed on the user's data version and today's date."""
+    try:
+        data_version = get_data_version(user_id)
+    except Exception as e:
+        print(f"⚠️ Could not read data version for {user_id}, skipping chart cache: {e}")
+        return compute(user_id, period)
+    return await chart_cache.get_or_compute(chart_cache_key(chart, user_id, period, data_version), compute, user_id, period)
+
+@app.get("/api/v1/dashboard/cache-stats", dependencies=DEFAULT_RATE_LIMIT)
+async def get_cache_stats():
+    """Hit/miss counters of the chart cache in this worker."""
+    return chart_cache.get_stats()
+
+@app.get("/api/v1/dashboard/charts", dependencies=DEFAULT_RATE_LIMIT)
 async def get_dashboard_charts(user_id: str, period: str = "6months"):
     """
     Get chart data for dashboard - optimized for your React Charts component
@@ -833,216 +791,225 @@ async def get_dashboard_charts(user_id: str, period: str = "6months"):
     Returns data formatted exactly for your Charts component
     """
     try:
-        engine = get_engine()
-        with engine.connect() as conn:
-            # Map period to SQL interval
-            interval_map = {
-                "3months": "3 months",
-                "6months": "6 months", 
-                "1year": "12 months",
-                "2years": "24 months"
-            }
-            interval_value = interval_map.get(period.lower(), "6 months")
-            
-            # 1. MONTHLY SPENDING TRENDS (Bar Chart)
-            spending_data = conn.execute(
-                sqlalchemy.text("""
-                    SELECT 
-                        TO_CHAR(DATE_TRUNC('month', date), 'Mon') AS month,
-                        SUM(ABS(amount)) AS total_spending
-                    FROM Transactions 
-                    WHERE user_id = :user_id 
-                        AND type = 'expense'
-                        AND date >= CURRENT_DATE - INTERVAL :interval_val
-                    GROUP BY DATE_TRUNC('month', date), month
-                    ORDER BY DATE_TRUNC('month', date)
-                """.replace(":interval_val", f"'{interval_value}'")),
-                {"user_id": user_id}
-            ).fetchall()
-            
-            spending_labels = [row[0] for row in spending_data] if spending_data else ["Jan", "Feb", "Mar", "Apr", "May", "Jun"]
-            spending_values = [float(row[1]) for row in spending_data] if spending_data else [1200, 1900, 1500, 1700, 1600, 2100]
-            
-            # 2. MONTHLY SAVINGS TRENDS (Line Chart)
-            savings_data = conn.execute(
-                sqlalchemy.text("""
-                    SELECT 
-                        TO_CHAR(DATE_TRUNC('month', date), 'Mon') AS month,
-                        SUM(CASE WHEN type = 'income' THEN amount ELSE -ABS(amount) END) AS net_savings
-                    FROM Transactions 
-                    WHERE user_id = :user_id 
-                        AND date >= CURRENT_DATE - INTERVAL :interval_val
-                    GROUP BY DATE_TRUNC('month', date), month
-                    ORDER BY DATE_TRUNC('month', date)
-                """.replace(":interval_val", f"'{interval_value}'")),
-                {"user_id": user_id}
-            ).fetchall()
-            
-            savings_labels = [row[0] for row in savings_data] if savings_data else ["Jan", "Feb", "Mar", "Apr", "May", "Jun"]
-            savings_values = [float(row[1]) for row in savings_data] if savings_data else [500, 600, 800, 750, 900, 1100]
-            
-            # 3. INVESTMENT PORTFOLIO TRENDS (Line Chart)
-            # Get current total portfolio value, then simulate monthly growth
-            current_portfolio = conn.execute(
-                sqlalchemy.text("SELECT COALESCE(SUM(current_value), 65000) FROM Investments WHERE user_id = :user_id"),
-                {"user_id": user_id}
-            ).fetchone()[0]
-            
-            portfolio_labels = ["Jan", "Feb", "Mar", "Apr", "May", "Jun"]
-            base_value = float(current_portfolio) * 0.9  # Start 10% lower
-            portfolio_values = [
-                base_value + (i * base_value * 0.02) for i in range(6)  # 2% growth per month
-            ]
-            
-            # 4. PORTFOLIO ALLOCATION (Pie Chart)
-            allocation_data = conn.execute(
-                sqlalchemy.text("""
-                    SELECT 
-                        CASE 
-                            WHEN type = 'stock' THEN 'Stocks'
-                            WHEN type = 'mutual_fund' THEN 'Bonds'
-                            WHEN type = 'etf' THEN 'Real Estate'
-                            ELSE 'Crypto'
-                        END AS allocation_category,
-                        SUM(current_value) AS total_value
-                    FROM Investments 
-                    WHERE user_id = :user_id
-                    GROUP BY allocation_category
-                    ORDER BY total_value DESC
-                """),
-                {"user_id": user_id}
-            ).fetchall()
-            
-            allocation_labels = [row[0] for row in allocation_data] if allocation_data else ["Stocks", "Bonds", "Real Estate", "Crypto"]
-            allocation_values = [float(row[1]) for row in allocation_data] if allocation_data else [35000, 20000, 10000, 5000]
-            
-            return {
-                "spending_chart": {
-                    "labels": spending_labels,
-                    "data": spending_values
-                },
-                "savings_chart": {
-                    "labels": savings_labels,
-                    "data": savings_values
-                },
-                "investment_chart": {
-                    "labels": portfolio_labels,
-                    "data": portfolio_values
-                },
-                "allocation_chart": {
-                    "labels": allocation_labels,
-                    "data": allocation_values
-                },
-                "period": period
-            }
-            
+        return await cached_chart("dashboard", user_id, period, compute_dashboard_charts)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+def compute_dashboard_charts(user_id: str, period: str) -> dict:
+    engine = get_engine()
+    with engine.connect() as conn:
+        # Map period to SQL interval
+        interval_map = {
+            "3months": "3 months",
+            "6months": "6 months", 
+            "1year": "12 months",
+            "2years": "24 months"
+        }
+        interval_value = interval_map.get(period.lower(), "6 months")
+        
+        # 1. MONTHLY SPENDING TRENDS (Bar Chart)
+        spending_data = conn.execute(
+            sqlalchemy.text("""
+                SELECT 
+                    TO_CHAR(DATE_TRUNC('month', date), 'Mon') AS month,
+                    SUM(ABS(amount)) AS total_spending
+                FROM Transactions 
+                WHERE user_id = :user_id 
+                    AND type = 'expense'
+                    AND date >= CURRENT_DATE - INTERVAL :interval_val
+                GROUP BY DATE_TRUNC('month', date), month
+                ORDER BY DATE_TRUNC('month', date)
+            """.replace(":interval_val", f"'{interval_value}'")),
+            {"user_id": user_id}
+        ).fetchall()
+        
+        spending_labels = [row[0] for row in spending_data] if spending_data else ["Jan", "Feb", "Mar", "Apr", "May", "Jun"]
+        spending_values = [float(row[1]) for row in spending_data] if spending_data else [1200, 1900, 1500, 1700, 1600, 2100]
+        
+        # 2. MONTHLY SAVINGS TRENDS (Line Chart)
+        savings_data = conn.execute(
+            sqlalchemy.text("""
+                SELECT 
+                    TO_CHAR(DATE_TRUNC('month', date), 'Mon') AS month,
+                    SUM(CASE WHEN type = 'income' THEN amount ELSE -ABS(amount) END) AS net_savings
+                FROM Transactions 
+                WHERE user_id = :user_id 
+                    AND date >= CURRENT_DATE - INTERVAL :interval_val
+                GROUP BY DATE_TRUNC('month', date), month
+                ORDER BY DATE_TRUNC('month', date)
+            """.replace(":interval_val", f"'{interval_value}'")),
+            {"user_id": user_id}
+        ).fetchall()
+        
+        savings_labels = [row[0] for row in savings_data] if savings_data else ["Jan", "Feb", "Mar", "Apr", "May", "Jun"]
+        savings_values = [float(row[1]) for row in savings_data] if savings_data else [500, 600, 800, 750, 900, 1100]
+        
+        # 3. INVESTMENT PORTFOLIO TRENDS (Line Chart)
+        # Get current total portfolio value, then simulate monthly growth
+        current_portfolio = conn.execute(
+            sqlalchemy.text("SELECT COALESCE(SUM(current_value), 65000) FROM Investments WHERE user_id = :user_id"),
+            {"user_id": user_id}
+        ).fetchone()[0]
+        
+        portfolio_labels = ["Jan", "Feb", "Mar", "Apr", "May", "Jun"]
+        base_value = float(current_portfolio) * 0.9  # Start 10% lower
+        portfolio_values = [
+            base_value + (i * base_value * 0.02) for i in range(6)  # 2% growth per month
+        ]
+        
+        # 4. PORTFOLIO ALLOCATION (Pie Chart)
+        allocation_data = conn.execute(
+            sqlalchemy.text("""
+                SELECT 
+                    CASE 
+                        WHEN type = 'stock' THEN 'Stocks'
+                        WHEN type = 'mutual_fund' THEN 'Bonds'
+                        WHEN type = 'etf' THEN 'Real Estate'
+                        ELSE 'Crypto'
+                    END AS allocation_category,
+                    SUM(current_value) AS total_value
+                FROM Investments 
+                WHERE user_id = :user_id
+                GROUP BY allocation_category
+                ORDER BY total_value DESC
+            """),
+            {"user_id": user_id}
+        ).fetchall()
+        
+        allocation_labels = [row[0] for row in allocation_data] if allocation_data else ["Stocks", "Bonds", "Real Estate", "Crypto"]
+        allocation_values = [float(row[1]) for row in allocation_data] if allocation_data else [35000, 20000, 10000, 5000]
+        
+        return {
+            "spending_chart": {
+                "labels": spending_labels,
+                "data": spending_values
+            },
+            "savings_chart": {
+                "labels": savings_labels,
+                "data": savings_values
+            },
+            "investment_chart": {
+                "labels": portfolio_labels,
+                "data": portfolio_values
+            },
+            "allocation_chart": {
+                "labels": allocation_labels,
+                "data": allocation_values
+            },
+            "period": period
+        }
+
     
-@app.get("/api/v1/dashboard/charts/category-breakdown")
+@app.get("/api/v1/dashboard/charts/category-breakdown", dependencies=DEFAULT_RATE_LIMIT)
 async def get_category_breakdown(user_id: str, period: str = "3months"):
     """
     Get detailed expense breakdown by category for pie charts
     """
     try:
-        engine = get_engine()
-        with engine.connect() as conn:
-            interval_map = {
-                "1month": "1 month",
-                "3months": "3 months",
-                "6months": "6 months",
-                "1year": "12 months"
-            }
-            interval_value = interval_map.get(period.lower(), "3 months")
-            
-            category_data = conn.execute(
-                sqlalchemy.text("""
-                    SELECT 
-                        category,
-                        SUM(ABS(amount)) AS total_amount,
-                        COUNT(*) AS transaction_count
-                    FROM Transactions 
-                    WHERE user_id = :user_id 
-                        AND type = 'expense'
-                        AND date >= CURRENT_DATE - INTERVAL :interval_val
-                    GROUP BY category
-                    ORDER BY total_amount DESC
-                    LIMIT 10
-                """.replace(":interval_val", f"'{interval_value}'")),
-                {"user_id": user_id}
-            ).fetchall()
-            
-            if category_data:
-                return {
-                    "labels": [row[0] for row in category_data],
-                    "data": [float(row[1]) for row in category_data],
-                    "counts": [int(row[2]) for row in category_data],
-                    "period": period
-                }
-            else:
-                # Fallback data
-                return {
-                    "labels": ["Groceries", "Transport", "Utilities", "Dining", "Shopping"],
-                    "data": [3500, 2800, 1500, 1200, 2000],
-                    "counts": [15, 8, 3, 6, 4],
-                    "period": period
-                }
-            
+        return await cached_chart("category_breakdown", user_id, period, compute_category_breakdown)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/api/v1/dashboard/charts/income-vs-expense")
+def compute_category_breakdown(user_id: str, period: str) -> dict:
+    engine = get_engine()
+    with engine.connect() as conn:
+        interval_map = {
+            "1month": "1 month",
+            "3months": "3 months",
+            "6months": "6 months",
+            "1year": "12 months"
+        }
+        interval_value = interval_map.get(period.lower(), "3 months")
+        
+        category_data = conn.execute(
+            sqlalchemy.text("""
+                SELECT 
+                    category,
+                    SUM(ABS(amount)) AS total_amount,
+                    COUNT(*) AS transaction_count
+                FROM Transactions 
+                WHERE user_id = :user_id 
+                    AND type = 'expense'
+                    AND date >= CURRENT_DATE - INTERVAL :interval_val
+                GROUP BY category
+                ORDER BY total_amount DESC
+                LIMIT 10
+            """.replace(":interval_val", f"'{interval_value}'")),
+            {"user_id": user_id}
+        ).fetchall()
+        
+        if category_data:
+            return {
+                "labels": [row[0] for row in category_data],
+                "data": [float(row[1]) for row in category_data],
+                "counts": [int(row[2]) for row in category_data],
+                "period": period
+            }
+        else:
+            # Fallback data
+            return {
+                "labels": ["Groceries", "Transport", "Utilities", "Dining", "Shopping"],
+                "data": [3500, 2800, 1500, 1200, 2000],
+                "counts": [15, 8, 3, 6, 4],
+                "period": period
+            }
+
+
+@app.get("/api/v1/dashboard/charts/income-vs-expense", dependencies=DEFAULT_RATE_LIMIT)
 async def get_income_vs_expense(user_id: str, period: str = "6months"):
     """
     Get income vs expense comparison data
     """
     try:
-        engine = get_engine()
-        with engine.connect() as conn:
-            interval_map = {
-                "3months": "3 months",
-                "6months": "6 months",
-                "1year": "12 months"
-            }
-            interval_value = interval_map.get(period.lower(), "6 months")
-            
-            monthly_comparison = conn.execute(
-                sqlalchemy.text("""
-                    SELECT 
-                        TO_CHAR(DATE_TRUNC('month', date), 'Mon YYYY') AS month,
-                        SUM(CASE WHEN type = 'income' THEN amount ELSE 0 END) AS total_income,
-                        SUM(CASE WHEN type = 'expense' THEN ABS(amount) ELSE 0 END) AS total_expense
-                    FROM Transactions 
-                    WHERE user_id = :user_id 
-                        AND date >= CURRENT_DATE - INTERVAL :interval_val
-                    GROUP BY DATE_TRUNC('month', date), month
-                    ORDER BY DATE_TRUNC('month', date)
-                """.replace(":interval_val", f"'{interval_value}'")),
-                {"user_id": user_id}
-            ).fetchall()
-            
-            if monthly_comparison:
-                return {
-                    "labels": [row[0] for row in monthly_comparison],
-                    "income_data": [float(row[1]) for row in monthly_comparison],
-                    "expense_data": [float(row[2]) for row in monthly_comparison],
-                    "net_data": [float(row[1]) - float(row[2]) for row in monthly_comparison],
-                    "period": period
-                }
-            else:
-                # Fallback data
-                return {
-                    "labels": ["Jan 2025", "Feb 2025", "Mar 2025", "Apr 2025", "May 2025", "Jun 2025"],
-                    "income_data": [50000, 52000, 50000, 55000, 50000, 53000],
-                    "expense_data": [35000, 38000, 32000, 42000, 36000, 39000],
-                    "net_data": [15000, 14000, 18000, 13000, 14000, 14000],
-                    "period": period
-                }
-            
+        return await cached_chart("income_vs_expense", user_id, period, compute_income_vs_expense)
     except Exception as e:
-        raise HTTPException(status_code=500,detail=str(e))
+        raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/api/v1/dashboard/recent-transactions")
+def compute_income_vs_expense(user_id: str, period: str) -> dict:
+    engine = get_engine()
+    with engine.connect() as conn:
+        interval_map = {
+            "3months": "3 months",
+            "6months": "6 months",
+            "1year": "12 months"
+        }
+        interval_value = interval_map.get(period.lower(), "6 months")
+        
+        monthly_comparison = conn.execute(
+            sqlalchemy.text("""
+                SELECT 
+                    TO_CHAR(DATE_TRUNC('month', date), 'Mon YYYY') AS month,
+                    SUM(CASE WHEN type = 'income' THEN amount ELSE 0 END) AS total_income,
+                    SUM(CASE WHEN type = 'expense' THEN ABS(amount) ELSE 0 END) AS total_expense
+                FROM Transactions 
+                WHERE user_id = :user_id 
+                    AND date >= CURRENT_DATE - INTERVAL :interval_val
+                GROUP BY DATE_TRUNC('month', date), month
+                ORDER BY DATE_TRUNC('month', date)
+            """.replace(":interval_val", f"'{interval_value}'")),
+            {"user_id": user_id}
+        ).fetchall()
+        
+        if monthly_comparison:
+            return {
+                "labels": [row[0] for row in monthly_comparison],
+                "income_data": [float(row[1]) for row in monthly_comparison],
+                "expense_data": [float(row[2]) for row in monthly_comparison],
+                "net_data": [float(row[1]) - float(row[2]) for row in monthly_comparison],
+                "period": period
+            }
+        else:
+            # Fallback data
+            return {
+                "labels": ["Jan 2025", "Feb 2025", "Mar 2025", "Apr 2025", "May 2025", "Jun 2025"],
+                "income_data": [50000, 52000, 50000, 55000, 50000, 53000],
+                "expense_data": [35000, 38000, 32000, 42000, 36000, 39000],
+                "net_data": [15000, 14000, 18000, 13000, 14000, 14000],
+                "period": period
+            }
+
+
+@app.get("/api/v1/dashboard/recent-transactions", dependencies=DEFAULT_RATE_LIMIT)
 async def get_recent_transactions(user_id: str = "user_001"):
     """Get recent 5 transactions for dashboard"""
     try:
@@ -1072,7 +1039,7 @@ async def get_recent_transactions(user_id: str = "user_001"):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/api/v1/ai/templates")
+@app.get("/api/v1/ai/templates", dependencies=DEFAULT_RATE_LIMIT)
 async def get_ai_templates():
     """Get AI Studio templates"""
     return [
@@ -1084,7 +1051,22 @@ async def get_ai_templates():
         {"id": "retirement-planning", "title": "Retirement Planning", "category": "retirement", "icon": "elderly", "description": "Plan for your retirement"},
     ]
 
-@app.post("/api/v1/users/create")
+@app.get("/api/v1/ai/templates/{template_id}/insight", dependencies=DEFAULT_RATE_LIMIT)
+async def get_template_insight(template_id: str, user_id: str, allow_stale: bool = True):
+    """The template's answer precomputed for this user by the insight pipeline."""
+    try:
+        engine = get_engine()
+    except Exception:
+        raise HTTPException(status_code=503, detail="Database not connected")
+    with engine.connect() as conn:
+        version = get_data_version(user_id)
+        insight = get_insights(conn, user_id).get(template_id)
+    fresh = insight is not None and insight["data_version"] == version
+    if insight is None or (not fresh and not allow_stale):
+        raise HTTPException(status_code=404, detail="No precomputed insight yet; run the template through /ai/chat")
+    return {**insight, "fresh": fresh, "current_data_version": version}
+
+@app.post("/api/v1/users/create", dependencies=DEFAULT_RATE_LIMIT)
 async def create_user(user_data: dict):
     """Create new user account (called when user signs up)"""
     try:
@@ -1126,6 +1108,7 @@ async def create_user(user_data: dict):
                 "perm_credit_score": user_data.get("perm_credit_score", True),
                 "perm_epf_balance": user_data.get("perm_epf_balance", True)
             })
+            bump_data_version(conn, user_data["user_id"], "users")
             conn.commit()
             
             return {
@@ -1136,52 +1119,35 @@ async def create_user(user_data: dict):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
-@app.delete("/api/v1/users/delete-account")
+@app.delete("/api/v1/users/delete-account", dependencies=DEFAULT_RATE_LIMIT, status_code=202)
 async def delete_user_account(user_id: str):
-    """Delete user account and all associated data"""
+    """Delete user account: hidden immediately, its data purged in the background"""
     try:
         engine = get_engine()
         with engine.connect() as conn:
-            # Check if user exists
-            user_check = conn.execute(
-                sqlalchemy.text("SELECT user_id FROM Users WHERE user_id = :user_id"),
-                {"user_id": user_id}
-            ).fetchone()
-            
-            if not user_check:
+            # Marks the user deleted and queues the batched purge (see services/account_purge.py)
+            if not request_account_deletion(conn, user_id):
                 raise HTTPException(status_code=404, detail="User not found")
-            
-            # Delete all user data (foreign keys will cascade)
-            tables = ["Transactions", "Assets", "Liabilities", "Investments"]
-            for table in tables:
-                conn.execute(
-                    sqlalchemy.text(f"DELETE FROM {table} WHERE user_id = :user_id"),
-                    {"user_id": user_id}
-                )
-            
-            # Delete user
-            conn.execute(
-                sqlalchemy.text("DELETE FROM Users WHERE user_id = :user_id"),
-                {"user_id": user_id}
-            )
             conn.commit()
             
             return {
-                "message": "User account deleted successfully",
-                "status": "success"
+                "message": "User account scheduled for deletion",
+                "status": "accepted"
             }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
 
-@app.get("/api/v1/users/profile-summary")
+@app.get("/api/v1/users/profile-summary", dependencies=DEFAULT_RATE_LIMIT)
 async def get_profile_summary(user_id: str):
     """Get quick profile summary for header/navigation"""
     try:
         engine = get_engine()
         with engine.connect() as conn:
             result = conn.execute(
-                sqlalchemy.text("SELECT name, credit_score FROM Users WHERE user_id = :user_id"),
+                sqlalchemy.text("SELECT name, credit_score FROM Users WHERE user_id = :user_id AND deleted_at IS NULL"),
                 {"user_id": user_id}
             ).fetchone()
             
@@ -1201,7 +1167,7 @@ async def get_profile_summary(user_id: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
-@app.get("/api/v1/users/stats")
+@app.get("/api/v1/users/stats", dependencies=DEFAULT_RATE_LIMIT)
 async def get_user_stats(user_id: str):
     """Get user statistics (total records, etc.)"""
     try:
@@ -1238,8 +1204,28 @@ async def get_user_stats(user_id: str):
     except Exception as e:
         raise HTTPException(status_code=500,detail=str(e))
 
+def run_chain_turn(user_id: str, question: str, remember: bool = True, permissions: dict | None = None) -> dict:
+    """One permission-aware answer from the sequential chain. Blocking. The chain keeps no history, so `remember` is unused."""
+    permissions = permissions if permissions is not None else get_user_permissions(user_id)
+    input_data = {
+        "question": question,
+        "user_id": user_id,
+        "permission_instructions": format_permission_instructions(permissions)
+    }
+    turn = start_turn(user_id, question)
+    try:
+        final_answer = full_chain.invoke(input_data)
+    finally:
+        current_turn.reset(turn)
+    return {
+        "user_id": user_id,
+        "question": question,
+        "answer": final_answer,
+        "permissions_enforced": permissions
+    }
+
 # --- REFACTORED AI Chat Endpoint ---
-@app.post("/api/v1/ai/chat")
+@app.post("/api/v1/ai/chat", dependencies=AI_CHAT_RATE_LIMIT)
 async def privacy_enforced_ai_chat(request: QueryRequest):
     """Privacy-enforced AI chat - respects user permission settings"""
     if not full_chain:
@@ -1250,25 +1236,11 @@ async def privacy_enforced_ai_chat(request: QueryRequest):
         
         # 1. Get user permissions
         permissions = get_user_permissions(request.user_id)
-        permission_instructions = format_permission_instructions(permissions)
         
         print(f"🔍 User {request.user_id} permissions: {permissions}")
         
         # 2. Execute AI chain with privacy context
-        input_data = {
-            "question": request.question,
-            "user_id": request.user_id,
-            "permission_instructions": permission_instructions
-        }
-        
-        final_answer = full_chain.invoke(input_data)
-        
-        return {
-            "user_id": request.user_id,
-            "question": request.question,
-            "answer": final_answer,
-            "permissions_enforced": permissions
-        }
+        return run_chain_turn(request.user_id, request.question, permissions=permissions)
         
     except Exception as e:
         print(f"❌ Error in privacy-enforced AI chat: {e}")
@@ -1285,14 +1257,11 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(CompressionMiddleware)
 
+# Admin-only: a request carrying the profiling token runs under a profiler (see services/profiling.py).
+app.add_middleware(ProfilingMiddleware)
+app.include_router(admin.router, prefix="/api/v1", dependencies=DEFAULT_RATE_LIMIT)
 
-# Re-initialize with privacy controls at the bottom of agent.py
-try:
-    init_agent()
-    print("✅ Privacy-Aware AI Agent initialized successfully!")
-except Exception as e:
-    print(f"🔥 Critical error during AI Agent initialization: {e}")
-    import traceback
-    print(f"🔍 Full traceback: {traceback.format_exc()}")
-    full_chain = None
\ No newline at end of file
+# Dashboard WebSocket (/api/v1/dashboard/live): deltas of every write, from any worker
+app.include_router(live_router, prefix="/api/v1")
\ No newline at end of file
@@ -0,0 +1,78 @@
+# /api/v1/endpoints/admin.py
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query # type: ignore
+from fastapi.responses import PlainTextResponse
+from typing import Optional
+from config.database import engine
+from services.profiling import PROFILING_ADMIN_TOKEN, is_admin, list_profiles, get_profile, stack_sampler
+from services.agent_sql_log import agent_query_log, slow_query_report, recent_statements
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    if not PROFILING_ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Profiling is disabled (PROFILING_ADMIN_TOKEN is not set)")
+    if not is_admin(x_admin_token):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+router = APIRouter(prefix="/admin", dependencies=[Depends(require_admin)])
+
+@router.get("/profiles")
+async def get_request_profiles(limit: int = Query(50, ge=1, le=200), path: Optional[str] = None):
+    """Stored request profiles, newest first, without their reports."""
+    if not engine:
+        raise HTTPException(status_code=503, detail="Database not connected")
+    with engine.connect() as conn:
+        return list_profiles(conn, limit, path)
+
+@router.get("/profiles/{profile_id}")
+async def get_request_profile(profile_id: str, format: str = "json"):
+    """One profile: the profiler report with the request's SQL statement and LLM call timings. format=text returns just the report."""
+    if not engine:
+        raise HTTPException(status_code=503, detail="Database not connected")
+    with engine.connect() as conn:
+        profile = get_profile(conn, profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    if format == "text":
+        return PlainTextResponse(profile["report"])
+    return profile
+
+@router.get("/profiling/sampler")
+async def get_sampler_status():
+    """Continuous sampling rate on this worker and the samples collected per route."""
+    return stack_sampler.status()
+
+@router.post("/profiling/sampler")
+async def set_sampler_rate(hz: float = Query(..., ge=0, le=100), reset: bool = False):
+    """Starts continuous sampling at `hz` on this worker (0 stops it); reset clears what was collected."""
+    stack_sampler.start(hz) if hz else stack_sampler.stop()
+    if reset:
+        stack_sampler.reset()
+    return stack_sampler.status()
+
+@router.get("/profiling/flamegraph", response_class=PlainTextResponse)
+async def get_route_flamegraph(route: str):
+    """Folded stacks sampled for a route ("GET /api/v1/dashboard"), for flamegraph.pl or speedscope."""
+    if route not in stack_sampler.samples:
+        raise HTTPException(status_code=404, detail="No samples for this route; see /admin/profiling/sampler")
+    return stack_sampler.folded(route)
+
+@router.get("/agent-sql/report")
+async def get_agent_sql_report(
+    days: int = Query(7, ge=1, le=90),
+    order: str = Query("total", pattern="^(total|p95|count)$"),
+    limit: int = Query(20, ge=1, le=200)
+):
+    """Statement shapes the SQL agent generated, ranked by total time, p95 or count, with fast-path template candidates marked."""
+    if not engine:
+        raise HTTPException(status_code=503, detail="Database not connected")
+    with engine.connect() as conn:
+        fingerprints = slow_query_report(conn, days, order, limit)
+    return {"days": days, "order": order, "log": agent_query_log.status(), "fingerprints": fingerprints}
+
+@router.get("/agent-sql/recent")
+async def get_recent_agent_sql(limit: int = Query(50, ge=1, le=500), user_id: Optional[str] = None):
+    """The latest statements the SQL agent ran, with their timing, row count, attempt and question."""
+    if not engine:
+        raise HTTPException(status_code=503, detail="Database not connected")
+    with engine.connect() as conn:
+        return recent_statements(conn, limit, user_id)
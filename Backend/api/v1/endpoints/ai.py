@@ -1,77 +1,52 @@
 # /api/v1/endpoints/ai.py
 
-from fastapi import APIRouter, HTTPException, Request
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+import asyncio
 import traceback
 from models.schemas import QueryRequest
-from services.permissions import get_user_permissions, format_permission_instructions
-from services.ai_agent import init_agent
-from config.rate_limiter import limiter
+from services.agent_registry import agent_registry
+from services.ai_jobs import ai_job_manager, JobQueueFullError
+from services.llm_scheduler import llm_scheduler, SchedulerFullError
+from services.template_insights import TEMPLATES, TEMPLATES_BY_ID, get_insights, insight_pipeline
+from services.data_version import get_data_version
+from config.database import engine
+from config.rate_limiter import rate_limit
 
 router = APIRouter()
 
-@router.post("/ai/chat")
-@limiter.limit("4/minute")
+@router.post("/ai/chat", dependencies=[Depends(rate_limit("ai_chat"))])
 async def conversational_ai_chat(query: QueryRequest, request: Request):
     """Conversational AI chat that remembers conversation history and enforces permissions."""
     
-    agent_executor = request.app.state.agent_executor
-    get_session_history = request.app.state.get_session_history
-    
-    if not agent_executor or not get_session_history:
+    if agent_registry.current is None:
         raise HTTPException(status_code=503, detail="AI Agent is not initialized. Check server logs.")
     
+    if query.async_mode:
+        try:
+            job = ai_job_manager.submit(query.user_id, query.question)
+        except JobQueueFullError as e:
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+        print(f"📨 [AI CHAT] Queued job {job.job_id} for user {query.user_id}")
+        return JSONResponse(status_code=202, content={
+            "job_id": job.job_id,
+            "status": job.status,
+            "status_url": f"/api/v1/ai/jobs/{job.job_id}?user_id={query.user_id}",
+            "events_url": f"/api/v1/ai/jobs/{job.job_id}/events?user_id={query.user_id}"
+        })
+
     try:
         print(f"🔍 [AI CHAT] Processing request for user: {query.user_id}")
-        chat_history = get_session_history(query.user_id)
-        permissions = get_user_permissions(query.user_id)
-        permission_instructions = format_permission_instructions(permissions)
-        
-        print(f"📝 [AI CHAT] User Question: {query.question}")
-        print(f"🛡️ [AI CHAT] Permissions enforced: {permissions}")
-
-        combined_input = f"""
-        IMPORTANT CONTEXT: You are answering for user_id: {query.user_id}
-        When querying the database, ALWAYS filter by WHERE user_id = '{query.user_id}' for tables: assets, investments, liabilities, transactions.
-        
-        {permission_instructions}
-
-        User Question: {query.question}
-        """
-        
-        agent_input = {
-            "input": combined_input,
-            "chat_history": chat_history.messages,
-            "user_id": query.user_id,  # Pass user_id as context
-        }
-        
-        print(f"⚙️ [AI CHAT] Calling LangChain Agent Executor...")
-        response = agent_executor.invoke(agent_input)
-        final_answer = response.get("output")
-        print(f"✨ [AI CHAT] Agent execution complete. Raw output type: {type(final_answer)}")
-        
-        # Handle cases where final_answer might be a list (common with some Gemini/LangChain versions)
-        if isinstance(final_answer, list):
-            extracted_text = []
-            for item in final_answer:
-                if isinstance(item, dict) and 'text' in item:
-                    extracted_text.append(item['text'])
-                elif isinstance(item, str):
-                    extracted_text.append(item)
-            final_answer = "\n".join(extracted_text)
-        elif not isinstance(final_answer, str):
-            # Fallback for any other non-string types
-            final_answer = str(final_answer) if final_answer is not None else "I'm sorry, I couldn't generate a response."
-        
-        chat_history.add_user_message(query.question)
-        chat_history.add_ai_message(final_answer)
-        
+        result = await llm_scheduler.submit(query.user_id, agent_registry.run_chat_turn, query.user_id, query.question)
         print(f"✅ [AI CHAT] Successfully returning response to user {query.user_id}")
-        return {
-            "user_id": query.user_id,
-            "question": query.question,
-            "answer": final_answer,
-            "permissions_enforced": permissions
-        }
+        return result
+    except SchedulerFullError as e:
+        print(f"🚦 [AI CHAT] Queue full, rejecting request for user {query.user_id}")
+        raise HTTPException(
+            status_code=503,
+            detail="The AI assistant is busy right now. Please try again shortly.",
+            headers={"Retry-After": str(e.retry_after)}
+        )
     except Exception as e:
         error_str = str(e)
         print(f"❌ [AI CHAT] ERROR: {e}")
@@ -80,28 +55,110 @@ async def conversational_ai_chat(query: QueryRequest, request: Request):
         if "429" in error_str or "RESOURCE_EXHAUSTED" in error_str:
             raise HTTPException(
                 status_code=429, 
-                detail="The AI service (Groq) is currently at its quota limit. Please try again soon."
+                detail="All configured AI providers are currently at their quota limit. Please try again soon."
             )
             
         raise HTTPException(status_code=500, detail=f"An internal error occurred: {e}")
 
-@router.post("/reload-agent")
-def reload_agent(http_request: Request):
-    """Reload the AI Agent manually without restarting the server."""
+@router.post("/reload-agent", dependencies=[Depends(rate_limit("reload_agent"))])
+async def reload_agent(wait: bool = False):
+    """
+    Rebuild the AI Agent on every worker without dropping requests. The new agent is built and
+    warmed up in the background and swapped in once ready; pass wait=true to block until then.
+    """
     try:
-        agent_executor, session_manager = init_agent()
-        http_request.app.state.agent_executor = agent_executor
-        http_request.app.state.get_session_history = session_manager
-        return {"status": "✅ Agent reloaded successfully."}
+        version = await asyncio.to_thread(agent_registry.request_reload)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"❌ Failed to reload agent: {e}")
+        raise HTTPException(status_code=503, detail=f"❌ Could not record the reload request: {e}")
+    agent_registry.reload(version)
+    if wait and not await agent_registry.wait_for_build():
+        raise HTTPException(status_code=500, detail=f"❌ Failed to reload agent: {agent_registry.last_error}")
+    return JSONResponse(status_code=200 if wait else 202, content={
+        "status": "✅ Agent reloaded successfully." if wait else "reloading",
+        "version": version,
+        "status_url": "/api/v1/ai/agent/status"
+    })
+
+@router.get("/ai/agent/status")
+async def get_agent_status():
+    """The agent bundle serving chats on this worker, any build in progress and bundles still draining."""
+    return agent_registry.stats()
+
+def get_user_job(job_id: str, user_id: str):
+    job = ai_job_manager.get(job_id)
+    if not job or job.user_id != user_id:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return job
+
+@router.get("/ai/jobs/{job_id}")
+async def get_ai_job(job_id: str, user_id: str):
+    """Poll the status (and, once finished, the result) of an asynchronous chat job."""
+    return get_user_job(job_id, user_id).to_dict()
+
+@router.get("/ai/jobs/{job_id}/events")
+async def stream_ai_job_events(job_id: str, user_id: str):
+    """Server-Sent Events stream of a job's status changes, ending when the job finishes."""
+    job = get_user_job(job_id, user_id)
+    return StreamingResponse(
+        ai_job_manager.event_stream(job),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.delete("/ai/jobs/{job_id}")
+async def cancel_ai_job(job_id: str, user_id: str):
+    """Cancel a queued or running chat job."""
+    job = get_user_job(job_id, user_id)
+    if not ai_job_manager.cancel(job):
+        raise HTTPException(status_code=409, detail=f"Job already {job.status}")
+    return {"job_id": job.job_id, "status": job.status if job.status == "cancelled" else "cancelling"}
+
+@router.get("/ai/scheduler/stats")
+async def get_scheduler_stats():
+    """Queue depth, in-flight count and queue-time metrics of the LLM scheduler."""
+    return llm_scheduler.stats()
+
+@router.get("/ai/providers/stats")
+async def get_llm_provider_stats():
+    """Per-provider call counts, latency/error EWMAs and p95 latency seen by the LLM router."""
+    from services.llm_router import get_provider_stats
+    return get_provider_stats()
 
 @router.get("/ai/templates")
-async def get_ai_templates():
-    """Get AI Studio templates."""
-    return [
-        {"id": "investment-review", "title": "Investment Portfolio Review", "category": "investment", "icon": "show_chart", "description": "Get personalized advice on your investment mix"},
-        {"id": "budget-optimizer", "title": "Monthly Budget Optimizer", "category": "budgeting", "icon": "pie_chart", "description": "Optimize your monthly spending"},
-        {"id": "spending-analysis", "title": "Spending Pattern Analysis", "category": "budgeting", "icon": "analytics", "description": "Analyze your spending habits"},
-        {"id": "debt-payoff", "title": "Debt Payoff Strategy", "category": "loans", "icon": "payments", "description": "Create a debt elimination plan"},
-    ]
\ No newline at end of file
+async def get_ai_templates(user_id: str | None = None):
+    """Get AI Studio templates. With user_id, each says whether a precomputed insight is ready."""
+    templates = [{k: v for k, v in t.items() if k != "prompt"} for t in TEMPLATES]
+    if user_id and engine:
+        try:
+            with engine.connect() as conn:
+                version = get_data_version(user_id)
+                insights = get_insights(conn, user_id)
+            for template in templates:
+                insight = insights.get(template["id"])
+                template["insight"] = None if insight is None else ("fresh" if insight["data_version"] == version else "stale")
+        except Exception as e:
+            print(f"⚠️ [INSIGHTS] Could not read insights for {user_id}: {e}")
+    return templates
+
+@router.get("/ai/templates/{template_id}/insight")
+async def get_template_insight(template_id: str, user_id: str, allow_stale: bool = True):
+    """
+    The template's answer precomputed for this user, served without an agent run. `fresh` is false
+    when the user's data changed since it was computed; with allow_stale=false that answers 404.
+    """
+    if template_id not in TEMPLATES_BY_ID:
+        raise HTTPException(status_code=404, detail="Template not found")
+    if not engine:
+        raise HTTPException(status_code=503, detail="Database not connected")
+    with engine.connect() as conn:
+        version = get_data_version(user_id)
+        insight = get_insights(conn, user_id).get(template_id)
+    fresh = insight is not None and insight["data_version"] == version
+    if insight is None or (not fresh and not allow_stale):
+        raise HTTPException(status_code=404, detail="No precomputed insight yet; run the template through /ai/chat")
+    return {**insight, "title": TEMPLATES_BY_ID[template_id]["title"], "fresh": fresh, "current_data_version": version}
+
+@router.get("/ai/insights/stats")
+async def get_insight_pipeline_stats():
+    """Off-peak window, progress and failures of the template insight pipeline on this worker."""
+    return insight_pipeline.status()
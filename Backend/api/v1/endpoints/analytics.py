@@ -0,0 +1,33 @@
+# /api/v1/endpoints/analytics.py
+
+from fastapi import APIRouter, HTTPException, Query # type: ignore
+from typing import Optional
+from config.database import engine
+from services.executors import work_executor, ExecutorBusyError, TaskTimeoutError
+from services.forecasting import forecast_net_worth
+
+router = APIRouter()
+
+@router.get("/analytics/forecast")
+async def get_net_worth_forecast(
+    user_id: str,
+    months: int = Query(12, ge=1, le=60),
+    simulations: int = Query(2000, ge=100, le=20000),
+    seed: Optional[int] = None
+):
+    """Monte Carlo net worth projection (p10/p50/p90 per month) from the user's daily cash flow."""
+    if not engine:
+        raise HTTPException(status_code=503, detail="Database connection is not available.")
+    try:
+        return await forecast_net_worth(engine, user_id, months, simulations, seed)
+    except ExecutorBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except TaskTimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/analytics/executor/stats")
+async def get_executor_stats():
+    """Pending tasks, queue wait and run times of the CPU (process) and I/O (thread) pools of this worker."""
+    return work_executor.status()
@@ -0,0 +1,101 @@
+# /api/v1/endpoints/categories.py
+
+import os
+from fastapi import APIRouter, HTTPException, Response # type: ignore
+import sqlalchemy # type: ignore
+from config.database import engine
+from config.replicas import set_consistency_token
+from services.data_version import bump_data_version
+from services.categorizer import categorize_offloaded, load_user_rules
+from services.executors import work_executor, ExecutorBusyError, TaskTimeoutError
+from api.v1.endpoints.data_entry import check_db_engine, lock_active_user
+
+router = APIRouter()
+
+# Largest batch accepted by /categorize
+CATEGORIZE_MAX_BATCH = int(os.environ.get("CATEGORIZE_MAX_BATCH", "100000"))
+
+@router.post("/categorize")
+async def categorize_transactions(request: dict):
+    """Suggest categories for a batch of transactions without saving anything"""
+    transactions = request.get("transactions")
+    if not isinstance(transactions, list) or not transactions:
+        raise HTTPException(status_code=400, detail="A non-empty transactions list is required")
+    if len(transactions) > CATEGORIZE_MAX_BATCH:
+        raise HTTPException(status_code=413, detail=f"At most {CATEGORIZE_MAX_BATCH} transactions per batch")
+    if not all(isinstance(t, dict) for t in transactions):
+        raise HTTPException(status_code=400, detail="Each transaction must be an object")
+    user_id = request.get("user_id")
+    if user_id:
+        check_db_engine()
+
+    def load_rules():
+        with engine.connect() as conn:
+            return load_user_rules(conn, user_id)
+
+    # Up to CATEGORIZE_MAX_BATCH descriptions to normalize and match: CPU-bound, so run in a worker process.
+    try:
+        user_rules = await work_executor.run_io(load_rules) if user_id else ()
+        return {"categories": await categorize_offloaded(transactions, user_rules)}
+    except ExecutorBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except TaskTimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+
+@router.get("/categorize/rules")
+async def get_category_rules(user_id: str):
+    """Get the user's own keyword rules"""
+    check_db_engine()
+    with engine.connect() as conn:
+        rules = load_user_rules(conn, user_id)
+    return {"rules": [{"pattern": pattern, "category": category} for pattern, category in rules]}
+
+@router.post("/categorize/rules")
+async def add_category_rule(request: dict, response: Response):
+    """Add or replace a keyword rule; it takes precedence over the built-in ones. A trailing * matches word prefixes"""
+    check_db_engine()
+    user_id = request.get("user_id")
+    pattern = (request.get("pattern") or "").strip().lower()
+    category = (request.get("category") or "").strip()
+    if not user_id or not pattern.rstrip("*").strip() or not category:
+        raise HTTPException(status_code=400, detail="user_id, pattern and category are required")
+    try:
+        with engine.connect() as conn:
+            if not lock_active_user(conn, user_id):
+                raise HTTPException(status_code=404, detail="User not found")
+            conn.execute(
+                sqlalchemy.text("""
+                    INSERT INTO category_rules (user_id, pattern, category) VALUES (:user_id, :pattern, :category)
+                    ON CONFLICT (user_id, pattern) DO UPDATE SET category = EXCLUDED.category
+                """),
+                {"user_id": user_id, "pattern": pattern, "category": category}
+            )
+            bump_data_version(conn, user_id, "category_rules")
+            conn.commit()
+            set_consistency_token(response, conn)
+            return {"message": "Rule saved successfully", "status": "success"}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.delete("/categorize/rules")
+async def delete_category_rule(user_id: str, pattern: str, response: Response):
+    """Remove one of the user's keyword rules"""
+    check_db_engine()
+    try:
+        with engine.connect() as conn:
+            deleted = conn.execute(
+                sqlalchemy.text("DELETE FROM category_rules WHERE user_id = :user_id AND pattern = :pattern"),
+                {"user_id": user_id, "pattern": pattern.strip().lower()}
+            ).rowcount
+            if not deleted:
+                raise HTTPException(status_code=404, detail="Rule not found")
+            bump_data_version(conn, user_id, "category_rules")
+            conn.commit()
+            set_consistency_token(response, conn)
+            return {"message": "Rule deleted successfully", "status": "success"}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
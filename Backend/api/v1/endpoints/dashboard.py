@@ -1,24 +1,87 @@
 # /api/v1/endpoints/dashboard.py
 
-from fastapi import APIRouter, HTTPException, Query # type: ignore
+from fastapi import APIRouter, Depends, HTTPException, Query, Request # type: ignore
 from typing import Optional
+import datetime
 import sqlalchemy # type: ignore
-from config.database import engine
+from config.replicas import read_engine
+from services.data_version import etag_cached, etag_stats, get_data_version, read_connection
+from services.cache import chart_cache, chart_cache_key
+from services.partitions import period_start
+from services.transaction_search import build_filters, search_transactions
+from services.subscriptions import get_user_subscriptions
+from services.anomalies import get_anomalies
+from services.dashboard_overview import parse_fields, get_overview
+from models.schemas import DashboardSummary, RecentTransaction, TransactionsPage, TransactionSearchPage, DashboardCharts, Subscription, TransactionAnomaly
 
 router = APIRouter()
 
+# Dashboard chart periods, in months
+PERIOD_MONTHS = {"3months": 3, "6months": 6, "1year": 12, "2years": 24}
+
+SPENDING_TREND_SQL = sqlalchemy.text("""
+    SELECT 
+        TO_CHAR(DATE_TRUNC('month', date), 'Mon') AS month,
+        SUM(ABS(amount)) AS total_spending
+    FROM Transactions 
+    WHERE user_id = :user_id 
+        AND type = 'expense'
+        AND date >= :since
+    GROUP BY DATE_TRUNC('month', date), month
+    ORDER BY DATE_TRUNC('month', date)
+""")
+
+SAVINGS_TREND_SQL = sqlalchemy.text("""
+    SELECT 
+        TO_CHAR(DATE_TRUNC('month', date), 'Mon') AS month,
+        SUM(CASE WHEN type = 'income' THEN amount ELSE -ABS(amount) END) AS net_savings
+    FROM Transactions 
+    WHERE user_id = :user_id 
+        AND date >= :since
+    GROUP BY DATE_TRUNC('month', date), month
+    ORDER BY DATE_TRUNC('month', date)
+""")
+
 def check_db_engine():
-    if not engine:
+    if not read_engine:
         raise HTTPException(status_code=503, detail="Database connection is not available.")
 
-# In api/v1/endpoints/dashboard.py
+@router.get("/dashboard/etag-stats")
+async def get_etag_stats():
+    """How many conditional GETs were answered with 304, and the bytes and queries that saved."""
+    return etag_stats
+
+@router.get("/dashboard/cache-stats")
+async def get_cache_stats():
+    """Hit/miss counters of the chart cache in this worker."""
+    return chart_cache.get_stats()
 
-@router.get("/dashboard/summary")
-async def get_dashboard_summary(user_id: str):
+@router.get("/dashboard", dependencies=[Depends(etag_cached(queries=1))])
+async def get_dashboard_overview(user_id: str, request: Request, fields: Optional[str] = None):
+    """
+    Dashboard sections in one query. `fields` picks them (comma-separated: summary, recent, monthly,
+    categories, investments, assets, liabilities, stats); omitted, all are returned.
+    """
+    check_db_engine()
+    try:
+        selected = parse_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        with read_connection(user_id, getattr(request.state, "data_version", None)) as conn:
+            overview = get_overview(conn, user_id, selected)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if overview is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return overview
+
+@router.get("/dashboard/summary", response_model=DashboardSummary, dependencies=[Depends(etag_cached(queries=4))])
+async def get_dashboard_summary(user_id: str, request: Request):
     """Get financial summary for dashboard"""
     check_db_engine()
     try:
-        with engine.connect() as conn:
+        with read_connection(user_id, getattr(request.state, "data_version", None)) as conn:
             user_res = conn.execute(sqlalchemy.text("SELECT credit_score, epf_balance FROM Users WHERE user_id = :user_id"), {"user_id": user_id}).fetchone()
             assets = conn.execute(sqlalchemy.text("SELECT COALESCE(SUM(value), 0) FROM Assets WHERE user_id = :user_id"), {"user_id": user_id}).scalar_one()
             liabilities = conn.execute(sqlalchemy.text("SELECT COALESCE(SUM(outstanding_balance), 0) FROM Liabilities WHERE user_id = :user_id"), {"user_id": user_id}).scalar_one()
@@ -38,12 +101,12 @@ async def get_dashboard_summary(user_id: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.get("/dashboard/recent-transactions")
-async def get_recent_transactions(user_id: str):
+@router.get("/dashboard/recent-transactions", response_model=list[RecentTransaction], dependencies=[Depends(etag_cached(queries=1))])
+async def get_recent_transactions(user_id: str, request: Request):
     """Get recent 5 transactions for dashboard"""
     check_db_engine()
     try:
-        with engine.connect() as conn:
+        with read_connection(user_id, getattr(request.state, "data_version", None)) as conn:
             result = conn.execute(
                 sqlalchemy.text("""
                     SELECT date, description, category, amount 
@@ -68,17 +131,19 @@ async def get_recent_transactions(user_id: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.get("/transactions/all")
-async def get_all_transactions(user_id: str, page: int = Query(1, ge=1), limit: int = Query(10, ge=1, le=100)):
-    """Get all transactions with pagination"""
+@router.get("/transactions/all", response_model=TransactionsPage, dependencies=[Depends(etag_cached(queries=2))])
+async def get_all_transactions(user_id: str, request: Request, page: int = Query(1, ge=1), limit: int = Query(10, ge=1, le=100),
+                               search: Optional[str] = None, category: Optional[str] = None):
+    """Get all transactions with pagination, optionally filtered by a search term and category"""
     check_db_engine()
     try:
-        with engine.connect() as conn:
+        with read_connection(user_id, getattr(request.state, "data_version", None)) as conn:
             offset = (page - 1) * limit
-            query = sqlalchemy.text("SELECT date, description, category, amount, type FROM transactions WHERE user_id = :user_id ORDER BY date DESC LIMIT :limit OFFSET :offset")
-            result = conn.execute(query, {"user_id": user_id, "limit": limit, "offset": offset}).fetchall()
+            where, params = build_filters(user_id, search=search, category=category)
+            query = sqlalchemy.text(f"SELECT date, description, category, amount, type FROM transactions WHERE {where} ORDER BY date DESC LIMIT :limit OFFSET :offset")
+            result = conn.execute(query, {**params, "limit": limit, "offset": offset}).fetchall()
             
-            total_count = conn.execute(sqlalchemy.text("SELECT COUNT(*) FROM transactions WHERE user_id = :user_id"), {"user_id": user_id}).scalar_one()
+            total_count = conn.execute(sqlalchemy.text(f"SELECT COUNT(*) FROM transactions WHERE {where}"), params).scalar_one()
             
             transactions = [{"date": str(row[0]), "description": row[1], "category": row[2], "amount": float(row[3]), "type": row[4]} for row in result]
             
@@ -86,108 +151,132 @@ async def get_all_transactions(user_id: str, page: int = Query(1, ge=1), limit:
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.get("/dashboard/charts")
-async def get_dashboard_charts(user_id: str, period: str = "6months"):
+@router.get("/transactions/search", response_model=TransactionSearchPage, dependencies=[Depends(etag_cached(queries=1))])
+async def search_user_transactions(
+    user_id: str,
+    request: Request,
+    q: Optional[str] = Query(None, max_length=200),
+    category: Optional[str] = None,
+    min_amount: Optional[float] = None,
+    max_amount: Optional[float] = None,
+    date_from: Optional[datetime.date] = None,
+    date_to: Optional[datetime.date] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100)
+):
+    """
+    Search transactions by description/category (full-text, fuzzy and substring) with amount and
+    date filters. Newest first; pass `nextCursor` back as `cursor` for the next page.
+    """
+    check_db_engine()
+    try:
+        with read_connection(user_id, getattr(request.state, "data_version", None)) as conn:
+            return search_transactions(
+                conn, user_id, limit=limit, cursor=cursor, search=q, category=category,
+                min_amount=min_amount, max_amount=max_amount, date_from=date_from, date_to=date_to
+            )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/transactions/anomalies", response_model=list[TransactionAnomaly], dependencies=[Depends(etag_cached(queries=1))])
+async def get_transaction_anomalies(user_id: str, request: Request, limit: int = Query(20, ge=1, le=100)):
+    """Transactions flagged as unusual for their category when they were written, newest first"""
+    check_db_engine()
+    try:
+        with read_connection(user_id, getattr(request.state, "data_version", None)) as conn:
+            return get_anomalies(conn, user_id, limit)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/subscriptions", response_model=list[Subscription], dependencies=[Depends(etag_cached(queries=1))])
+async def get_subscriptions(user_id: str):
+    """Recurring payments and incomes detected in the user's transactions, with their next expected dates"""
+    check_db_engine()
+    try:
+        return get_user_subscriptions(user_id, refresh=False)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/dashboard/charts", response_model=DashboardCharts, dependencies=[Depends(etag_cached(queries=4))])
+async def get_dashboard_charts(user_id: str, request: Request, period: str = "6months"):
     """
     Get chart data for dashboard - optimized for your React Charts component
     """
     check_db_engine()
     try:
-        with engine.connect() as conn:
-            # Map period to SQL interval
-            interval_map = {
-                "3months": "3 months",
-                "6months": "6 months", 
-                "1year": "12 months",
-                "2years": "24 months"
-            }
-            interval_value = interval_map.get(period.lower(), "6 months")
-            
-            # 1. MONTHLY SPENDING TRENDS (Bar Chart)
-            spending_data = conn.execute(
-                sqlalchemy.text(f"""
-                    SELECT 
-                        TO_CHAR(DATE_TRUNC('month', date), 'Mon') AS month,
-                        SUM(ABS(amount)) AS total_spending
-                    FROM Transactions 
-                    WHERE user_id = :user_id 
-                        AND type = 'expense'
-                        AND date >= CURRENT_DATE - INTERVAL '{interval_value}'
-                    GROUP BY DATE_TRUNC('month', date), month
-                    ORDER BY DATE_TRUNC('month', date)
-                """),
-                {"user_id": user_id}
-            ).fetchall()
-            
-            spending_labels = [row[0] for row in spending_data] if spending_data else ["Jan", "Feb", "Mar", "Apr", "May", "Jun"]
-            spending_values = [float(row[1]) for row in spending_data] if spending_data else [1200, 1900, 1500, 1700, 1600, 2100]
-            
-            # 2. MONTHLY SAVINGS TRENDS (Line Chart)
-            savings_data = conn.execute(
-                sqlalchemy.text(f"""
-                    SELECT 
-                        TO_CHAR(DATE_TRUNC('month', date), 'Mon') AS month,
-                        SUM(CASE WHEN type = 'income' THEN amount ELSE -ABS(amount) END) AS net_savings
-                    FROM Transactions 
-                    WHERE user_id = :user_id 
-                        AND date >= CURRENT_DATE - INTERVAL '{interval_value}'
-                    GROUP BY DATE_TRUNC('month', date), month
-                    ORDER BY DATE_TRUNC('month', date)
-                """),
-                {"user_id": user_id}
-            ).fetchall()
-            
-            savings_labels = [row[0] for row in savings_data] if savings_data else ["Jan", "Feb", "Mar", "Apr", "May", "Jun"]
-            savings_values = [float(row[1]) for row in savings_data] if savings_data else [500, 600, 800, 750, 900, 1100]
-            
-            # 3. INVESTMENT PORTFOLIO TRENDS (Line Chart)
-            current_portfolio = conn.execute(
-                sqlalchemy.text("SELECT COALESCE(SUM(current_value), 65000) FROM Investments WHERE user_id = :user_id"),
-                {"user_id": user_id}
-            ).scalar_one()
-            
-            portfolio_labels = ["Jan", "Feb", "Mar", "Apr", "May", "Jun"]
-            base_value = float(current_portfolio) * 0.9  # Start 10% lower
-            portfolio_values = [
-                base_value + (i * base_value * 0.02) for i in range(6)
-            ]
-            
-            # 4. PORTFOLIO ALLOCATION (Pie Chart)
-            allocation_data = conn.execute(
-                sqlalchemy.text("""
-                    SELECT 
-                        type AS allocation_category,
-                        SUM(current_value) AS total_value
-                    FROM Investments 
-                    WHERE user_id = :user_id
-                    GROUP BY allocation_category
-                    ORDER BY total_value DESC
-                """),
-                {"user_id": user_id}
-            ).fetchall()
-            
-            allocation_labels = [row[0] for row in allocation_data] if allocation_data else ["Stocks", "Bonds", "Real Estate", "Crypto"]
-            allocation_values = [float(row[1]) for row in allocation_data] if allocation_data else [35000, 20000, 10000, 5000]
-            
-            return {
-                "spending_chart": {
-                    "labels": spending_labels,
-                    "data": spending_values
-                },
-                "savings_chart": {
-                    "labels": savings_labels,
-                    "data": savings_values
-                },
-                "investment_chart": {
-                    "labels": portfolio_labels,
-                    "data": portfolio_values
-                },
-                "allocation_chart": {
-                    "labels": allocation_labels,
-                    "data": allocation_values
-                },
-                "period": period
-            }
-            
+        data_version = getattr(request.state, "data_version", None)
+        if data_version is None:
+            data_version = get_data_version(user_id)
+        key = chart_cache_key("dashboard", user_id, period, data_version)
+        return await chart_cache.get_or_compute(key, compute_dashboard_charts, user_id, period, data_version)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+def compute_dashboard_charts(user_id: str, period: str, data_version: int | None = None) -> dict:
+    """Runs the chart queries; called by the cache on a miss."""
+    with read_connection(user_id, data_version) as conn:
+        # The window start is bound as a date so the planner prunes Transactions partitions
+        since = period_start(PERIOD_MONTHS.get(period.lower(), 6))
+        
+        # 1. MONTHLY SPENDING TRENDS (Bar Chart)
+        spending_data = conn.execute(SPENDING_TREND_SQL, {"user_id": user_id, "since": since}).fetchall()
+        
+        spending_labels = [row[0] for row in spending_data] if spending_data else ["Jan", "Feb", "Mar", "Apr", "May", "Jun"]
+        spending_values = [float(row[1]) for row in spending_data] if spending_data else [1200, 1900, 1500, 1700, 1600, 2100]
+        
+        # 2. MONTHLY SAVINGS TRENDS (Line Chart)
+        savings_data = conn.execute(SAVINGS_TREND_SQL, {"user_id": user_id, "since": since}).fetchall()
+        
+        savings_labels = [row[0] for row in savings_data] if savings_data else ["Jan", "Feb", "Mar", "Apr", "May", "Jun"]
+        savings_values = [float(row[1]) for row in savings_data] if savings_data else [500, 600, 800, 750, 900, 1100]
+        
+        # 3. INVESTMENT PORTFOLIO TRENDS (Line Chart)
+        current_portfolio = conn.execute(
+            sqlalchemy.text("SELECT COALESCE(SUM(current_value), 65000) FROM Investments WHERE user_id = :user_id"),
+            {"user_id": user_id}
+        ).scalar_one()
+        
+        portfolio_labels = ["Jan", "Feb", "Mar", "Apr", "May", "Jun"]
+        base_value = float(current_portfolio) * 0.9  # Start 10% lower
+        portfolio_values = [
+            base_value + (i * base_value * 0.02) for i in range(6)
+        ]
+        
+        # 4. PORTFOLIO ALLOCATION (Pie Chart)
+        allocation_data = conn.execute(
+            sqlalchemy.text("""
+                SELECT 
+                    type AS allocation_category,
+                    SUM(current_value) AS total_value
+                FROM Investments 
+                WHERE user_id = :user_id
+                GROUP BY allocation_category
+                ORDER BY total_value DESC
+            """),
+            {"user_id": user_id}
+        ).fetchall()
+        
+        allocation_labels = [row[0] for row in allocation_data] if allocation_data else ["Stocks", "Bonds", "Real Estate", "Crypto"]
+        allocation_values = [float(row[1]) for row in allocation_data] if allocation_data else [35000, 20000, 10000, 5000]
+        
+        return {
+            "spending_chart": {
+                "labels": spending_labels,
+                "data": spending_values
+            },
+            "savings_chart": {
+                "labels": savings_labels,
+                "data": savings_values
+            },
+            "investment_chart": {
+                "labels": portfolio_labels,
+                "data": portfolio_values
+            },
+            "allocation_chart": {
+                "labels": allocation_labels,
+                "data": allocation_values
+            },
+            "period": period
+        }
@@ -1,17 +1,41 @@
 # /api/v1/endpoints/data_entry.py
 
-from fastapi import APIRouter, HTTPException # type: ignore
+import os
+import datetime
+from fastapi import APIRouter, HTTPException, Response # type: ignore
 import sqlalchemy # type: ignore
 from config.database import engine
+from config.replicas import set_consistency_token
+from services.data_version import bump_data_version
+from services.categorizer import categorize_batch, categorize_offloaded, load_user_rules
+from services.executors import work_executor, ExecutorBusyError, TaskTimeoutError
+from services.anomalies import score_transactions
+from services.live_updates import transactions_delta, totals_delta
+from services.partitions import ensure_transaction_partitions
 
 router = APIRouter()
 
+# Largest batch accepted by /transactions/batch
+BATCH_WRITE_MAX = int(os.environ.get("BATCH_WRITE_MAX", "10000"))
+
+INSERT_TRANSACTION = sqlalchemy.text("""
+    INSERT INTO transactions (user_id, date, description, category, amount, type, anomaly_score, is_anomaly)
+    VALUES (:user_id, :date, :description, :category, :amount, :type, :anomaly_score, :is_anomaly)
+""")
+
 def check_db_engine():
     if not engine:
         raise HTTPException(status_code=503, detail="Database connection is not available.")
 
+def lock_active_user(conn, user_id: str) -> bool:
+    """Whether the user exists and is not being deleted; the row lock holds off a deletion until commit."""
+    return conn.execute(
+        sqlalchemy.text("SELECT 1 FROM Users WHERE user_id = :user_id AND deleted_at IS NULL FOR SHARE"),
+        {"user_id": user_id}
+    ).scalar() is not None
+
 @router.post("/transactions")
-async def add_transaction(request: dict):
+async def add_transaction(request: dict, response: Response):
     """Add new transaction"""
     check_db_engine()
     user_id = request.get("user_id")
@@ -19,18 +43,76 @@ async def add_transaction(request: dict):
         raise HTTPException(status_code=400, detail="user_id is required")
     try:
         with engine.connect() as conn:
-            stmt = sqlalchemy.text("""
-                INSERT INTO transactions (user_id, date, description, category, amount, type)
-                VALUES (:user_id, :date, :description, :category, :amount, :type)
-            """)
-            conn.execute(stmt, {k: request.get(k) for k in ["user_id", "date", "description", "category", "amount", "type"]})
+            if not lock_active_user(conn, user_id):
+                raise HTTPException(status_code=404, detail="User not found")
+            params = {k: request.get(k) for k in ["user_id", "date", "description", "category", "amount", "type"]}
+            if not params["category"]:
+                params["category"] = categorize_batch([params], load_user_rules(conn, user_id))[0]
+            score_transactions(conn, user_id, [params])
+            conn.execute(INSERT_TRANSACTION, params)
+            bump_data_version(conn, user_id, "transactions", transactions_delta([params]))
             conn.commit()
-            return {"message": "Transaction added successfully", "status": "success"}
+            set_consistency_token(response, conn)
+            return {"message": "Transaction added successfully", "status": "success", "category": params["category"],
+                    "anomaly_score": params["anomaly_score"], "is_anomaly": params["is_anomaly"]}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/transactions/batch")
+async def add_transactions_batch(request: dict, response: Response):
+    """Add many transactions in one transaction (e.g. an imported statement); missing categories are filled in"""
+    check_db_engine()
+    user_id = request.get("user_id")
+    transactions = request.get("transactions")
+    if not user_id or not isinstance(transactions, list) or not transactions:
+        raise HTTPException(status_code=400, detail="user_id and a non-empty transactions list are required")
+    if len(transactions) > BATCH_WRITE_MAX:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_WRITE_MAX} transactions per batch")
+    try:
+        rows = [{"user_id": user_id, **{k: t.get(k) for k in ["date", "description", "category", "amount", "type"]}} for t in transactions]
+        dates = [datetime.date.fromisoformat(str(row["date"])) for row in rows]
+    except (AttributeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid transaction: {e}")
+    def load_rules():
+        with engine.connect() as conn:
+            return load_user_rules(conn, user_id)
+
+    def write():
+        with engine.connect() as conn:
+            if not lock_active_user(conn, user_id):
+                raise HTTPException(status_code=404, detail="User not found")
+            ensure_transaction_partitions(conn, min(dates), max(dates))
+            # Scored in date order, so each is compared with what came before it.
+            score_transactions(conn, user_id, sorted(rows, key=lambda row: str(row["date"])))
+            conn.execute(INSERT_TRANSACTION, rows)
+            bump_data_version(conn, user_id, "transactions", transactions_delta(rows))
+            conn.commit()
+            set_consistency_token(response, conn)
+
+    # Categorizing up to BATCH_WRITE_MAX rows is CPU-bound: it runs in a worker process. Scoring
+    # needs the write's own connection, so the write runs on the I/O pool instead.
+    try:
+        uncategorized = [row for row in rows if not row["category"]]
+        if uncategorized:
+            categories = await categorize_offloaded(uncategorized, await work_executor.run_io(load_rules))
+            for row, category in zip(uncategorized, categories):
+                row["category"] = category
+        await work_executor.run_io(write)
+        return {"message": f"{len(rows)} transactions added successfully", "status": "success",
+                "categorized": len(uncategorized), "anomalies": sum(row["is_anomaly"] for row in rows)}
+    except HTTPException:
+        raise
+    except ExecutorBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except TaskTimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/assets")
-async def add_asset(request: dict):
+async def add_asset(request: dict, response: Response):
     """Add new asset"""
     check_db_engine()
     user_id = request.get("user_id")
@@ -38,15 +120,21 @@ async def add_asset(request: dict):
         raise HTTPException(status_code=400, detail="user_id is required")
     try:
         with engine.connect() as conn:
+            if not lock_active_user(conn, user_id):
+                raise HTTPException(status_code=404, detail="User not found")
             stmt = sqlalchemy.text("INSERT INTO assets (user_id, name, type, value) VALUES (:user_id, :name, :type, :value)")
             conn.execute(stmt, {k: request.get(k) for k in ["user_id", "name", "type", "value"]})
+            bump_data_version(conn, user_id, "assets", totals_delta("total_assets", request.get("value")))
             conn.commit()
+            set_consistency_token(response, conn)
             return {"message": "Asset added successfully", "status": "success"}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/investments")
-async def add_investment(request: dict):
+async def add_investment(request: dict, response: Response):
     """Add new investment"""
     check_db_engine()
     user_id = request.get("user_id")
@@ -54,18 +142,25 @@ async def add_investment(request: dict):
         raise HTTPException(status_code=400, detail="user_id is required")
     try:
         with engine.connect() as conn:
+            if not lock_active_user(conn, user_id):
+                raise HTTPException(status_code=404, detail="User not found")
             stmt = sqlalchemy.text("""
                 INSERT INTO investments (user_id, name, ticker, type, quantity, current_value, purchase_date)
                 VALUES (:user_id, :name, :ticker, :type, :quantity, :current_value, :purchase_date)
             """)
             conn.execute(stmt, {k: request.get(k) for k in ["user_id", "name", "ticker", "type", "quantity", "current_value", "purchase_date"]})
+            bump_data_version(conn, user_id, "investments",
+                              totals_delta("investment_portfolio", request.get("current_value"), request.get("type")))
             conn.commit()
+            set_consistency_token(response, conn)
             return {"message": "Investment added successfully", "status": "success"}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/liabilities")
-async def add_liability(request: dict):
+async def add_liability(request: dict, response: Response):
     """Add new liability"""
     check_db_engine()
     user_id = request.get("user_id")
@@ -73,9 +168,15 @@ async def add_liability(request: dict):
         raise HTTPException(status_code=400, detail="user_id is required")
     try:
         with engine.connect() as conn:
+            if not lock_active_user(conn, user_id):
+                raise HTTPException(status_code=404, detail="User not found")
             stmt = sqlalchemy.text("INSERT INTO liabilities (user_id, name, type, outstanding_balance) VALUES (:user_id, :name, :type, :outstanding_balance)")
             conn.execute(stmt, {k: request.get(k) for k in ["user_id", "name", "type", "outstanding_balance"]})
+            bump_data_version(conn, user_id, "liabilities", totals_delta("total_liabilities", request.get("outstanding_balance")))
             conn.commit()
+            set_consistency_token(response, conn)
             return {"message": "Liability added successfully", "status": "success"}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
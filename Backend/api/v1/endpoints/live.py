@@ -0,0 +1,57 @@
+# /api/v1/endpoints/live.py
+
+import asyncio
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect # type: ignore
+from config.database import engine
+from services.data_version import get_user_state
+from services.live_updates import LiveConnection, hub
+
+router = APIRouter()
+
+@router.websocket("/dashboard/live")
+async def dashboard_live(websocket: WebSocket, user_id: str):
+    """
+    Pushes dashboard updates as the user's data is written, on any worker. The first message is
+    {"type": "hello", "version": N}; fetch the dashboard after it, then apply "delta" messages
+    with a higher version, and refetch on "refresh" or a skipped version.
+    """
+    connection = LiveConnection(websocket, user_id)
+    await websocket.accept()
+    # Registered before the version is read, so no write lands between the two unseen.
+    if not hub.register(connection):
+        await websocket.close(code=1013)
+        return
+    try:
+        version, deleted = await asyncio.to_thread(get_user_state, user_id) if engine else (0, False)
+        if deleted:
+            await websocket.close(code=4404)
+            return
+        await websocket.send_json({"type": "hello", "version": version})
+        sender = asyncio.create_task(_send(connection))
+        receiver = asyncio.create_task(_receive(websocket))
+        done, pending = await asyncio.wait({sender, receiver}, return_when=asyncio.FIRST_COMPLETED)
+        for task in pending:
+            task.cancel()
+        for task in done:
+            if task.exception() and not isinstance(task.exception(), WebSocketDisconnect):
+                print(f"⚠️ [LIVE] Socket for {user_id} failed: {task.exception()}")
+    except WebSocketDisconnect:
+        pass
+    finally:
+        hub.unregister(connection)
+
+async def _send(connection: LiveConnection):
+    while True:
+        await connection.websocket.send_json(await connection.next_message())
+
+async def _receive(websocket: WebSocket):
+    """Reads (and ignores) client messages; returns when the client goes away."""
+    while True:
+        message = await websocket.receive()
+        if message["type"] == "websocket.disconnect":
+            return
+
+@router.get("/dashboard/live/stats")
+async def get_live_stats():
+    """Open dashboard sockets on this worker and messages pushed to them."""
+    return hub.status()
@@ -1,9 +1,12 @@
 # /api/v1/endpoints/users.py
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from pydantic import BaseModel, Field
 import sqlalchemy
 from config.database import engine
+from config.replicas import read_engine, set_consistency_token
+from services.data_version import bump_data_version, etag_cached, read_connection
+from services.account_purge import request_account_deletion, get_purge_status
 
 router = APIRouter()
 
@@ -22,21 +25,23 @@ async def get_current_user(user_id: str):
     pass
 
 @router.post("/users/update-profile")
-async def update_user_profile(user_id: str, request: ProfileUpdateRequest):
+async def update_user_profile(user_id: str, request: ProfileUpdateRequest, response: Response):
     check_db_engine()
     try:
         with engine.connect() as conn:
-            stmt = sqlalchemy.text("UPDATE Users SET credit_score = :credit_score, epf_balance = :epf_balance WHERE user_id = :user_id")
+            stmt = sqlalchemy.text("UPDATE Users SET credit_score = :credit_score, epf_balance = :epf_balance WHERE user_id = :user_id AND deleted_at IS NULL")
             result = conn.execute(stmt, {"user_id": user_id, "credit_score": request.credit_score, "epf_balance": request.epf_balance})
-            conn.commit()
             if result.rowcount == 0:
                 raise HTTPException(status_code=404, detail="User not found")
+            bump_data_version(conn, user_id, "users")
+            conn.commit()
+            set_consistency_token(response, conn)
             return {"message": "Profile updated successfully", "status": "success"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/users/update-permissions")
-async def update_ai_permissions(permissions: dict, user_id: str):
+async def update_ai_permissions(permissions: dict, user_id: str, response: Response):
     """Update AI access permissions for user data"""
     check_db_engine()
     try:
@@ -45,21 +50,23 @@ async def update_ai_permissions(permissions: dict, user_id: str):
                 UPDATE Users SET perm_assets = :perm_assets, perm_liabilities = :perm_liabilities,
                     perm_transactions = :perm_transactions, perm_investments = :perm_investments,
                     perm_credit_score = :perm_credit_score, perm_epf_balance = :perm_epf_balance
-                WHERE user_id = :user_id
+                WHERE user_id = :user_id AND deleted_at IS NULL
             """)
             result = conn.execute(stmt, {
                 "user_id": user_id, **{k: permissions.get(k, True) for k in ["perm_assets", "perm_liabilities", "perm_transactions", "perm_investments", "perm_credit_score", "perm_epf_balance"]}
             })
-            conn.commit()
             if result.rowcount == 0:
                 raise HTTPException(status_code=404, detail="User not found")
+            bump_data_version(conn, user_id, "users")
+            conn.commit()
+            set_consistency_token(response, conn)
             return {"message": "AI permissions updated successfully", "status": "success"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.post("/users/create")
-async def create_user(user_data: dict):
+async def create_user(user_data: dict, response: Response):
     """Create new user account"""
     check_db_engine()
     try:
@@ -67,9 +74,9 @@ async def create_user(user_data: dict):
             raise HTTPException(status_code=400, detail="Missing required fields: user_id, name")
         
         with engine.connect() as conn:
-            existing = conn.execute(sqlalchemy.text("SELECT user_id FROM Users WHERE user_id = :user_id"), {"user_id": user_data["user_id"]}).fetchone()
+            existing = conn.execute(sqlalchemy.text("SELECT deleted_at FROM Users WHERE user_id = :user_id"), {"user_id": user_data["user_id"]}).fetchone()
             if existing:
-                raise HTTPException(status_code=409, detail="User already exists")
+                raise HTTPException(status_code=409, detail="User already exists" if existing[0] is None else "User account is being deleted, try again later")
             
             stmt = sqlalchemy.text("""
                 INSERT INTO Users (user_id, name, credit_score, epf_balance, perm_assets, perm_liabilities, 
@@ -84,34 +91,46 @@ async def create_user(user_data: dict):
                 "perm_investments": user_data.get("perm_investments", True), "perm_credit_score": user_data.get("perm_credit_score", True),
                 "perm_epf_balance": user_data.get("perm_epf_balance", True)
             })
+            bump_data_version(conn, user_data["user_id"], "users")
             conn.commit()
+            set_consistency_token(response, conn)
             return {"message": "User created successfully", "status": "success", "user_id": user_data["user_id"]}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.delete("/users/delete-account")
-async def delete_user_account(user_id: str):
-    """Delete user account and all associated data"""
+@router.delete("/users/delete-account", status_code=202)
+async def delete_user_account(user_id: str, response: Response):
+    """Delete user account: hidden immediately, its data purged in the background"""
     check_db_engine()
     try:
         with engine.connect() as conn:
-            if not conn.execute(sqlalchemy.text("SELECT user_id FROM Users WHERE user_id = :user_id"), {"user_id": user_id}).fetchone():
+            if not request_account_deletion(conn, user_id):
                 raise HTTPException(status_code=404, detail="User not found")
-            
-            for table in ["Transactions", "Assets", "Liabilities", "Investments", "Users"]:
-                conn.execute(sqlalchemy.text(f"DELETE FROM {table} WHERE user_id = :user_id"), {"user_id": user_id})
             conn.commit()
-            return {"message": "User account deleted successfully", "status": "success"}
+            set_consistency_token(response, conn)
+            return {"message": "User account scheduled for deletion", "status": "accepted",
+                    "status_url": f"/api/v1/users/delete-account/status?user_id={user_id}"}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/users/delete-account/status")
+async def get_account_deletion_status(user_id: str):
+    """Progress of an account purge"""
+    check_db_engine()
+    status = get_purge_status(user_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="No account deletion found for this user")
+    return status
+
 @router.get("/users/profile-summary")
 async def get_profile_summary(user_id: str):
     """Get quick profile summary for header/navigation"""
     check_db_engine()
     try:
-        with engine.connect() as conn:
-            result = conn.execute(sqlalchemy.text("SELECT name, credit_score FROM Users WHERE user_id = :user_id"), {"user_id": user_id}).fetchone()
+        with read_engine.connect() as conn:
+            result = conn.execute(sqlalchemy.text("SELECT name, credit_score FROM Users WHERE user_id = :user_id AND deleted_at IS NULL"), {"user_id": user_id}).fetchone()
             if not result:
                 raise HTTPException(status_code=404, detail="User not found")
             
@@ -122,12 +141,12 @@ async def get_profile_summary(user_id: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.get("/users/stats")
-async def get_user_stats(user_id: str):
+@router.get("/users/stats", dependencies=[Depends(etag_cached(queries=4))])
+async def get_user_stats(user_id: str, request: Request):
     """Get user statistics (total records, etc.)"""
     check_db_engine()
     try:
-        with engine.connect() as conn:
+        with read_connection(user_id, getattr(request.state, "data_version", None)) as conn:
             counts = {}
             for table in ["Transactions", "Assets", "Investments", "Liabilities"]:
                 key = f"{table.lower()[:-1]}_count" if table.endswith('s') else f"{table.lower()}_count"
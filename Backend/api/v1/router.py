@@ -1,11 +1,18 @@
 # /api/v1/router.py
 
-from fastapi import APIRouter
-from .endpoints import ai, users, dashboard, data_entry
+from fastapi import APIRouter, Depends
+from .endpoints import ai, users, dashboard, data_entry, categories, live, analytics, admin
+from config.rate_limiter import rate_limit
 
-api_router = APIRouter()
+api_router = APIRouter(dependencies=[Depends(rate_limit("default"))])
+# WebSocket routes: the rate limiter's dependency is HTTP-only, and a socket is one long request anyway.
+live_router = APIRouter()
 
 api_router.include_router(ai.router, tags=["AI Services"])
 api_router.include_router(users.router, tags=["User Management"])
 api_router.include_router(dashboard.router, tags=["Dashboard & Data"])
-api_router.include_router(data_entry.router, tags=["Data Entry"])
\ No newline at end of file
+api_router.include_router(data_entry.router, tags=["Data Entry"])
+api_router.include_router(categories.router, tags=["Categorization"])
+api_router.include_router(analytics.router, tags=["Analytics"])
+api_router.include_router(admin.router, tags=["Admin"])
+live_router.include_router(live.router, tags=["Live Updates"])
\ No newline at end of file
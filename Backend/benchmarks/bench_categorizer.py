@@ -0,0 +1,77 @@
+"""
+Categorization throughput on statement-sized batches.
+
+Generates synthetic descriptions (merchant names with reference numbers, so most are unique)
+and times services.categorizer.categorize_batch with the pyahocorasick automaton and with the
+pure-Python fallback, against a naive loop testing every keyword with a regex.
+
+    python -m benchmarks.bench_categorizer                 # 100k descriptions
+    python -m benchmarks.bench_categorizer --rows 1000000
+
+Needs no database.
+"""
+
+import os
+import re
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services import categorizer
+
+MERCHANTS = ["Starbucks Coffee", "Amazon Marketplace", "Uber Trip", "Netflix Subscription", "Shell Petrol",
+             "BigBasket Groceries", "Apollo Pharmacy", "Zomato Food Delivery", "Airtel Recharge", "House Rent",
+             "Salary Credit", "LIC Policy Premium", "Udemy Course", "Random Store", "Transfer To Friend"]
+
+
+def synthetic(rows: int) -> list[dict]:
+    return [{"description": f"{random.choice(MERCHANTS)} REF{random.randrange(10**9)}",
+             "amount": random.randrange(100, 100000) / 100, "type": "expense",
+             "date": f"2025-{random.randrange(1, 13):02d}-01"} for _ in range(rows)]
+
+
+def naive(transactions: list[dict]) -> list[str]:
+    patterns = [(re.compile(r"\b" + re.escape(k.rstrip("*")) + ("" if k.endswith("*") else r"\b"), re.I), c)
+                for c, keywords in categorizer.DEFAULT_RULES.items() for k in keywords]
+    out = []
+    for t in transactions:
+        out.append(next((c for p, c in patterns if p.search(t["description"])), "other"))
+    return out
+
+
+def timed(label: str, func, transactions: list[dict]):
+    started = time.perf_counter()
+    func(transactions)
+    elapsed = time.perf_counter() - started
+    print(f"{label:<28} {elapsed:>8.3f}s {len(transactions) / elapsed:>12,.0f} rows/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000)
+    args = parser.parse_args()
+    random.seed(7)
+    transactions = synthetic(args.rows)
+
+    if categorizer.ahocorasick:
+        timed("aho-corasick (pyahocorasick)", categorizer.categorize_batch, transactions)
+    else:
+        print("pyahocorasick is not installed; skipping it")
+    module = categorizer.ahocorasick
+    categorizer.ahocorasick = None
+    fallback = categorizer.KeywordCategorizer(categorizer._default_rules())
+    categorizer.ahocorasick = module
+    default = categorizer.default_categorizer
+    categorizer.default_categorizer = fallback
+    try:
+        timed("aho-corasick (pure Python)", categorizer.categorize_batch, transactions)
+    finally:
+        categorizer.default_categorizer = default
+    timed("regex per keyword", naive, transactions)
+
+
+if __name__ == "__main__":
+    main()
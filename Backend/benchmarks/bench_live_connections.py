@@ -0,0 +1,101 @@
+"""
+Idle dashboard sockets per worker, and how fast a write reaches them.
+
+Opens --sockets WebSocket connections to /api/v1/dashboard/live of a running server, spread over
+--users users, and reports the connect rate and the server's memory per socket (read from
+/proc when --server-pid is given). They are then left idle for --idle seconds, and with --write
+one transaction is added for the first user to time the delta reaching all of that user's sockets.
+
+    uvicorn main:app --port 8000 &                 # one worker; raise `ulimit -n` on both sides
+    python -m benchmarks.bench_live_connections --sockets 5000 --server-pid $!
+    python -m benchmarks.bench_live_connections --sockets 5000 --write   # needs the database
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import websockets
+
+
+def rss_kib(pid: int | None) -> int | None:
+    if not pid:
+        return None
+    with open(f"/proc/{pid}/status") as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return None
+
+
+def get_json(url: str) -> dict:
+    with urllib.request.urlopen(url) as response:
+        return json.loads(response.read())
+
+
+async def open_socket(url: str):
+    socket = await websockets.connect(url, ping_interval=None, max_queue=None)
+    hello = json.loads(await socket.recv())
+    assert hello["type"] == "hello", hello
+    return socket
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base", default="127.0.0.1:8000")
+    parser.add_argument("--sockets", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--batch", type=int, default=200, help="connections opened concurrently")
+    parser.add_argument("--idle", type=float, default=5)
+    parser.add_argument("--server-pid", type=int)
+    parser.add_argument("--write", action="store_true")
+    args = parser.parse_args()
+
+    before = rss_kib(args.server_pid)
+    started = time.perf_counter()
+    sockets = []
+    for offset in range(0, args.sockets, args.batch):
+        sockets += await asyncio.gather(*(
+            open_socket(f"ws://{args.base}/api/v1/dashboard/live?user_id=bench_user_{i % args.users}")
+            for i in range(offset, min(offset + args.batch, args.sockets))
+        ))
+    elapsed = time.perf_counter() - started
+    print(f"opened {len(sockets):,} sockets in {elapsed:.2f}s ({len(sockets) / elapsed:,.0f}/s)")
+
+    await asyncio.sleep(args.idle)
+    stats = get_json(f"http://{args.base}/api/v1/dashboard/live/stats")
+    print(f"server reports {stats['connections']:,} open sockets for {stats['users']:,} users")
+    after = rss_kib(args.server_pid)
+    if before and after:
+        print(f"server RSS {before / 1024:.1f} -> {after / 1024:.1f} MiB, {(after - before) / len(sockets):.1f} KiB per socket")
+
+    if args.write:
+        targets = sockets[::args.users]
+        request = urllib.request.Request(
+            f"http://{args.base}/api/v1/transactions",
+            data=json.dumps({"user_id": "bench_user_0", "date": time.strftime("%Y-%m-%d"), "description": "Live bench",
+                             "category": "other", "amount": -1, "type": "expense"}).encode(),
+            headers={"Content-Type": "application/json"},
+        )
+        started = time.perf_counter()
+        await asyncio.to_thread(urllib.request.urlopen, request)
+        written = time.perf_counter() - started
+        latencies = []
+        for socket in targets:
+            message = json.loads(await socket.recv())
+            latencies.append((time.perf_counter() - started) * 1000)
+            assert message["type"] in ("delta", "refresh"), message
+        print(f"write took {written * 1000:.1f} ms; delta on {len(targets)} sockets after "
+              f"{min(latencies):.1f}-{max(latencies):.1f} ms")
+
+    await asyncio.gather(*(socket.close() for socket in sockets))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,73 @@
+"""
+Event-loop stalls while forecasts run: inline in the handler vs offloaded to the process pool.
+
+Runs --requests net worth simulations (--months x --simulations each) concurrently with a 10 ms
+ticker standing in for the other requests of the worker, and reports the worst and p99 delay of
+the ticker and the total wall time. Inline, every simulation blocks the loop for its full run;
+offloaded, the loop only pays for submitting and collecting.
+
+    python -m benchmarks.bench_offload
+    python -m benchmarks.bench_offload --requests 16 --simulations 20000 --months 60
+"""
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from services.executors import work_executor
+from services.forecasting import simulate_net_worth
+
+
+async def measure(label: str, run_one, requests: int):
+    delays = []
+
+    async def ticker():
+        while True:
+            expected = time.perf_counter() + 0.01
+            await asyncio.sleep(0.01)
+            delays.append(max(time.perf_counter() - expected, 0.0))
+
+    tick = asyncio.create_task(ticker())
+    started = time.perf_counter()
+    await asyncio.gather(*(run_one() for _ in range(requests)))
+    elapsed = time.perf_counter() - started
+    tick.cancel()
+    delays.sort()
+    p99 = delays[min(int(len(delays) * 0.99), len(delays) - 1)] if delays else 0.0
+    worst = delays[-1] if delays else elapsed
+    print(f"{label:<10} wall {elapsed:6.2f}s   loop stall p99 {p99 * 1000:8.1f} ms   worst {worst * 1000:8.1f} ms")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=8)
+    parser.add_argument("--simulations", type=int, default=5000)
+    parser.add_argument("--months", type=int, default=24)
+    args = parser.parse_args()
+
+    daily_net = np.random.default_rng(1).normal(20, 250, 365)
+    plain = simulate_net_worth.__wrapped__
+
+    async def inline():
+        plain(daily_net, 10000.0, args.months, args.simulations)
+
+    async def offloaded():
+        await simulate_net_worth(daily_net, 10000.0, args.months, args.simulations)
+
+    work_executor.start()
+    try:
+        await simulate_net_worth(daily_net, 0.0, 1, 100)  # spawn the worker processes first
+        await measure("inline", inline, args.requests)
+        await measure("offloaded", offloaded, args.requests)
+        print(work_executor.status()["cpu"])
+    finally:
+        await work_executor.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,125 @@
+"""
+Period-query latency on a flat vs. a monthly-partitioned Transactions table.
+
+Generates the same synthetic rows server-side (generate_series) into two scratch tables,
+`bench_tx_flat` and `bench_tx_part` (partitioned like the migrated Transactions, including the
+(user_id, date) index), then times the dashboard spending/savings queries for random users over
+every dashboard period, reporting p50/p95 and how many partitions each plan touched.
+
+    python -m benchmarks.bench_partitions --rows 1000000                       # quick run
+    python -m benchmarks.bench_partitions --rows 100000000 --users 100000 --months 60
+    python -m benchmarks.bench_partitions --skip-load                           # reuse loaded tables
+    python -m benchmarks.bench_partitions --drop                                # remove the scratch tables
+
+Needs a Postgres you can create tables in (DB_* settings from .env). 100M rows take ~15 GB.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import datetime
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text
+from dateutil.relativedelta import relativedelta
+from config.database import get_engine
+from services.partitions import period_start
+from api.v1.endpoints.dashboard import PERIOD_MONTHS, SPENDING_TREND_SQL, SAVINGS_TREND_SQL
+
+COLUMNS = "id BIGINT NOT NULL, user_id VARCHAR NOT NULL, date DATE NOT NULL, description VARCHAR NOT NULL, category VARCHAR NOT NULL, amount FLOAT NOT NULL, type VARCHAR NOT NULL"
+
+
+def load(conn, rows: int, users: int, months: int, batch: int):
+    today = datetime.date.today()
+    first = (today - relativedelta(months=months)).replace(day=1)
+    for table in ("bench_tx_flat", "bench_tx_part"):
+        conn.execute(text(f"DROP TABLE IF EXISTS {table}"))
+    conn.execute(text(f"CREATE TABLE bench_tx_flat ({COLUMNS}, PRIMARY KEY (id))"))
+    conn.execute(text(f"CREATE TABLE bench_tx_part ({COLUMNS}, PRIMARY KEY (id, date)) PARTITION BY RANGE (date)"))
+    conn.execute(text("CREATE TABLE bench_tx_part_default PARTITION OF bench_tx_part DEFAULT"))
+    month = first
+    while month <= today:
+        conn.execute(text(f"""
+            CREATE TABLE bench_tx_part_y{month:%Y}m{month:%m} PARTITION OF bench_tx_part
+            FOR VALUES FROM ('{month}') TO ('{month + relativedelta(months=1)}')
+        """))
+        month += relativedelta(months=1)
+    conn.commit()
+
+    days = (today - first).days + 1
+    started = time.monotonic()
+    for lower in range(0, rows, batch):
+        upper = min(lower + batch, rows)
+        for table in ("bench_tx_flat", "bench_tx_part"):
+            conn.execute(text(f"""
+                INSERT INTO {table}
+                SELECT g, 'bench_user_' || (hashint4(g) & 2147483647) %% :users,
+                       :first + ((hashint4(g + 1) & 2147483647) %% :days),
+                       'synthetic', (ARRAY['Groceries','Rent','Dining','Transport','Salary','Utilities'])[1 + g %% 6],
+                       ((hashint4(g + 2) & 2147483647) %% 500000) / 100.0,
+                       CASE WHEN g %% 10 = 0 THEN 'income' ELSE 'expense' END
+                FROM generate_series(:lower + 1, :upper) AS g
+            """), {"users": users, "first": first, "days": days, "lower": lower, "upper": upper})
+        conn.commit()
+        print(f"   loaded {upper:,}/{rows:,} rows ({time.monotonic() - started:.0f}s)")
+    for table in ("bench_tx_flat", "bench_tx_part"):
+        conn.execute(text(f"CREATE INDEX ON {table} (user_id, date)"))
+        conn.execute(text(f"ANALYZE {table}"))
+    conn.commit()
+
+
+def scanned_partitions(plan: dict) -> int:
+    count = 1 if plan.get("Relation Name", "").startswith("bench_tx_part_") else 0
+    return count + sum(scanned_partitions(child) for child in plan.get("Plans", []))
+
+
+def run(conn, users: int, samples: int):
+    print(f"\n{'period':<8} {'query':<9} {'table':<6} {'p50 ms':>8} {'p95 ms':>8} {'partitions':>10}")
+    for period, months in PERIOD_MONTHS.items():
+        since = period_start(months)
+        for name, query in (("spending", SPENDING_TREND_SQL), ("savings", SAVINGS_TREND_SQL)):
+            for table in ("bench_tx_flat", "bench_tx_part"):
+                sql = query.text.replace("FROM Transactions", f"FROM {table}")
+                timings = []
+                for _ in range(samples):
+                    params = {"user_id": f"bench_user_{random.randrange(users)}", "since": since}
+                    started = time.perf_counter()
+                    conn.execute(text(sql), params).fetchall()
+                    timings.append((time.perf_counter() - started) * 1000)
+                plan = conn.execute(text("EXPLAIN (FORMAT JSON) " + sql), params).scalar_one()
+                plan = (json.loads(plan) if isinstance(plan, str) else plan)[0]["Plan"]
+                timings.sort()
+                partitions = scanned_partitions(plan) if table == "bench_tx_part" else "-"
+                print(f"{period:<8} {name:<9} {table[9:]:<6} {timings[len(timings) // 2]:>8.2f} "
+                      f"{timings[int(len(timings) * 0.95) - 1]:>8.2f} {partitions:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--months", type=int, default=36, help="History length; one partition per month.")
+    parser.add_argument("--batch", type=int, default=1_000_000, help="Rows per load statement.")
+    parser.add_argument("--samples", type=int, default=50, help="Queries per period/table.")
+    parser.add_argument("--skip-load", action="store_true")
+    parser.add_argument("--drop", action="store_true")
+    args = parser.parse_args()
+    random.seed(7)
+
+    engine = get_engine()
+    with engine.connect() as conn:
+        if args.drop:
+            conn.execute(text("DROP TABLE IF EXISTS bench_tx_flat, bench_tx_part"))
+            conn.commit()
+            return
+        if not args.skip_load:
+            load(conn, args.rows, args.users, args.months, args.batch)
+        run(conn, args.users, args.samples)
+
+
+if __name__ == "__main__":
+    main()
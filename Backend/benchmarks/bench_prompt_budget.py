@@ -0,0 +1,99 @@
+"""
+Prompt token benchmark for the chat agent.
+
+Replays benchmarks/questions.json as one long conversation and compares, turn by turn, the prompt
+the agent used to receive (rules and permission block repeated in every human turn, full history)
+with the token-budgeted prompt from services/prompt_builder.py.
+
+    python -m benchmarks.bench_prompt_budget            # token counts and assembly time only
+    python -m benchmarks.bench_prompt_budget --live     # also time real agent turns (needs DB + LLM keys)
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_community.chat_message_histories import ChatMessageHistory
+from services.prompt_builder import build_agent_prompt, count_tokens, count_message_tokens
+from services.permissions import format_permission_instructions
+
+QUESTIONS_FILE = os.path.join(os.path.dirname(__file__), "questions.json")
+SAMPLE_ANSWER = (
+    "I analyzed your records. Over the period you asked about, your spending was driven mainly by groceries, "
+    "utilities and dining out, with a noticeable rise in transport costs. Your income stayed stable, so your "
+    "savings rate dipped slightly. Consider setting a monthly cap for dining and reviewing subscriptions. 📊"
+)
+
+
+def legacy_prompt_tokens(system_prompt: str, user_id: str, permission_instructions: str, question: str, history: list) -> int:
+    """Token count of the prompt as assembled before the budgeted builder existed."""
+    combined_input = f"""
+        IMPORTANT CONTEXT: You are answering for user_id: {user_id}
+        When querying the database, ALWAYS filter by WHERE user_id = '{user_id}' for tables: assets, investments, liabilities, transactions.
+
+        {permission_instructions}
+
+        User Question: {question}
+        """
+    return count_tokens(system_prompt) + count_message_tokens(history) + count_tokens(combined_input) + 8
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=3, help="How many times to replay the question set in one conversation.")
+    parser.add_argument("--user-id", default="user_001")
+    parser.add_argument("--live", action="store_true", help="Run each turn through the real agent and report latency.")
+    args = parser.parse_args()
+
+    from services.ai_agent import SYSTEM_PROMPT
+    with open(QUESTIONS_FILE) as f:
+        questions = json.load(f) * args.rounds
+
+    permissions = {p: True for p in ["perm_assets", "perm_liabilities", "perm_transactions", "perm_investments", "perm_credit_score", "perm_epf_balance"]}
+    permission_instructions = format_permission_instructions(permissions)
+
+    agent_executor = get_session_history = None
+    if args.live:
+        from services.ai_agent import init_agent, run_chat_turn
+        agent_executor, get_session_history = init_agent()
+
+    history = ChatMessageHistory()
+    legacy_total = budgeted_total = 0
+    assembly_ms = []
+    latencies = []
+    print(f"{'turn':>4} {'legacy':>8} {'budgeted':>9} {'saved':>7} {'kept':>5} {'summary':>8}" + (f" {'latency_s':>10}" if args.live else ""))
+    for turn, question in enumerate(questions, start=1):
+        legacy = legacy_prompt_tokens(SYSTEM_PROMPT, args.user_id, permission_instructions, question, history.messages)
+        prompt = build_agent_prompt(SYSTEM_PROMPT, args.user_id, permission_instructions, question, history.messages)
+        budgeted = prompt.report["total_tokens"]
+        legacy_total += legacy
+        budgeted_total += budgeted
+        assembly_ms.append(prompt.report["assembly_ms"])
+
+        line = f"{turn:>4} {legacy:>8} {budgeted:>9} {100 * (legacy - budgeted) / legacy:>6.1f}% {prompt.report['history_messages_kept']:>5} {str(prompt.report['summarized']):>8}"
+        if args.live:
+            started = time.perf_counter()
+            answer = run_chat_turn(agent_executor, get_session_history, args.user_id, question)["answer"]
+            latencies.append(time.perf_counter() - started)
+            line += f" {latencies[-1]:>10.2f}"
+        else:
+            answer = SAMPLE_ANSWER
+        print(line)
+        history.add_user_message(question)
+        history.add_ai_message(answer)
+
+    print()
+    print(f"Prompt tokens, whole conversation: legacy={legacy_total} budgeted={budgeted_total} "
+          f"saved={legacy_total - budgeted_total} ({100 * (legacy_total - budgeted_total) / legacy_total:.1f}%)")
+    print(f"Prompt assembly: mean={sum(assembly_ms) / len(assembly_ms):.3f} ms max={max(assembly_ms):.3f} ms")
+    if latencies:
+        ordered = sorted(latencies)
+        print(f"Agent turn latency: p50={ordered[len(ordered) // 2]:.2f}s p95={ordered[int(len(ordered) * 0.95) - 1]:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Transaction search latency on large per-user histories.
+
+Loads synthetic transactions into two scratch schemas, each holding a `transactions` table:
+
+  * bench_search_plain   only the (user_id, date) index
+  * bench_search         plus the full-text and trigram GIN indexes from create_schema.py
+
+and runs services.transaction_search unchanged against each (through search_path) for exact
+words, stemmed words, typos and substrings, plus a deep page reached by cursor vs. by OFFSET.
+
+    python -m benchmarks.bench_search                              # 2M rows, 20 users (~100k each)
+    python -m benchmarks.bench_search --rows 20000000 --users 40   # ~500k per user
+    python -m benchmarks.bench_search --skip-load
+    python -m benchmarks.bench_search --drop
+
+Needs a Postgres with pg_trgm and btree_gin available (DB_* settings from .env).
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text
+from config.database import get_engine
+from services.transaction_search import SEARCH_DOCUMENT, build_filters, search_transactions
+
+SCHEMAS = ("bench_search_plain", "bench_search")
+MERCHANTS = ["Starbucks Coffee", "Amazon Marketplace", "Uber Trip", "Netflix Subscription", "Shell Petrol",
+             "Walmart Groceries", "Apple Store", "Zomato Food Delivery", "Airtel Recharge", "IKEA Furniture",
+             "Spotify Premium", "Indigo Airlines", "Decathlon Sports", "Pharmacy Medicines", "Electricity Bill"]
+CATEGORIES = ["Dining", "Shopping", "Transport", "Entertainment", "Fuel", "Groceries", "Utilities", "Travel", "Health"]
+SEARCHES = [("word", "coffee"), ("stemmed", "subscriptions"), ("two words", "food delivery"),
+            ("typo", "starbuks"), ("substring", "amaz"), ("category", "groceries")]
+
+
+def load(conn, rows: int, users: int):
+    conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+    conn.execute(text("CREATE EXTENSION IF NOT EXISTS btree_gin"))
+    merchants = "ARRAY[" + ",".join(f"'{m}'" for m in MERCHANTS) + "]"
+    categories = "ARRAY[" + ",".join(f"'{c}'" for c in CATEGORIES) + "]"
+    for schema in SCHEMAS:
+        conn.execute(text(f"DROP SCHEMA IF EXISTS {schema} CASCADE"))
+        conn.execute(text(f"CREATE SCHEMA {schema}"))
+        conn.execute(text(f"""
+            CREATE TABLE {schema}.transactions AS
+            SELECT g AS id, 'bench_user_' || g %% :users AS user_id,
+                   CURRENT_DATE - (g %% 1825) AS date,
+                   ({merchants})[1 + (g / 7) %% {len(MERCHANTS)}] || ' #' || g %% 997 AS description,
+                   ({categories})[1 + (g / 11) %% {len(CATEGORIES)}] AS category,
+                   ((g * 7919) %% 500000) / 100.0 AS amount,
+                   CASE WHEN g %% 10 = 0 THEN 'income' ELSE 'expense' END AS type
+            FROM generate_series(1, :rows) AS g
+        """), {"users": users, "rows": rows})
+        conn.execute(text(f"CREATE INDEX ON {schema}.transactions (user_id, date)"))
+        conn.commit()
+        print(f"   loaded {rows:,} rows into {schema}")
+    conn.execute(text(f"CREATE INDEX ON bench_search.transactions USING GIN (user_id, ({SEARCH_DOCUMENT}))"))
+    conn.execute(text("CREATE INDEX ON bench_search.transactions USING GIN (user_id, description gin_trgm_ops)"))
+    for schema in SCHEMAS:
+        conn.execute(text(f"ANALYZE {schema}.transactions"))
+    conn.commit()
+
+
+def timed(func, samples: int) -> tuple[float, float]:
+    timings = []
+    for _ in range(samples):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return timings[len(timings) // 2], timings[max(int(len(timings) * 0.95) - 1, 0)]
+
+
+def run(conn, users: int, samples: int):
+    print(f"\n{'search':<12} {'term':<16} {'indexes':<8} {'p50 ms':>8} {'p95 ms':>8} {'rows':>5}")
+    for schema in SCHEMAS:
+        conn.execute(text(f"SET search_path TO {schema}, public"))
+        label = "plain" if schema.endswith("plain") else "search"
+        for name, term in SEARCHES:
+            user_id = f"bench_user_{random.randrange(users)}"
+            page = search_transactions(conn, user_id, limit=20, search=term)
+            p50, p95 = timed(lambda: search_transactions(conn, user_id, limit=20, search=term), samples)
+            print(f"{name:<12} {term:<16} {label:<8} {p50:>8.2f} {p95:>8.2f} {len(page['transactions']):>5}")
+
+    # Deep pagination: page 200 of the unfiltered listing, by OFFSET and by walking cursors.
+    conn.execute(text("SET search_path TO bench_search, public"))
+    user_id = f"bench_user_{random.randrange(users)}"
+    where, params = build_filters(user_id)
+    offset_query = text(f"SELECT date, description FROM transactions WHERE {where} ORDER BY date DESC, id DESC LIMIT 20 OFFSET 3980")
+    p50, p95 = timed(lambda: conn.execute(offset_query, params).fetchall(), samples)
+    print(f"\n{'page 200 by OFFSET':<37} {p50:>8.2f} {p95:>8.2f}")
+    cursor = None
+    for _ in range(199):
+        cursor = search_transactions(conn, user_id, limit=20, cursor=cursor)["nextCursor"]
+    p50, p95 = timed(lambda: search_transactions(conn, user_id, limit=20, cursor=cursor), samples)
+    print(f"{'page 200 by cursor':<37} {p50:>8.2f} {p95:>8.2f}")
+    conn.execute(text("RESET search_path"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--samples", type=int, default=30)
+    parser.add_argument("--skip-load", action="store_true")
+    parser.add_argument("--drop", action="store_true")
+    args = parser.parse_args()
+    random.seed(7)
+
+    engine = get_engine()
+    with engine.connect() as conn:
+        if args.drop:
+            for schema in SCHEMAS:
+                conn.execute(text(f"DROP SCHEMA IF EXISTS {schema} CASCADE"))
+            conn.commit()
+            return
+        if not args.skip_load:
+            load(conn, args.rows, args.users)
+        run(conn, args.users, args.samples)
+
+
+if __name__ == "__main__":
+    main()
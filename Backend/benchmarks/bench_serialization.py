@@ -0,0 +1,96 @@
+"""
+Serialization and wire-size benchmark for the largest dashboard responses.
+
+Builds synthetic payloads shaped like /transactions/all (a full 100-row page and a 5,000-row
+dump of everything a user has) and /dashboard/charts for two years, then compares:
+
+  * encode time: jsonable_encoder + json.dumps (the old default path), orjson on the raw dict
+    (ORJSONResponse without a response model) and pydantic-core validate + dump (response_model path)
+  * bytes on the wire: identity, gzip at GZIP_LEVEL and brotli at BROTLI_QUALITY (if installed)
+
+    python -m benchmarks.bench_serialization
+    python -m benchmarks.bench_serialization --rows 20000 --repeat 50
+"""
+
+import os
+import sys
+import gzip
+import json
+import random
+import time
+import argparse
+import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+from config.compression import GZIP_LEVEL, BROTLI_QUALITY, brotli
+from models.schemas import TransactionsPage, DashboardCharts
+
+CATEGORIES = ["Groceries", "Utilities", "Dining", "Transport", "Salary", "Rent", "Shopping", "Health", "Entertainment"]
+
+
+def transactions_page(rows: int) -> dict:
+    start = datetime.date.today()
+    transactions = []
+    for i in range(rows):
+        category = random.choice(CATEGORIES)
+        transactions.append({
+            "date": str(start - datetime.timedelta(days=i // 3)),
+            "description": f"{category} payment #{random.randint(1000, 99999)}",
+            "category": category,
+            "amount": round(random.uniform(-5000, 5000), 2),
+            "type": "income" if category == "Salary" else "expense",
+        })
+    return {"transactions": transactions, "totalCount": rows, "totalPages": 1, "currentPage": 1}
+
+
+def dashboard_charts(months: int) -> dict:
+    labels = [datetime.date(2000, (i % 12) + 1, 1).strftime("%b") for i in range(months)]
+    series = lambda: {"labels": labels, "data": [round(random.uniform(500, 5000), 2) for _ in labels]}
+    return {"spending_chart": series(), "savings_chart": series(), "investment_chart": series(),
+            "allocation_chart": {"labels": ["Stocks", "Bonds", "Real Estate", "Crypto"], "data": [35000.0, 20000.0, 10000.0, 5000.0]},
+            "period": "2years"}
+
+
+def time_ms(func, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - started) * 1000 / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=5000, help="Rows in the large transaction dump.")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    random.seed(42)
+
+    payloads = [
+        ("transactions page (100 rows)", transactions_page(100), TypeAdapter(TransactionsPage)),
+        (f"transactions dump ({args.rows} rows)", transactions_page(args.rows), TypeAdapter(TransactionsPage)),
+        ("charts (24 months)", dashboard_charts(24), TypeAdapter(DashboardCharts)),
+    ]
+
+    print(f"{'payload':<32} {'encoder+json':>13} {'orjson':>9} {'pydantic':>9} {'speedup':>8}   "
+          f"{'identity':>9} {'gzip':>9} {'br':>9}")
+    for name, payload, adapter in payloads:
+        legacy_ms = time_ms(lambda: json.dumps(jsonable_encoder(payload)).encode(), args.repeat)
+        orjson_ms = time_ms(lambda: orjson.dumps(payload), args.repeat)
+        model_ms = time_ms(lambda: orjson.dumps(adapter.dump_python(adapter.validate_python(payload), mode="json")), args.repeat)
+
+        body = orjson.dumps(payload)
+        gzip_bytes = len(gzip.compress(body, compresslevel=GZIP_LEVEL))
+        br_bytes = f"{len(brotli.compress(body, quality=BROTLI_QUALITY)):>9}" if brotli else f"{'n/a':>9}"
+        print(f"{name:<32} {legacy_ms:>11.2f}ms {orjson_ms:>7.2f}ms {model_ms:>7.2f}ms {legacy_ms / model_ms:>7.1f}x   "
+              f"{len(body):>9} {gzip_bytes:>9} {br_bytes}")
+
+    if not brotli:
+        print("\nbrotli is not installed; `pip install brotli` to enable `Content-Encoding: br`.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Cold-start benchmark.
+
+Starts the API under uvicorn in a fresh process and measures, from the moment the process is spawned:
+
+  * time until /livez answers (the server is accepting traffic)
+  * time until /readyz reports the database ready and the AI agent built (if it gets there within --timeout)
+
+It also times, in a fresh interpreter, importing the app module and importing the LangChain stack
+that used to be loaded (and the agent built) before the server could answer anything.
+
+    python -m benchmarks.bench_startup                   # main:app, 3 runs
+    python -m benchmarks.bench_startup --app agent:app --runs 5
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import subprocess
+import urllib.request
+import urllib.error
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFERRED_IMPORTS = ("langchain_community.utilities", "langchain_community.agent_toolkits",
+                    "langchain_classic.agents", "services.llm_router")
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def get_json(url: str):
+    try:
+        with urllib.request.urlopen(url, timeout=1) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read() or b"{}")
+    except (urllib.error.URLError, ConnectionError, TimeoutError):
+        return None, None
+
+
+def import_seconds(statement: str) -> float:
+    code = f"import time; t = time.perf_counter(); {statement}; print(time.perf_counter() - t)"
+    out = subprocess.run([sys.executable, "-c", code], cwd=BACKEND_DIR, capture_output=True, text=True, check=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def one_run(app: str, timeout: float) -> dict:
+    port = free_port()
+    started = time.perf_counter()
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", app, "--port", str(port), "--log-level", "warning"],
+                              cwd=BACKEND_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    live = ready = agent = None
+    try:
+        while time.perf_counter() - started < timeout and (ready is None or agent is None):
+            now = time.perf_counter() - started
+            if live is None:
+                status, _ = get_json(f"http://127.0.0.1:{port}/livez")
+                if status == 200:
+                    live = now
+            else:
+                status, report = get_json(f"http://127.0.0.1:{port}/readyz")
+                if report and report.get("database", {}).get("ready") and ready is None:
+                    ready = now
+                if report and report.get("agent", {}).get("status") == "ready" and agent is None:
+                    agent = now
+            time.sleep(0.02)
+    finally:
+        server.terminate()
+        server.wait()
+    return {"livez": live, "db_ready": ready, "agent_ready": agent}
+
+
+def fmt(value) -> str:
+    return f"{value:>9.2f}s" if value is not None else f"{'timeout':>10}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--app", default="main:app")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=30.0, help="Seconds to wait for readiness per run.")
+    args = parser.parse_args()
+
+    module = args.app.split(":")[0]
+    print(f"import {module}:            {import_seconds(f'import {module}'):.2f}s")
+    print(f"import LangChain stack:  {import_seconds('; '.join(f'import {m}' for m in DEFERRED_IMPORTS)):.2f}s (now deferred to the background task)")
+    print()
+    print(f"{'run':>3} {'livez':>10} {'db ready':>10} {'agent ready':>11}")
+    for run in range(1, args.runs + 1):
+        result = one_run(args.app, args.timeout)
+        print(f"{run:>3} {fmt(result['livez'])} {fmt(result['db_ready'])} {fmt(result['agent_ready']):>11}")
+
+
+if __name__ == "__main__":
+    main()
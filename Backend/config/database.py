@@ -1,6 +1,8 @@
 # /config/database.py
 
 import os
+import time
+import threading
 import urllib.parse
 import sqlalchemy
 from dotenv import load_dotenv
@@ -13,12 +15,16 @@ DB_PASS = urllib.parse.quote_plus(raw_pass)
 DB_NAME = os.environ.get("DB_NAME", "fintrack")
 DB_HOST = os.environ.get("DB_HOST", "127.0.0.1")  # Can be GCP IP or AWS RDS endpoint
 DB_PORT = os.environ.get("DB_PORT", "5432")
+DB_CONNECT_TIMEOUT = int(os.environ.get("DB_CONNECT_TIMEOUT", "5"))
+# After a failed connection attempt, wait DB_RETRY_BASE seconds, doubling per failure up to DB_RETRY_MAX.
+DB_RETRY_BASE = float(os.environ.get("DB_RETRY_BASE", "1"))
+DB_RETRY_MAX = float(os.environ.get("DB_RETRY_MAX", "60"))
 
 def get_engine():
     """Creates and returns a new SQLAlchemy engine."""
     db_uri = f"postgresql+pg8000://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
     try:
-        engine = sqlalchemy.create_engine(db_uri)
+        engine = sqlalchemy.create_engine(db_uri, pool_pre_ping=True, connect_args={"timeout": DB_CONNECT_TIMEOUT})
         with engine.connect():
             pass
         return engine
@@ -26,9 +32,64 @@ def get_engine():
         print(f"❌ Database connection failed: {e}")
         raise
 
-try:
-    engine = get_engine()
-    print("✅ Database engine created successfully.")
-except Exception as e:
-    engine = None
-    print(f"🔥 Failed to create database engine on startup: {e}")
\ No newline at end of file
+
+class LazyEngine:
+    """
+    The shared engine, created on first use instead of at import.
+
+    Existing call sites keep working: `if not engine:` tries to connect and `engine.connect()`
+    goes to the real engine. A failed attempt is retried on a later call once an exponential
+    backoff has passed, so a database blip at boot no longer leaves the worker without a
+    database until it restarts.
+    """
+
+    def __init__(self):
+        self._engine = None
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._retry_at = 0.0
+        self.last_error = None
+
+    def get(self):
+        """The real engine, or None while the database is unreachable."""
+        if self._engine is not None or time.monotonic() < self._retry_at:
+            return self._engine
+        with self._lock:
+            if self._engine is None and time.monotonic() >= self._retry_at:
+                try:
+                    self._engine = get_engine()
+                    self._failures = 0
+                    self.last_error = None
+                    print("✅ Database engine created successfully.")
+                except Exception as e:
+                    self._failures += 1
+                    delay = min(DB_RETRY_BASE * 2 ** (self._failures - 1), DB_RETRY_MAX)
+                    self._retry_at = time.monotonic() + delay
+                    self.last_error = str(e)
+                    print(f"🔥 Failed to create database engine (attempt {self._failures}), retrying in {delay:.0f}s: {e}")
+        return self._engine
+
+    def __bool__(self):
+        return self.get() is not None
+
+    def __getattr__(self, name):
+        real_engine = self.get()
+        if real_engine is None:
+            raise ConnectionError(f"Database connection is not available: {self.last_error}")
+        return getattr(real_engine, name)
+
+    def status(self) -> dict:
+        """Readiness of the database: a `SELECT 1` round trip plus pool usage."""
+        real_engine = self.get()
+        if real_engine is None:
+            return {"ready": False, "failures": self._failures, "error": self.last_error,
+                    "retry_in_s": round(max(self._retry_at - time.monotonic(), 0), 1)}
+        try:
+            with real_engine.connect() as conn:
+                conn.execute(sqlalchemy.text("SELECT 1"))
+        except Exception as e:
+            return {"ready": False, "error": str(e), "pool": real_engine.pool.status()}
+        return {"ready": True, "pool": real_engine.pool.status()}
+
+
+engine = LazyEngine()
@@ -1,7 +1,248 @@
 # /config/rate_limiter.py
 
-from slowapi import Limiter
-from slowapi.util import get_remote_address
+import os
+import time
+import threading
+from dataclasses import dataclass
+import sqlalchemy
+from fastapi import HTTPException, Request, Response
+from starlette.concurrency import run_in_threadpool
+from config.database import engine
+from services.change_feed import change_feed
 
-# Initialize rate limiter
-limiter = Limiter(key_func=get_remote_address, default_limits=["100/minute"])
+# Which store holds the token buckets: "postgres" (shared by every worker), "redis" or "memory" (single process only).
+RATE_LIMIT_BACKEND = os.environ.get("RATE_LIMIT_BACKEND", "postgres").lower()
+REDIS_URL = os.environ.get("REDIS_URL", "redis://localhost:6379/0")
+PLAN_CACHE_TTL = 300
+
+# Limits per route and per plan, in the same "<requests>/<period>" notation slowapi used.
+# Any entry can be overridden with an env var such as RATE_LIMIT_AI_CHAT_PRO=60/minute.
+RATE_LIMITS = {
+    "default": {"anonymous": "60/minute", "free": "120/minute", "pro": "600/minute"},
+    "ai_chat": {"anonymous": "2/minute", "free": "10/minute", "pro": "60/minute"},
+    "reload_agent": {"anonymous": "1/minute", "free": "2/minute", "pro": "2/minute"},
+}
+
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+
+@dataclass
+class BucketState:
+    allowed: bool
+    remaining: float
+    capacity: int
+    refill_rate: float
+
+    def headers(self) -> dict:
+        """Rate-limit headers describing this bucket after the request was counted."""
+        remaining = max(int(self.remaining), 0)
+        reset = int((self.capacity - max(self.remaining, 0)) / self.refill_rate + 0.999)
+        headers = {
+            "X-RateLimit-Limit": str(self.capacity),
+            "X-RateLimit-Remaining": str(remaining),
+            "X-RateLimit-Reset": str(reset),
+        }
+        if not self.allowed:
+            headers["Retry-After"] = str(max(int((1 - self.remaining) / self.refill_rate + 0.999), 1))
+        return headers
+
+
+def parse_limit(limit: str) -> tuple[int, int]:
+    """Turns '10/minute' into (capacity, period_seconds)."""
+    count, _, period = limit.partition("/")
+    return int(count), PERIODS[period.strip().lower().rstrip("s")]
+
+
+def get_limit(route: str, plan: str) -> tuple[int, int]:
+    """Looks up the (capacity, period) for a route and plan, honouring env overrides."""
+    route_limits = RATE_LIMITS.get(route, RATE_LIMITS["default"])
+    default = route_limits.get(plan, route_limits["free"])
+    return parse_limit(os.environ.get(f"RATE_LIMIT_{route}_{plan}".upper(), default))
+
+
+class MemoryBucketStore:
+    """Process-local buckets. Only correct with a single worker; used for development."""
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def consume(self, key: str, capacity: int, refill_rate: float, cost: float = 1) -> BucketState:
+        with self._lock:
+            now = time.monotonic()
+            tokens, updated_at = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated_at) * refill_rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self._buckets[key] = (tokens, now)
+            return BucketState(allowed, tokens, capacity, refill_rate)
+
+
+class PostgresBucketStore:
+    """Buckets in a Postgres table, refilled and decremented by a single atomic UPSERT."""
+
+    CREATE_TABLE = sqlalchemy.text("""
+        CREATE TABLE IF NOT EXISTS rate_limit_buckets (
+            bucket_key VARCHAR PRIMARY KEY,
+            tokens DOUBLE PRECISION NOT NULL,
+            updated_at DOUBLE PRECISION NOT NULL
+        )
+    """)
+
+    # The refill is computed from the database clock so workers with skewed clocks agree.
+    # The WHERE on the conflict branch makes the decrement conditional: no row comes back when the bucket is empty.
+    CONSUME = sqlalchemy.text("""
+        INSERT INTO rate_limit_buckets AS b (bucket_key, tokens, updated_at)
+        VALUES (:bucket_key, CAST(:capacity AS DOUBLE PRECISION) - :cost, EXTRACT(EPOCH FROM clock_timestamp()))
+        ON CONFLICT (bucket_key) DO UPDATE
+        SET tokens = LEAST(CAST(:capacity AS DOUBLE PRECISION), b.tokens + (EXCLUDED.updated_at - b.updated_at) * :rate) - :cost,
+            updated_at = EXCLUDED.updated_at
+        WHERE LEAST(CAST(:capacity AS DOUBLE PRECISION), b.tokens + (EXCLUDED.updated_at - b.updated_at) * :rate) >= :cost
+        RETURNING tokens
+    """)
+
+    PEEK = sqlalchemy.text("""
+        SELECT LEAST(CAST(:capacity AS DOUBLE PRECISION), tokens + (EXTRACT(EPOCH FROM clock_timestamp()) - updated_at) * :rate)
+        FROM rate_limit_buckets WHERE bucket_key = :bucket_key
+    """)
+
+    def __init__(self, db_engine):
+        self.engine = db_engine
+        self._table_ready = False
+        # Used while the database is unreachable, so limits still hold per worker.
+        self._fallback = MemoryBucketStore()
+
+    def consume(self, key: str, capacity: int, refill_rate: float, cost: float = 1) -> BucketState:
+        if not self.engine:
+            return self._fallback.consume(key, capacity, refill_rate, cost)
+        params = {"bucket_key": key, "capacity": capacity, "rate": refill_rate, "cost": float(cost)}
+        with self.engine.connect() as conn:
+            if not self._table_ready:
+                conn.execute(self.CREATE_TABLE)
+                self._table_ready = True
+            remaining = conn.execute(self.CONSUME, params).scalar()
+            if remaining is None:
+                current = conn.execute(self.PEEK, params).scalar()
+                conn.commit()
+                return BucketState(False, current or 0.0, capacity, refill_rate)
+            conn.commit()
+            return BucketState(True, remaining, capacity, refill_rate)
+
+
+class RedisBucketStore:
+    """Buckets in Redis (or any server speaking its protocol), updated by a Lua script."""
+
+    CONSUME_SCRIPT = """
+        local capacity = tonumber(ARGV[1])
+        local rate = tonumber(ARGV[2])
+        local cost = tonumber(ARGV[3])
+        local t = redis.call('TIME')
+        local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+        local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+        local tokens = tonumber(bucket[1]) or capacity
+        local ts = tonumber(bucket[2]) or now
+        tokens = math.min(capacity, tokens + (now - ts) * rate)
+        local allowed = 0
+        if tokens >= cost then
+            tokens = tokens - cost
+            allowed = 1
+        end
+        redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+        redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) * 2)
+        return {allowed, tostring(tokens)}
+    """
+
+    def __init__(self, url: str):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("RATE_LIMIT_BACKEND=redis requires the 'redis' package.") from e
+        self.client = redis.Redis.from_url(url)
+        self._consume = self.client.register_script(self.CONSUME_SCRIPT)
+
+    def consume(self, key: str, capacity: int, refill_rate: float, cost: float = 1) -> BucketState:
+        allowed, remaining = self._consume(keys=[f"ratelimit:{key}"], args=[capacity, refill_rate, cost])
+        return BucketState(bool(allowed), float(remaining), capacity, refill_rate)
+
+
+def _create_store():
+    if RATE_LIMIT_BACKEND == "redis":
+        return RedisBucketStore(REDIS_URL)
+    if RATE_LIMIT_BACKEND == "postgres":
+        return PostgresBucketStore(engine)
+    print(f"⚠️ Rate limiter using in-memory buckets (backend={RATE_LIMIT_BACKEND}).")
+    return MemoryBucketStore()
+
+
+bucket_store = _create_store()
+_plan_cache = {}
+
+
+@change_feed.subscribe
+def _drop_cached_plan(event: dict):
+    if event["table"] in ("users", "*"):
+        _plan_cache.pop(event["user_id"], None)
+
+
+def get_user_plan(user_id: str) -> str:
+    """Returns the user's plan, cached for a few minutes. Unknown users are treated as 'free'."""
+    cached = _plan_cache.get(user_id)
+    if cached and cached[1] > time.monotonic():
+        return cached[0]
+    plan = "free"
+    if engine:
+        try:
+            with engine.connect() as conn:
+                plan = conn.execute(sqlalchemy.text("SELECT plan FROM Users WHERE user_id = :user_id"), {"user_id": user_id}).scalar() or "free"
+        except Exception as e:
+            print(f"⚠️ Could not look up plan for {user_id}: {e}")
+    _plan_cache[user_id] = (plan, time.monotonic() + PLAN_CACHE_TTL)
+    return plan
+
+
+async def get_rate_limit_user(request: Request) -> str | None:
+    """Finds the user_id of a request, from the query string or a JSON body."""
+    user_id = request.query_params.get("user_id")
+    if user_id:
+        return user_id
+    if request.headers.get("content-type", "").startswith("application/json"):
+        try:
+            body = await request.json()
+        except ValueError:
+            return None
+        if isinstance(body, dict) and body.get("user_id"):
+            return str(body["user_id"])
+    return None
+
+
+def rate_limit(route: str, cost: float = 1):
+    """
+    FastAPI dependency that charges `cost` tokens from the caller's bucket for `route`. The plan
+    lookup and the bucket update are blocking round trips, so they run in the threadpool.
+    """
+    def charge(user_id: str | None, client_host: str):
+        if user_id:
+            key, plan = f"user:{user_id}", get_user_plan(user_id)
+        else:
+            key, plan = f"ip:{client_host}", "anonymous"
+        capacity, period = get_limit(route, plan)
+        return plan, capacity, period, bucket_store.consume(f"{route}:{key}", capacity, capacity / period, cost)
+
+    async def dependency(request: Request, response: Response):
+        user_id = await get_rate_limit_user(request)
+        try:
+            plan, capacity, period, state = await run_in_threadpool(
+                charge, user_id, request.client.host if request.client else "unknown"
+            )
+        except Exception as e:
+            # Fail open: an unavailable limiter backend should not take the API down with it.
+            print(f"⚠️ Rate limiter backend error, allowing request: {e}")
+            return
+
+        headers = state.headers()
+        if not state.allowed:
+            raise HTTPException(status_code=429, detail=f"Rate limit exceeded: {capacity} requests per {period}s on the {plan} plan.", headers=headers)
+        response.headers.update(headers)
+
+    return dependency
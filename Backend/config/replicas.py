@@ -0,0 +1,247 @@
+# /config/replicas.py
+
+import os
+import time
+import asyncio
+import itertools
+import contextvars
+import pg8000.dbapi
+import sqlalchemy
+from sqlalchemy import event, exc
+from config.database import DB_USER, raw_pass, DB_NAME, DB_HOST, DB_PORT, DB_CONNECT_TIMEOUT, engine
+
+# Comma-separated host[:port] list of streaming replicas of the primary. Empty: all reads go to the primary.
+DB_REPLICA_HOSTS = os.environ.get("DB_REPLICA_HOSTS", "")
+# Replicas further behind the primary than this are skipped until they catch up.
+REPLICA_MAX_LAG_SECONDS = float(os.environ.get("REPLICA_MAX_LAG_SECONDS", "5"))
+REPLICA_HEALTH_INTERVAL = float(os.environ.get("REPLICA_HEALTH_INTERVAL", "2"))
+
+# Write responses carry the primary's WAL position in this header; sending it back on later
+# requests makes their reads wait for a replica that has replayed it, or go to the primary.
+CONSISTENCY_HEADER = "X-Consistency-Token"
+
+# Lowest WAL position (as an int) the current request's reads must see.
+required_lsn = contextvars.ContextVar("required_lsn", default=0)
+
+
+def parse_lsn(lsn: str | None) -> int:
+    """'16/B374D848' -> int. Raises ValueError on anything else."""
+    if not lsn:
+        return 0
+    high, low = lsn.split("/")
+    return (int(high, 16) << 32) | int(low, 16)
+
+
+def connect_dbapi(host: str, port: str):
+    return pg8000.dbapi.connect(user=DB_USER, password=raw_pass, host=host, port=int(port),
+                                database=DB_NAME, timeout=DB_CONNECT_TIMEOUT)
+
+
+class Replica:
+    """Health of one replica, refreshed by the router's monitor."""
+
+    def __init__(self, host: str, port: str):
+        self.host = host
+        self.port = port
+        self.healthy = False
+        self.replay_lsn = 0
+        self.lag_seconds = None
+        self.checked_at = 0.0
+        self.error = None
+
+    def check(self, primary_lsn: int | None):
+        try:
+            conn = connect_dbapi(self.host, self.port)
+            try:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    SELECT pg_is_in_recovery(), pg_last_wal_replay_lsn()::text,
+                           EXTRACT(EPOCH FROM NOW() - pg_last_xact_replay_timestamp())::float
+                """)
+                in_recovery, replay_lsn, replay_age = cursor.fetchone()
+            finally:
+                conn.close()
+        except Exception as e:
+            self.healthy = False
+            self.error = str(e)
+            self.checked_at = time.monotonic()
+            return
+        self.replay_lsn = parse_lsn(replay_lsn)
+        # The age of the last replayed transaction keeps growing on an idle primary,
+        # so it only counts as lag while the replica is actually behind.
+        if primary_lsn is not None and self.replay_lsn >= primary_lsn:
+            self.lag_seconds = 0.0
+        else:
+            self.lag_seconds = replay_age or 0.0
+        self.healthy = bool(in_recovery) and self.lag_seconds <= REPLICA_MAX_LAG_SECONDS
+        self.error = None if in_recovery else "not in recovery (promoted or misconfigured)"
+        self.checked_at = time.monotonic()
+
+    def usable(self, min_lsn: int = 0) -> bool:
+        fresh = time.monotonic() - self.checked_at <= 3 * REPLICA_HEALTH_INTERVAL
+        return self.healthy and fresh and self.replay_lsn >= min_lsn
+
+    def to_dict(self) -> dict:
+        return {
+            "host": f"{self.host}:{self.port}",
+            "healthy": self.healthy,
+            "lag_seconds": round(self.lag_seconds, 3) if self.lag_seconds is not None else None,
+            "checked_s_ago": round(time.monotonic() - self.checked_at, 1) if self.checked_at else None,
+            "error": self.error,
+        }
+
+
+class ReplicaRouter:
+    """
+    Routes read-only traffic across the replicas in DB_REPLICA_HOSTS.
+
+    A monitor task checks every replica's replay position and lag against the primary. Read
+    engines created here connect to a healthy replica (round robin) and fall back to the primary
+    when none is usable. A pooled connection is re-checked at every checkout and replaced if its
+    replica has become unhealthy, fallen behind, or not yet replayed the request's consistency token.
+    """
+
+    def __init__(self, hosts: str):
+        self.replicas = []
+        for entry in filter(None, (h.strip() for h in hosts.split(","))):
+            host, _, port = entry.partition(":")
+            self.replicas.append(Replica(host, port or DB_PORT))
+        self._round_robin = itertools.count()
+        self.primary_reads = 0
+        self.replica_reads = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.replicas)
+
+    def choose(self, min_lsn: int = 0) -> Replica | None:
+        candidates = [r for r in self.replicas if r.usable(min_lsn)]
+        if not candidates:
+            return None
+        return candidates[next(self._round_robin) % len(candidates)]
+
+    def check_all(self):
+        """Blocking health check of every replica."""
+        try:
+            with engine.connect() as conn:
+                primary_lsn = parse_lsn(conn.execute(sqlalchemy.text("SELECT pg_current_wal_lsn()::text")).scalar_one())
+        except Exception:
+            primary_lsn = None
+        for replica in self.replicas:
+            was_healthy = replica.healthy
+            replica.check(primary_lsn)
+            if replica.healthy != was_healthy:
+                state = "healthy" if replica.healthy else f"unhealthy ({replica.error or f'lag {replica.lag_seconds:.1f}s'})"
+                print(f"{'🟢' if replica.healthy else '🔴'} [REPLICA] {replica.host}:{replica.port} is {state}.")
+
+    async def monitor(self):
+        """Background task: keeps replica health current. Cancel it on shutdown."""
+        while True:
+            try:
+                await asyncio.to_thread(self.check_all)
+            except Exception as e:
+                print(f"⚠️ [REPLICA] Health check failed: {e}")
+            await asyncio.sleep(REPLICA_HEALTH_INTERVAL)
+
+    def create_read_engine(self):
+        """A new engine whose connections go to a usable replica, or the primary. None without replicas."""
+        if not self.enabled:
+            return None
+
+        def creator():
+            replica = self.choose(required_lsn.get())
+            dbapi_conn = connect_dbapi(replica.host, replica.port) if replica else connect_dbapi(DB_HOST, DB_PORT)
+            dbapi_conn.fintrack_replica = replica
+            return dbapi_conn
+
+        read_engine = sqlalchemy.create_engine("postgresql+pg8000://", creator=creator, pool_pre_ping=True)
+
+        @event.listens_for(read_engine, "checkout")
+        def reroute(dbapi_conn, connection_record, connection_proxy):
+            replica = dbapi_conn.fintrack_replica
+            min_lsn = required_lsn.get()
+            if replica is None:
+                # Move back to a replica once one is usable, unless this request needs the primary.
+                if not min_lsn and self.choose() is not None:
+                    raise exc.DisconnectionError("a replica is usable again")
+                self.primary_reads += 1
+            elif not replica.usable(min_lsn):
+                raise exc.DisconnectionError(f"replica {replica.host} is unhealthy or behind")
+            else:
+                self.replica_reads += 1
+
+        return read_engine
+
+    def status(self) -> dict:
+        return {
+            "replicas": [r.to_dict() for r in self.replicas],
+            "replica_reads": self.replica_reads,
+            "primary_reads": self.primary_reads,
+        }
+
+
+class ReadEngine:
+    """
+    The shared engine for read-only routes, created on first use. Without replicas it is the
+    primary engine, so `read_engine.connect()` works the same either way.
+    """
+
+    def __init__(self, router: ReplicaRouter):
+        self.router = router
+        self._engine = None
+
+    def get(self):
+        if not self.router.enabled:
+            return engine.get()
+        if self._engine is None:
+            self._engine = self.router.create_read_engine()
+        return self._engine
+
+    def __bool__(self):
+        return self.router.enabled or bool(engine)
+
+    def __getattr__(self, name):
+        if not self.router.enabled:
+            return getattr(engine, name)
+        return getattr(self.get(), name)
+
+
+def consistency_token(conn) -> str | None:
+    """The primary's WAL position after a write; call after the commit. None without replicas."""
+    if not replica_router.enabled:
+        return None
+    return conn.execute(sqlalchemy.text("SELECT pg_current_wal_lsn()::text")).scalar_one()
+
+
+def set_consistency_token(response, conn):
+    token = consistency_token(conn)
+    if token:
+        response.headers[CONSISTENCY_HEADER] = token
+
+
+class ConsistencyTokenMiddleware:
+    """Reads the consistency token sent back by the client into `required_lsn` for the request."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        header = CONSISTENCY_HEADER.lower().encode()
+        token = next((value for name, value in scope["headers"] if name == header), None)
+        try:
+            lsn = parse_lsn(token.decode()) if token else 0
+        except ValueError:
+            lsn = 0
+        if not lsn:
+            return await self.app(scope, receive, send)
+        reset = required_lsn.set(lsn)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            required_lsn.reset(reset)
+
+
+replica_router = ReplicaRouter(DB_REPLICA_HOSTS)
+read_engine = ReadEngine(replica_router)
@@ -4,9 +4,14 @@ Creates all tables needed for FinTrack application
 Run this ONCE after creating a blank AWS RDS database
 """
 
+import datetime
 import sqlalchemy
 from sqlalchemy import text
+from dateutil.relativedelta import relativedelta
 from config.database import get_engine
+from services.partitions import PARTITION_MONTHS_AHEAD, ensure_transaction_partitions, is_partitioned
+from services.transaction_search import SEARCH_DOCUMENT
+from services.anomalies import REBUILD_CATEGORY_STATS_SQL
 
 def create_schema():
     """Create all database tables"""
@@ -27,24 +32,35 @@ def create_schema():
                 perm_transactions BOOLEAN DEFAULT TRUE,
                 perm_investments BOOLEAN DEFAULT TRUE,
                 perm_credit_score BOOLEAN DEFAULT TRUE,
-                perm_epf_balance BOOLEAN DEFAULT TRUE
+                perm_epf_balance BOOLEAN DEFAULT TRUE,
+                plan VARCHAR DEFAULT 'free',
+                deleted_at TIMESTAMP
             )
         """))
+        conn.execute(text("ALTER TABLE Users ADD COLUMN IF NOT EXISTS plan VARCHAR DEFAULT 'free'"))
+        conn.execute(text("ALTER TABLE Users ADD COLUMN IF NOT EXISTS deleted_at TIMESTAMP"))
         print("✅ Users table created")
         
-        # Create Transactions table
+        # Create Transactions table, range-partitioned by month on date
+        # (existing unpartitioned installs: run migrate_partition_transactions.py)
         conn.execute(text("""
             CREATE TABLE IF NOT EXISTS Transactions (
-                id SERIAL PRIMARY KEY,
+                id SERIAL,
                 user_id VARCHAR NOT NULL,
                 date DATE NOT NULL,
                 description VARCHAR NOT NULL,
                 category VARCHAR NOT NULL,
                 amount FLOAT NOT NULL,
                 type VARCHAR NOT NULL,
-                FOREIGN KEY (user_id) REFERENCES Users(user_id)
-            )
+                PRIMARY KEY (id, date),
+                FOREIGN KEY (user_id) REFERENCES Users(user_id) ON DELETE CASCADE
+            ) PARTITION BY RANGE (date)
         """))
+        if is_partitioned(conn):
+            conn.execute(text("CREATE TABLE IF NOT EXISTS transactions_default PARTITION OF Transactions DEFAULT"))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS transactions_user_date_idx ON Transactions (user_id, date)"))
+            today = datetime.date.today()
+            ensure_transaction_partitions(conn, today - relativedelta(months=24), today + relativedelta(months=PARTITION_MONTHS_AHEAD))
         print("✅ Transactions table created")
         
         # Create Assets table
@@ -55,7 +71,7 @@ def create_schema():
                 name VARCHAR NOT NULL,
                 type VARCHAR NOT NULL,
                 value FLOAT NOT NULL,
-                FOREIGN KEY (user_id) REFERENCES Users(user_id)
+                FOREIGN KEY (user_id) REFERENCES Users(user_id) ON DELETE CASCADE
             )
         """))
         print("✅ Assets table created")
@@ -68,7 +84,7 @@ def create_schema():
                 name VARCHAR NOT NULL,
                 type VARCHAR NOT NULL,
                 outstanding_balance FLOAT NOT NULL,
-                FOREIGN KEY (user_id) REFERENCES Users(user_id)
+                FOREIGN KEY (user_id) REFERENCES Users(user_id) ON DELETE CASCADE
             )
         """))
         print("✅ Liabilities table created")
@@ -84,10 +100,229 @@ def create_schema():
                 quantity FLOAT NOT NULL,
                 current_value FLOAT NOT NULL,
                 purchase_date DATE,
-                FOREIGN KEY (user_id) REFERENCES Users(user_id)
+                FOREIGN KEY (user_id) REFERENCES Users(user_id) ON DELETE CASCADE
             )
         """))
         print("✅ Investments table created")
+
+        # Indexes for per-user reads and account purges, and cascading user foreign keys on
+        # tables created before they were declared ON DELETE CASCADE (added NOT VALID, then
+        # validated, so existing rows are checked without blocking writes)
+        for table in ["Assets", "Liabilities", "Investments"]:
+            conn.execute(text(f"CREATE INDEX IF NOT EXISTS {table.lower()}_user_id_idx ON {table} (user_id)"))
+        for table in ["Transactions", "Assets", "Liabilities", "Investments"]:
+            constraint = f"{table.lower()}_user_id_fkey"
+            cascades = conn.execute(text("""
+                SELECT confdeltype = 'c' FROM pg_constraint
+                WHERE conrelid = to_regclass(:table) AND conname = :constraint
+            """), {"table": table.lower(), "constraint": constraint}).scalar()
+            if not cascades:
+                # Partitioned tables do not support NOT VALID foreign keys
+                not_valid = "" if table == "Transactions" and is_partitioned(conn) else "NOT VALID"
+                conn.execute(text(f"ALTER TABLE {table} DROP CONSTRAINT IF EXISTS {constraint}"))
+                conn.execute(text(f"""
+                    ALTER TABLE {table} ADD CONSTRAINT {constraint}
+                    FOREIGN KEY (user_id) REFERENCES Users(user_id) ON DELETE CASCADE {not_valid}
+                """))
+                conn.commit()
+                if not_valid:
+                    conn.execute(text(f"ALTER TABLE {table} VALIDATE CONSTRAINT {constraint}"))
+                    conn.commit()
+        print("✅ User indexes and cascading foreign keys in place")
+
+        # Transaction search: full-text over description + category and trigram (fuzzy/substring)
+        # over description, both led by user_id (btree_gin) so a search only walks that user's entries
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS btree_gin"))
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS transactions_search_idx ON Transactions USING GIN (user_id, ({SEARCH_DOCUMENT}))"))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS transactions_description_trgm_idx ON Transactions USING GIN (user_id, description gin_trgm_ops)"))
+        print("✅ Transaction search indexes created")
+
+        # Anomaly flags set at write time (services/anomalies.py); the partial index holds only flagged rows
+        conn.execute(text("ALTER TABLE Transactions ADD COLUMN IF NOT EXISTS anomaly_score REAL"))
+        conn.execute(text("ALTER TABLE Transactions ADD COLUMN IF NOT EXISTS is_anomaly BOOLEAN NOT NULL DEFAULT FALSE"))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS transactions_anomalies_idx ON Transactions (user_id, date DESC) WHERE is_anomaly"))
+        print("✅ Transaction anomaly columns created")
+
+        # Create the account purge queue (delete-account marks the user deleted, a background job purges in batches)
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS account_purges (
+                user_id VARCHAR PRIMARY KEY,
+                status VARCHAR NOT NULL DEFAULT 'pending',
+                requested_at TIMESTAMP DEFAULT NOW(),
+                started_at TIMESTAMP,
+                heartbeat_at TIMESTAMP,
+                finished_at TIMESTAMP,
+                rows_deleted BIGINT NOT NULL DEFAULT 0,
+                current_table VARCHAR,
+                error TEXT
+            )
+        """))
+        print("✅ Account purges table created")
+
+        # Create per-user categorization overrides (keyword pattern -> category, applied on top of the defaults)
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS category_rules (
+                user_id VARCHAR NOT NULL REFERENCES Users(user_id) ON DELETE CASCADE,
+                pattern VARCHAR NOT NULL,
+                category VARCHAR NOT NULL,
+                created_at TIMESTAMP DEFAULT NOW(),
+                PRIMARY KEY (user_id, pattern)
+            )
+        """))
+        print("✅ Category rules table created")
+
+        # Create detected recurring payments (see services/subscriptions.py) and each user's scan watermark
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS subscriptions (
+                id SERIAL PRIMARY KEY,
+                user_id VARCHAR NOT NULL REFERENCES Users(user_id) ON DELETE CASCADE,
+                merchant_key VARCHAR NOT NULL,
+                description VARCHAR,
+                category VARCHAR,
+                type VARCHAR NOT NULL,
+                amount DECIMAL(12, 2) NOT NULL,
+                average_amount DECIMAL(12, 2) NOT NULL,
+                period VARCHAR NOT NULL,
+                occurrences INTEGER NOT NULL,
+                first_date DATE NOT NULL,
+                last_date DATE NOT NULL,
+                next_expected DATE NOT NULL,
+                confidence DECIMAL(4, 2) NOT NULL,
+                updated_at TIMESTAMP DEFAULT NOW()
+            )
+        """))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS subscriptions_user_id_idx ON subscriptions (user_id)"))
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS subscription_scans (
+                user_id VARCHAR PRIMARY KEY REFERENCES Users(user_id) ON DELETE CASCADE,
+                last_transaction_id BIGINT NOT NULL DEFAULT 0,
+                scanned_at TIMESTAMP DEFAULT NOW()
+            )
+        """))
+        print("✅ Subscriptions tables created")
+
+        # Create running amount statistics per user and category (Welford: count, mean, sum of squared deviations)
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS category_stats (
+                user_id VARCHAR NOT NULL REFERENCES Users(user_id) ON DELETE CASCADE,
+                category VARCHAR NOT NULL,
+                count BIGINT NOT NULL DEFAULT 0,
+                mean DOUBLE PRECISION NOT NULL DEFAULT 0,
+                m2 DOUBLE PRECISION NOT NULL DEFAULT 0,
+                updated_at TIMESTAMP DEFAULT NOW(),
+                PRIMARY KEY (user_id, category)
+            )
+        """))
+        conn.execute(text(REBUILD_CATEGORY_STATS_SQL))
+        print("✅ Category stats table created")
+
+        # Create the change feed outbox (services/change_feed.py); rows past the retention are pruned by the API workers
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS change_events (
+                id BIGSERIAL PRIMARY KEY,
+                user_id VARCHAR NOT NULL,
+                table_name VARCHAR NOT NULL,
+                version BIGINT NOT NULL,
+                delta JSONB,
+                created_at TIMESTAMPTZ NOT NULL DEFAULT clock_timestamp()
+            )
+        """))
+        conn.execute(text("ALTER TABLE change_events ADD COLUMN IF NOT EXISTS delta JSONB"))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS change_events_created_at_idx ON change_events (created_at)"))
+        print("✅ Change events table created")
+
+        # Create rate limiter token buckets (shared by all API workers)
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS rate_limit_buckets (
+                bucket_key VARCHAR PRIMARY KEY,
+                tokens DOUBLE PRECISION NOT NULL,
+                updated_at DOUBLE PRECISION NOT NULL
+            )
+        """))
+        print("✅ Rate limit buckets table created")
+
+        # Create per-user data versions (bumped on every write, used for ETags)
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS user_data_versions (
+                user_id VARCHAR PRIMARY KEY,
+                version BIGINT NOT NULL DEFAULT 0,
+                updated_at TIMESTAMP DEFAULT NOW()
+            )
+        """))
+        print("✅ User data versions table created")
+
+        # Create the agent version counter (bumped by /reload-agent, polled by every worker)
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS agent_versions (
+                name VARCHAR PRIMARY KEY,
+                version BIGINT NOT NULL DEFAULT 0,
+                requested_at TIMESTAMP DEFAULT NOW()
+            )
+        """))
+        print("✅ Agent versions table created")
+
+        # Create precomputed AI Studio template answers, versioned by the user's data version
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS template_insights (
+                user_id VARCHAR REFERENCES Users(user_id) ON DELETE CASCADE,
+                template_id VARCHAR(50) NOT NULL,
+                data_version BIGINT NOT NULL,
+                answer TEXT NOT NULL,
+                duration_ms INTEGER,
+                computed_at TIMESTAMP DEFAULT NOW(),
+                PRIMARY KEY (user_id, template_id)
+            )
+        """))
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS template_insight_claims (
+                user_id VARCHAR PRIMARY KEY REFERENCES Users(user_id) ON DELETE CASCADE,
+                claimed_at TIMESTAMP NOT NULL DEFAULT NOW()
+            )
+        """))
+        print("✅ Template insights tables created")
+
+        # Create on-demand request profiles (profiler report plus SQL and LLM timings)
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS request_profiles (
+                id VARCHAR(32) PRIMARY KEY,
+                created_at TIMESTAMP DEFAULT NOW(),
+                method VARCHAR(10) NOT NULL,
+                path VARCHAR NOT NULL,
+                query VARCHAR,
+                status INTEGER,
+                duration_ms FLOAT,
+                profiler VARCHAR(20),
+                report TEXT,
+                sql JSONB,
+                llm JSONB
+            )
+        """))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS request_profiles_created_idx ON request_profiles (created_at DESC)"))
+        print("✅ Request profiles table created")
+
+        # Create the log of statements run by the SQL agent, fingerprinted for the slow-query report
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS agent_query_log (
+                id BIGSERIAL PRIMARY KEY,
+                created_at TIMESTAMP DEFAULT NOW(),
+                turn_id VARCHAR(32),
+                user_id VARCHAR,
+                question TEXT,
+                tool_input TEXT,
+                statement TEXT NOT NULL,
+                fingerprint VARCHAR(16) NOT NULL,
+                normalized TEXT NOT NULL,
+                duration_ms FLOAT NOT NULL,
+                row_count INTEGER,
+                error TEXT,
+                attempt INTEGER NOT NULL DEFAULT 1,
+                retry BOOLEAN NOT NULL DEFAULT FALSE
+            )
+        """))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS agent_query_log_created_idx ON agent_query_log (created_at)"))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS agent_query_log_fingerprint_idx ON agent_query_log (fingerprint, created_at)"))
+        print("✅ Agent query log table created")
         
         conn.commit()
         print("\n🎉 Schema creation complete!")
@@ -1,8 +1,13 @@
 import json
+import datetime
 import sqlalchemy # type: ignore
 import urllib.parse
 import os
 from dotenv import load_dotenv
+from services.data_version import bump_data_version
+from services.partitions import ensure_transaction_partitions
+from services.categorizer import categorize_batch
+from services.anomalies import score_transactions
 
 # Load environment variables from .env file
 load_dotenv()
@@ -33,6 +38,11 @@ def insert_data():
         # Use a transaction to ensure all or nothing is inserted
         with conn.begin() as transaction:
             try:
+                # Give every month in the file its own Transactions partition (no-op if unpartitioned)
+                dates = [datetime.date.fromisoformat(t['date']) for user in data for t in user.get('transactions') or []]
+                if dates:
+                    ensure_transaction_partitions(conn, min(dates), max(dates))
+
                 for user in data:
                     print(f"Processing user: {user['name']}")
 
@@ -52,10 +62,17 @@ def insert_data():
 
                     # Step B: Insert into the Transactions table
                     if 'transactions' in user and user['transactions']:
+                        # Raw statement lines often come without a category; fill them in
+                        uncategorized = [t for t in user['transactions'] if not t.get('category')]
+                        for trans, category in zip(uncategorized, categorize_batch(uncategorized)):
+                            trans['category'] = category
+
+                        score_transactions(conn, user['user_id'], sorted(user['transactions'], key=lambda t: str(t['date'])))
+
                         trans_stmt = sqlalchemy.text(
                             """
-                            INSERT INTO Transactions (user_id, date, description, category, amount, type)
-                            VALUES (:user_id, :date, :description, :category, :amount, :type)
+                            INSERT INTO Transactions (user_id, date, description, category, amount, type, anomaly_score, is_anomaly)
+                            VALUES (:user_id, :date, :description, :category, :amount, :type, :anomaly_score, :is_anomaly)
                             """
                         )
                         for trans in user['transactions']:
@@ -93,6 +110,9 @@ def insert_data():
                         )
                         for inv in user['investments']:
                             conn.execute(inv_stmt, {"user_id": user['user_id'], **inv})
+
+                    # Step F: Invalidate cached dashboard responses (ETags) for this user
+                    bump_data_version(conn, user['user_id'], "*")
                 
                 print("\n[SUCCESS] Data insertion successful!")
             except Exception as e:
@@ -2,66 +2,113 @@
 
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 import sqlalchemy
-import traceback
+import asyncio
 from contextlib import asynccontextmanager
-from slowapi import _rate_limit_exceeded_handler
-from slowapi.errors import RateLimitExceeded
 
-from api.v1.router import api_router
-from services.ai_agent import init_agent # This now returns two things
+from api.v1.router import api_router, live_router
+from services.agent_registry import agent_registry
+from services.ai_jobs import ai_job_manager
+from services.data_version import record_response_size
+from services.readiness import init_agent_in_background, readiness_report
+from services.partitions import maintain_partitions
+from services.account_purge import run_account_purges
+from services.subscriptions import run_subscription_refresh
+from services.template_insights import insight_pipeline
+from services.executors import work_executor
+from services.agent_sql_log import agent_query_log
+from services.profiling import ProfilingMiddleware, PROFILE_ID_HEADER, PROFILE_SAMPLE_HZ, stack_sampler
+from services.change_feed import change_feed
 from config.database import get_engine
-from config.rate_limiter import limiter
+from config.compression import CompressionMiddleware
+from config.replicas import ConsistencyTokenMiddleware, CONSISTENCY_HEADER, replica_router
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     print("Server is starting up...")
-    try:
-        # CHANGED: init_agent now returns the executor and a session history manager
-        agent_executor, session_manager = init_agent()
-        app.state.agent_executor = agent_executor
-        app.state.get_session_history = session_manager
-        print("Startup complete. Conversational Agent is attached to app state.")
-    except Exception as e:
-        print(f"CRITICAL ERROR during startup AI initialization: {e}")
-        print(f"Full traceback: {traceback.format_exc()}")
-        app.state.agent_executor = None
-        app.state.get_session_history = None
-    
+    # The agent is built in the background; until then the AI endpoints answer 503 and /readyz reports it.
+    agent_init = asyncio.create_task(init_agent_in_background(agent_registry.build, agent_registry.swap))
+    agent_registry.start()
+    partition_maintenance = asyncio.create_task(maintain_partitions())
+    replica_monitor = asyncio.create_task(replica_router.monitor()) if replica_router.enabled else None
+    account_purges = asyncio.create_task(run_account_purges())
+    subscription_refresh = asyncio.create_task(run_subscription_refresh())
+    template_insights = asyncio.create_task(insight_pipeline.run())
+    agent_sql_logging = asyncio.create_task(agent_query_log.run())
+
+    work_executor.start()
+    change_feed.start()
+    ai_job_manager.start()
+    stack_sampler.bind(app)
+    stack_sampler.start(PROFILE_SAMPLE_HZ)
     yield
     print(" shutting down...")
+    agent_init.cancel()
+    partition_maintenance.cancel()
+    account_purges.cancel()
+    subscription_refresh.cancel()
+    template_insights.cancel()
+    agent_sql_logging.cancel()
+    if replica_monitor:
+        replica_monitor.cancel()
+    await change_feed.stop()
+    await agent_registry.stop()
+    await ai_job_manager.stop()
+    await work_executor.stop()
+    stack_sampler.stop()
 
 # --- The rest of your main.py file remains the same ---
 app = FastAPI(
     title="AI Personal Finance Assistant",
     description="An API that allows natural language questions about financial data.",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
-# Add rate limiter to app state
-app.state.limiter = limiter
-app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
-
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:3000", "http://localhost:5173"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-RateLimit-Limit", "X-RateLimit-Remaining", "X-RateLimit-Reset", "Retry-After", CONSISTENCY_HEADER, PROFILE_ID_HEADER],
 )
 
+# Gzip (or brotli, when installed) above COMPRESSION_MIN_SIZE; SSE streams are left alone.
+app.add_middleware(CompressionMiddleware)
+
+# Read-your-writes: a client that sends back the token from its last write reads at least that write.
+app.add_middleware(ConsistencyTokenMiddleware)
+
+# Admin-only: a request carrying the profiling token runs under a profiler (see services/profiling.py).
+app.add_middleware(ProfilingMiddleware)
+
 @app.middleware("http")
 async def add_security_headers(request: Request, call_next):
     response = await call_next(request)
     response.headers["Cross-Origin-Opener-Policy"] = "same-origin-allow-popups"
     response.headers["Cross-Origin-Resource-Policy"] = "cross-origin"
+    if "etag" in response.headers and "content-length" in response.headers:
+        record_response_size(response.headers["etag"], int(response.headers["content-length"]))
     return response
 
 @app.get("/")
 def health_check():
     return {"status": "✅ API is running. Navigate to /docs for API documentation."}
 
+@app.get("/livez")
+def livez():
+    """Liveness: the process is up and serving. Never touches the database."""
+    return {"status": "alive"}
+
+@app.get("/readyz")
+def readyz():
+    """Readiness: database reachable (and the AI agent built, if READYZ_REQUIRE_AGENT is set)."""
+    ready, report = readiness_report()
+    return report if ready else ORJSONResponse(status_code=503, content=report)
+
 @app.get("/ping-db")
 def ping_db():
     try:
@@ -72,6 +119,7 @@ def ping_db():
         raise HTTPException(status_code=500, detail=f"❌ Database connection failed: {e}")
 
 app.include_router(api_router, prefix="/api/v1")
+app.include_router(live_router, prefix="/api/v1")
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,203 @@
+"""
+Online migration of Transactions to a monthly range-partitioned table.
+
+Run the steps in order (each one is safe to re-run), or all of them with `run`:
+
+    python migrate_partition_transactions.py prepare         # partitioned copy + trigger mirroring new writes
+    python migrate_partition_transactions.py backfill        # copy existing rows in batches
+    python migrate_partition_transactions.py verify          # per-month row counts and sums must match
+    python migrate_partition_transactions.py swap            # brief write lock, rename, done
+    python migrate_partition_transactions.py check-pruning   # EXPLAIN the dashboard period queries
+    python migrate_partition_transactions.py cleanup         # drop the old table once you are happy
+
+The API keeps reading and writing Transactions throughout; only `swap` blocks writes, for as long
+as a count check and three renames take.
+"""
+
+import sys
+import json
+import time
+import datetime
+import argparse
+from sqlalchemy import text
+from dateutil.relativedelta import relativedelta
+from config.database import get_engine
+from services.partitions import PARTITION_MONTHS_AHEAD, ENSURE_PARTITIONS_FUNCTION, is_partitioned, period_start
+
+NEW_TABLE = "transactions_partitioned"
+OLD_TABLE = "transactions_unpartitioned"
+
+MIRROR_TRIGGER = f"""
+CREATE OR REPLACE FUNCTION transactions_mirror() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        DELETE FROM {NEW_TABLE} WHERE id = OLD.id;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO {NEW_TABLE} SELECT NEW.* ON CONFLICT DO NOTHING;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+MONTHLY_TOTALS = """
+    SELECT DATE_TRUNC('month', date) AS month, COUNT(*), ROUND(SUM(amount)::numeric, 2)
+    FROM {table} GROUP BY 1 ORDER BY 1
+"""
+
+
+def month_starts(first: datetime.date, last: datetime.date):
+    month = first.replace(day=1)
+    while month <= last:
+        yield month
+        month += relativedelta(months=1)
+
+
+def prepare(conn):
+    """Creates the partitioned table with partitions spanning the existing data, and the mirror trigger."""
+    if is_partitioned(conn):
+        print("✅ Transactions is already partitioned, nothing to do.")
+        return False
+    conn.execute(text(f"""
+        CREATE TABLE IF NOT EXISTS {NEW_TABLE} (
+            LIKE transactions INCLUDING DEFAULTS,
+            PRIMARY KEY (id, date),
+            CONSTRAINT transactions_user_id_fkey FOREIGN KEY (user_id) REFERENCES Users(user_id) ON DELETE CASCADE
+        ) PARTITION BY RANGE (date)
+    """))
+    conn.execute(text(f"CREATE TABLE IF NOT EXISTS transactions_default PARTITION OF {NEW_TABLE} DEFAULT"))
+
+    first, last = conn.execute(text("SELECT MIN(date), MAX(date) FROM transactions")).fetchone()
+    today = datetime.date.today()
+    first = min(first or today, today)
+    last = max(last or today, today + relativedelta(months=PARTITION_MONTHS_AHEAD))
+    for month in month_starts(first, last):
+        conn.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS transactions_y{month:%Y}m{month:%m} PARTITION OF {NEW_TABLE}
+            FOR VALUES FROM ('{month}') TO ('{month + relativedelta(months=1)}')
+        """))
+    conn.execute(text(f"CREATE INDEX IF NOT EXISTS transactions_user_date_idx ON {NEW_TABLE} (user_id, date)"))
+
+    conn.execute(text(MIRROR_TRIGGER))
+    conn.execute(text("DROP TRIGGER IF EXISTS transactions_mirror ON transactions"))
+    conn.execute(text("""
+        CREATE TRIGGER transactions_mirror AFTER INSERT OR UPDATE OR DELETE ON transactions
+        FOR EACH ROW EXECUTE FUNCTION transactions_mirror()
+    """))
+    conn.commit()
+    print(f"✅ {NEW_TABLE} created with monthly partitions {first:%Y-%m}..{last:%Y-%m}; new writes are mirrored.")
+    return True
+
+
+def backfill(conn, batch_size: int, pause: float, start_id: int = 0):
+    """Copies existing rows in id order. FOR SHARE makes concurrent updates wait for the batch, so the trigger always wins."""
+    max_id = conn.execute(text("SELECT MAX(id) FROM transactions")).scalar() or 0
+    last_id = start_id
+    copied = 0
+    started = time.monotonic()
+    while last_id < max_id:
+        upper = last_id + batch_size
+        result = conn.execute(text(f"""
+            INSERT INTO {NEW_TABLE}
+            SELECT * FROM transactions WHERE id > :lower AND id <= :upper FOR SHARE
+            ON CONFLICT DO NOTHING
+        """), {"lower": last_id, "upper": upper})
+        conn.commit()
+        copied += result.rowcount
+        last_id = upper
+        print(f"   ... ids up to {min(upper, max_id)} of {max_id} ({copied} rows copied, {time.monotonic() - started:.0f}s)")
+        time.sleep(pause)
+    print(f"✅ Backfill complete: {copied} rows copied.")
+
+
+def verify(conn) -> bool:
+    old = conn.execute(text(MONTHLY_TOTALS.format(table="transactions"))).fetchall()
+    new = conn.execute(text(MONTHLY_TOTALS.format(table=NEW_TABLE))).fetchall()
+    mismatched = sorted(set(old).symmetric_difference(new), key=lambda row: row[0])
+    for month, count, total in mismatched:
+        print(f"   ❌ {month:%Y-%m}: count={count} sum={total}")
+    print("✅ Per-month counts and sums match." if not mismatched else f"❌ {len(mismatched)} month(s) differ.")
+    return not mismatched
+
+
+def swap(conn):
+    """Blocks writes (not reads) just long enough to confirm the copy and rename the tables."""
+    conn.execute(text("SET LOCAL lock_timeout = '5s'"))
+    conn.execute(text("LOCK TABLE transactions IN EXCLUSIVE MODE"))
+    old_count = conn.execute(text("SELECT COUNT(*) FROM transactions")).scalar_one()
+    new_count = conn.execute(text(f"SELECT COUNT(*) FROM {NEW_TABLE}")).scalar_one()
+    if old_count != new_count:
+        conn.rollback()
+        print(f"❌ Row counts differ ({old_count} vs {new_count}); run backfill and verify again.")
+        return False
+    conn.execute(text("DROP TRIGGER transactions_mirror ON transactions"))
+    conn.execute(text(f"ALTER TABLE transactions RENAME TO {OLD_TABLE}"))
+    conn.execute(text(f"ALTER TABLE {NEW_TABLE} RENAME TO transactions"))
+    # The id sequence belongs to the old table; hand it over so dropping the old table keeps it.
+    conn.execute(text("ALTER SEQUENCE transactions_id_seq OWNED BY transactions.id"))
+    conn.execute(text("DROP FUNCTION transactions_mirror()"))
+    conn.execute(text(ENSURE_PARTITIONS_FUNCTION))
+    conn.commit()
+    print(f"✅ Swapped: Transactions is partitioned; the old table is kept as {OLD_TABLE}.")
+    return True
+
+
+def scanned_relations(plan: dict) -> list:
+    names = [plan["Relation Name"]] if "Relation Name" in plan else []
+    for child in plan.get("Plans", []):
+        names += scanned_relations(child)
+    return names
+
+
+def check_pruning(conn) -> bool:
+    """EXPLAINs the dashboard period queries for every period and checks only that window's partitions are scanned."""
+    from api.v1.endpoints.dashboard import PERIOD_MONTHS, SPENDING_TREND_SQL, SAVINGS_TREND_SQL
+    total = conn.execute(text("SELECT COUNT(*) FROM pg_inherits WHERE inhparent = 'transactions'::regclass")).scalar_one()
+    user_id = conn.execute(text("SELECT user_id FROM transactions LIMIT 1")).scalar() or "user_001"
+    ok = True
+    for period, months in PERIOD_MONTHS.items():
+        for name, query in (("spending", SPENDING_TREND_SQL), ("savings", SAVINGS_TREND_SQL)):
+            plan = conn.execute(text("EXPLAIN (FORMAT JSON) " + query.text), {"user_id": user_id, "since": period_start(months)}).scalar_one()
+            plan = (json.loads(plan) if isinstance(plan, str) else plan)[0]["Plan"]
+            scanned = sorted(set(scanned_relations(plan)))
+            # The window's months, the month it starts in, and the DEFAULT and future partitions.
+            allowed = months + 2 + PARTITION_MONTHS_AHEAD
+            pruned = len(scanned) <= allowed
+            ok &= pruned
+            print(f"   {'✅' if pruned else '❌'} {period:<8} {name:<9} scans {len(scanned)} of {total} partitions")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("step", choices=["prepare", "backfill", "verify", "swap", "check-pruning", "cleanup", "run"])
+    parser.add_argument("--batch-size", type=int, default=50000)
+    parser.add_argument("--pause", type=float, default=0.1, help="Seconds to sleep between backfill batches.")
+    parser.add_argument("--start-id", type=int, default=0, help="Resume an interrupted backfill after this id.")
+    args = parser.parse_args()
+
+    engine = get_engine()
+    with engine.connect() as conn:
+        if args.step in ("prepare", "run"):
+            if not prepare(conn) and args.step == "run":
+                return check_pruning(conn)
+        if args.step in ("backfill", "run"):
+            backfill(conn, args.batch_size, args.pause, args.start_id)
+        if args.step in ("verify", "run"):
+            if not verify(conn):
+                return False
+        if args.step in ("swap", "run"):
+            if not swap(conn):
+                return False
+        if args.step in ("check-pruning", "run"):
+            return check_pruning(conn)
+        if args.step == "cleanup":
+            conn.execute(text(f"DROP TABLE IF EXISTS {OLD_TABLE}"))
+            conn.commit()
+            print(f"🗑️ Dropped {OLD_TABLE}.")
+    return True
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -5,4 +5,64 @@ from pydantic import BaseModel
 class QueryRequest(BaseModel):
     """Model for the AI agent's question request."""
     question: str
-    user_id: str
\ No newline at end of file
+    user_id: str
+    async_mode: bool = False  # Return a job id immediately instead of waiting for the answer
+
+# --- Dashboard response models ---
+# Declared as response_model so FastAPI serializes them with pydantic-core instead of walking
+# the payload through jsonable_encoder.
+
+class DashboardSummary(BaseModel):
+    total_assets: float
+    total_liabilities: float
+    investment_portfolio: float
+    epf_balance: float
+    credit_score: int
+
+class RecentTransaction(BaseModel):
+    date: str
+    description: str | None = None
+    category: str | None = None
+    amount: float
+
+class Transaction(RecentTransaction):
+    type: str | None = None
+
+class TransactionsPage(BaseModel):
+    transactions: list[Transaction]
+    totalCount: int
+    totalPages: int
+    currentPage: int
+
+class TransactionSearchPage(BaseModel):
+    transactions: list[Transaction]
+    nextCursor: str | None = None
+
+class TransactionAnomaly(Transaction):
+    anomaly_score: float
+
+class Subscription(BaseModel):
+    merchant_key: str
+    description: str | None = None
+    category: str | None = None
+    type: str
+    amount: float
+    average_amount: float
+    period: str
+    occurrences: int
+    first_date: str
+    last_date: str
+    next_expected: str
+    confidence: float
+    status: str
+
+class ChartSeries(BaseModel):
+    labels: list[str]
+    data: list[float]
+
+class DashboardCharts(BaseModel):
+    spending_chart: ChartSeries
+    savings_chart: ChartSeries
+    investment_chart: ChartSeries
+    allocation_chart: ChartSeries
+    period: str
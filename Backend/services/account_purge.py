@@ -0,0 +1,146 @@
+# /services/account_purge.py
+
+import os
+import time
+import asyncio
+import sqlalchemy
+from config.database import engine
+from services.data_version import bump_data_version
+
+# Rows deleted per statement (and per transaction), and the pause between batches.
+PURGE_BATCH_SIZE = int(os.environ.get("PURGE_BATCH_SIZE", "5000"))
+PURGE_BATCH_PAUSE = float(os.environ.get("PURGE_BATCH_PAUSE", "0.05"))
+PURGE_POLL_SECONDS = float(os.environ.get("PURGE_POLL_SECONDS", "30"))
+# A running purge not updated for this long (its worker died) is picked up again; failed ones are retried after it too.
+PURGE_STALE_SECONDS = int(os.environ.get("PURGE_STALE_SECONDS", "600"))
+
+# Child tables purged before the Users row; all have a serial `id` and an index on user_id.
+PURGE_TABLES = ["Transactions", "Assets", "Liabilities", "Investments"]
+
+
+def request_account_deletion(conn, user_id: str) -> bool:
+    """
+    Marks the user deleted (hidden from every read from now on) and queues the purge of their
+    data. Runs in the caller's transaction; commit it. False if there is no such active user.
+    """
+    deleted = conn.execute(
+        sqlalchemy.text("UPDATE Users SET deleted_at = NOW() WHERE user_id = :user_id AND deleted_at IS NULL"),
+        {"user_id": user_id}
+    ).rowcount
+    if not deleted:
+        return False
+    conn.execute(
+        sqlalchemy.text("""
+            INSERT INTO account_purges (user_id, status, requested_at) VALUES (:user_id, 'pending', NOW())
+            ON CONFLICT (user_id) DO UPDATE SET status = 'pending', requested_at = NOW(),
+                started_at = NULL, finished_at = NULL, rows_deleted = 0, error = NULL
+        """),
+        {"user_id": user_id}
+    )
+    bump_data_version(conn, user_id, "users")
+    return True
+
+
+def get_purge_status(user_id: str) -> dict | None:
+    with engine.connect() as conn:
+        row = conn.execute(
+            sqlalchemy.text("""
+                SELECT status, requested_at, started_at, finished_at, rows_deleted, current_table, error
+                FROM account_purges WHERE user_id = :user_id
+            """),
+            {"user_id": user_id}
+        ).mappings().fetchone()
+    if not row:
+        return None
+    return {k: (v.isoformat() if hasattr(v, "isoformat") else v) for k, v in row.items()}
+
+
+def _claim_next(conn) -> str | None:
+    user_id = conn.execute(sqlalchemy.text("""
+        UPDATE account_purges SET status = 'running', started_at = COALESCE(started_at, NOW()), heartbeat_at = NOW()
+        WHERE user_id = (
+            SELECT user_id FROM account_purges
+            WHERE status = 'pending'
+               OR (status IN ('running', 'failed') AND heartbeat_at < NOW() - make_interval(secs => :stale))
+            ORDER BY requested_at
+            LIMIT 1
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING user_id
+    """), {"stale": PURGE_STALE_SECONDS}).scalar()
+    conn.commit()
+    return user_id
+
+
+def purge_account(conn, user_id: str) -> int:
+    """Deletes the user's rows table by table in bounded batches, then the user. Resumable."""
+    total = 0
+    for table in PURGE_TABLES:
+        while True:
+            deleted = conn.execute(
+                sqlalchemy.text(f"""
+                    DELETE FROM {table} WHERE id IN (
+                        SELECT id FROM {table} WHERE user_id = :user_id LIMIT :batch_size
+                    )
+                """),
+                {"user_id": user_id, "batch_size": PURGE_BATCH_SIZE}
+            ).rowcount
+            conn.execute(
+                sqlalchemy.text("""
+                    UPDATE account_purges SET rows_deleted = rows_deleted + :deleted, current_table = :table,
+                        heartbeat_at = NOW()
+                    WHERE user_id = :user_id
+                """),
+                {"deleted": deleted, "table": table, "user_id": user_id}
+            )
+            conn.commit()
+            total += deleted
+            if deleted < PURGE_BATCH_SIZE:
+                break
+            time.sleep(PURGE_BATCH_PAUSE)
+
+    # Anything written between the batches goes with the user through the cascading foreign keys.
+    conn.execute(sqlalchemy.text("DELETE FROM Users WHERE user_id = :user_id AND deleted_at IS NOT NULL"), {"user_id": user_id})
+    conn.execute(sqlalchemy.text("DELETE FROM user_data_versions WHERE user_id = :user_id"), {"user_id": user_id})
+    conn.execute(
+        sqlalchemy.text("""
+            UPDATE account_purges SET status = 'done', finished_at = NOW(), current_table = NULL
+            WHERE user_id = :user_id
+        """),
+        {"user_id": user_id}
+    )
+    conn.commit()
+    return total
+
+
+def purge_pending_accounts() -> int:
+    """Purges queued accounts one at a time until none are left. Blocking. Returns how many were purged."""
+    purged = 0
+    with engine.connect() as conn:
+        while (user_id := _claim_next(conn)) is not None:
+            started = time.monotonic()
+            try:
+                rows = purge_account(conn, user_id)
+            except Exception as e:
+                conn.rollback()
+                conn.execute(
+                    sqlalchemy.text("UPDATE account_purges SET status = 'failed', error = :error WHERE user_id = :user_id"),
+                    {"error": str(e), "user_id": user_id}
+                )
+                conn.commit()
+                print(f"❌ [PURGE] Purging account {user_id} failed: {e}")
+                continue
+            purged += 1
+            print(f"🗑️ [PURGE] Account {user_id} purged: {rows} rows in {time.monotonic() - started:.1f}s.")
+    return purged
+
+
+async def run_account_purges():
+    """Background task: purges accounts queued by delete-account. Cancel it on shutdown."""
+    while True:
+        try:
+            if engine:
+                await asyncio.to_thread(purge_pending_accounts)
+        except Exception as e:
+            print(f"⚠️ [PURGE] Account purge run failed: {e}")
+        await asyncio.sleep(PURGE_POLL_SECONDS)
@@ -0,0 +1,235 @@
+# /services/agent_registry.py
+
+import os
+import time
+import asyncio
+import threading
+import sqlalchemy
+from config.database import engine, get_engine
+from config.replicas import replica_router
+from services.ai_agent import init_agent, run_chat_turn, current_user_id
+
+# Sent through a freshly built agent before it takes traffic. Empty disables the warm-up.
+AGENT_WARMUP_QUESTION = os.environ.get("AGENT_WARMUP_QUESTION", "Reply with the single word OK.")
+# How often each worker checks the shared agent version for reloads requested on another worker.
+AGENT_RELOAD_POLL_SECONDS = float(os.environ.get("AGENT_RELOAD_POLL_SECONDS", "10"))
+# A retired bundle still serving requests after this long has its engine disposed anyway.
+AGENT_DRAIN_TIMEOUT = float(os.environ.get("AGENT_DRAIN_TIMEOUT", "300"))
+
+
+class AgentBundle:
+    """One built agent and the engine it owns. Counts the chat turns currently using it."""
+
+    def __init__(self, version: int, agent_executor, get_session_history, db_engine, build_seconds: float):
+        self.version = version
+        self.agent_executor = agent_executor
+        self.get_session_history = get_session_history
+        self.db_engine = db_engine
+        self.build_seconds = build_seconds
+        self.built_at = time.time()
+        self.in_flight = 0
+        self.retired_at = None
+        self.disposed = False
+
+    def dispose(self):
+        if not self.disposed:
+            self.disposed = True
+            self.db_engine.dispose()
+            print(f"♻️ [AGENT] Bundle v{self.version} drained, engine disposed.")
+
+    def to_dict(self) -> dict:
+        return {
+            "version": self.version,
+            "in_flight": self.in_flight,
+            "built_at": self.built_at,
+            "build_seconds": round(self.build_seconds, 2),
+            "retired_at": self.retired_at,
+            "disposed": self.disposed,
+        }
+
+
+class AgentRegistry:
+    """
+    Holds the agent bundle that serves chat turns and replaces it without downtime.
+
+    A reload builds a new bundle (engine, SQLDatabase reflection, agents) in a worker thread,
+    runs a warm-up question through it and only then swaps it in under a lock. Each chat turn
+    leases the bundle that was current when it started, so it runs start to finish on one
+    consistent agent. The previous bundle is retired and its engine disposed once its last
+    lease is returned. Reloads go through the shared `agent_versions` row, which every worker
+    polls, so a reload requested on one worker reaches all of them.
+    """
+
+    def __init__(self):
+        self.current = None
+        self._lock = threading.Lock()
+        self._retired = []
+        self._build_task = None
+        self._building_version = None
+        self._watch_task = None
+        self._table_ready = False
+        self.last_error = None
+
+    # --- Serving ---
+
+    def run_chat_turn(self, user_id: str, question: str, remember: bool = True, cancelled=None) -> dict:
+        """Runs one chat turn on the current bundle. Blocking; submit it through the LLM scheduler."""
+        with self._lock:
+            bundle = self.current
+            if bundle is None:
+                raise RuntimeError("AI Agent is not initialized.")
+            bundle.in_flight += 1
+        try:
+            return run_chat_turn(bundle.agent_executor, bundle.get_session_history, user_id, question, remember, cancelled)
+        finally:
+            with self._lock:
+                bundle.in_flight -= 1
+                drained = bundle.retired_at is not None and bundle.in_flight == 0
+            if drained:
+                bundle.dispose()
+
+    # --- Building and swapping ---
+
+    def build(self, version: int | None = None) -> AgentBundle:
+        """Builds and warms up a bundle. Blocking. With no version, builds the latest shared one."""
+        if version is None:
+            version = self._read_shared_version()
+        started = time.monotonic()
+        # The SQL agent only reads, so it goes to the replicas when there are any.
+        db_engine = replica_router.create_read_engine() or get_engine()
+        try:
+            agent_executor, get_session_history = init_agent(db_engine)
+            if AGENT_WARMUP_QUESTION:
+                token = current_user_id.set(None)
+                try:
+                    agent_executor.invoke({"input": AGENT_WARMUP_QUESTION, "user_context": "", "chat_history": []})
+                finally:
+                    current_user_id.reset(token)
+        except Exception:
+            db_engine.dispose()
+            raise
+        print(f"🧱 [AGENT] Bundle v{version} built and warmed up in {time.monotonic() - started:.1f}s.")
+        return AgentBundle(version, agent_executor, get_session_history, db_engine, time.monotonic() - started)
+
+    def swap(self, bundle: AgentBundle):
+        """Makes `bundle` current and retires the previous one."""
+        with self._lock:
+            previous = self.current
+            if previous is not None and previous.version > bundle.version:
+                # A newer bundle won the race; this one is stale.
+                stale = True
+            else:
+                stale = False
+                self.current = bundle
+                if previous is not None:
+                    previous.retired_at = time.time()
+                    self._retired.append(previous)
+            drained = previous is not None and not stale and previous.in_flight == 0
+        if stale:
+            bundle.dispose()
+            return
+        print(f"🔁 [AGENT] Now serving bundle v{bundle.version}.")
+        if drained:
+            previous.dispose()
+
+    def reload(self, version: int) -> bool:
+        """Starts building `version` in the background unless it (or a newer one) is already current or building."""
+        if self.current is not None and self.current.version >= version:
+            return False
+        if self._build_task and not self._build_task.done() and self._building_version >= version:
+            return False
+        self._building_version = version
+        self._build_task = asyncio.create_task(self._build_and_swap(version))
+        return True
+
+    async def wait_for_build(self) -> bool:
+        """Waits for the running build, if any. False if it failed."""
+        if self._build_task:
+            return await asyncio.shield(self._build_task)
+        return True
+
+    async def _build_and_swap(self, version: int) -> bool:
+        try:
+            bundle = await asyncio.to_thread(self.build, version)
+        except Exception as e:
+            self.last_error = str(e)
+            print(f"❌ [AGENT] Building bundle v{version} failed, still serving v{self.current.version if self.current else None}: {e}")
+            return False
+        self.last_error = None
+        self.swap(bundle)
+        return True
+
+    # --- Cross-worker reloads ---
+
+    def _ensure_table(self, conn):
+        if not self._table_ready:
+            conn.execute(sqlalchemy.text("""
+                CREATE TABLE IF NOT EXISTS agent_versions (
+                    name VARCHAR PRIMARY KEY,
+                    version BIGINT NOT NULL DEFAULT 0,
+                    requested_at TIMESTAMP DEFAULT NOW()
+                )
+            """))
+            self._table_ready = True
+
+    def request_reload(self) -> int:
+        """Bumps the shared agent version. Blocking. Every worker picks the new version up."""
+        with engine.connect() as conn:
+            self._ensure_table(conn)
+            version = conn.execute(sqlalchemy.text("""
+                INSERT INTO agent_versions (name, version, requested_at) VALUES ('default', 1, NOW())
+                ON CONFLICT (name) DO UPDATE SET version = agent_versions.version + 1, requested_at = NOW()
+                RETURNING version
+            """)).scalar_one()
+            conn.commit()
+        return version
+
+    def _read_shared_version(self) -> int:
+        try:
+            with engine.connect() as conn:
+                self._ensure_table(conn)
+                version = conn.execute(sqlalchemy.text("SELECT version FROM agent_versions WHERE name = 'default'")).scalar()
+                conn.commit()
+            return version or 0
+        except Exception as e:
+            print(f"⚠️ [AGENT] Could not read the shared agent version: {e}")
+            return self.current.version if self.current else 0
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(AGENT_RELOAD_POLL_SECONDS)
+            if self.current is not None:
+                version = await asyncio.to_thread(self._read_shared_version)
+                if self.reload(version):
+                    print(f"📡 [AGENT] Reload to v{version} requested by another worker.")
+            self._sweep_retired()
+
+    def _sweep_retired(self):
+        now = time.time()
+        with self._lock:
+            overdue = [b for b in self._retired if not b.disposed and now - b.retired_at > AGENT_DRAIN_TIMEOUT]
+            self._retired = [b for b in self._retired if not b.disposed and b not in overdue]
+        for bundle in overdue:
+            print(f"⚠️ [AGENT] Bundle v{bundle.version} still has {bundle.in_flight} turns after {AGENT_DRAIN_TIMEOUT:.0f}s, disposing anyway.")
+            bundle.dispose()
+
+    def start(self):
+        """Starts the reload watcher. Must be called from the running event loop."""
+        self._watch_task = asyncio.create_task(self._watch())
+
+    async def stop(self):
+        for task in (self._watch_task, self._build_task):
+            if task and not task.done():
+                task.cancel()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "current": self.current.to_dict() if self.current else None,
+                "building_version": self._building_version if self._build_task and not self._build_task.done() else None,
+                "retired": [b.to_dict() for b in self._retired if not b.disposed],
+                "last_error": self.last_error,
+            }
+
+
+agent_registry = AgentRegistry()
@@ -0,0 +1,265 @@
+# /services/agent_sql_log.py
+
+import os
+import re
+import time
+import uuid
+import asyncio
+import hashlib
+import threading
+import functools
+import contextvars
+from collections import deque
+import sqlalchemy
+from config.database import engine
+from services import sql_guard
+
+# Statements buffered between flushes; past this the oldest unflushed ones are dropped.
+AGENT_SQL_LOG_BUFFER = int(os.environ.get("AGENT_SQL_LOG_BUFFER", "5000"))
+AGENT_SQL_LOG_FLUSH_SECONDS = float(os.environ.get("AGENT_SQL_LOG_FLUSH_SECONDS", "5"))
+AGENT_SQL_LOG_RETENTION_DAYS = int(os.environ.get("AGENT_SQL_LOG_RETENTION_DAYS", "30"))
+# A fingerprint run this often, by this many users, is reported as a fast-path template candidate.
+AGENT_SQL_CANDIDATE_MIN_COUNT = int(os.environ.get("AGENT_SQL_CANDIDATE_MIN_COUNT", "20"))
+AGENT_SQL_CANDIDATE_MIN_USERS = int(os.environ.get("AGENT_SQL_CANDIDATE_MIN_USERS", "3"))
+AGENT_SQL_CANDIDATE_MAX_ERROR_RATE = 0.2
+
+# The chat turn the SQL agent is working for: user, question, and how its statements went so far.
+current_turn = contextvars.ContextVar("agent_sql_turn", default=None)
+
+
+def start_turn(user_id: str | None, question: str):
+    """Marks the start of a chat turn; returns the token to reset it with."""
+    return current_turn.set({"turn_id": uuid.uuid4().hex, "user_id": user_id, "question": question,
+                             "tool_input": None, "statements": 0, "errors": 0})
+
+
+def set_tool_input(tool_input: str):
+    """The sub-question the chat agent handed to the SQL agent (one turn can ask several)."""
+    turn = current_turn.get()
+    if turn is not None:
+        turn["tool_input"] = tool_input
+
+
+# --- Fingerprints ---
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_SPACE = re.compile(r"\s+")
+_PUNCTUATION = re.compile(r" ?([=<>!,()+\-*/]) ?")
+_IN_LIST = re.compile(r"\(\?(?:,\?)+\)")
+
+
+def normalize_sql(statement: str) -> str:
+    """The statement's shape: literals replaced by ?, IN lists collapsed, case and whitespace folded."""
+    shape = _STRING.sub("?", statement)
+    shape = _NUMBER.sub("?", shape)
+    shape = _PUNCTUATION.sub(r"\1", _SPACE.sub(" ", shape))
+    shape = _IN_LIST.sub("(?+)", shape)
+    return shape.strip().rstrip(";").strip().lower()
+
+
+def fingerprint_sql(statement: str) -> tuple[str, str]:
+    """(fingerprint, normalized statement); statements differing only in literals share a fingerprint."""
+    normalized = normalize_sql(statement)
+    return hashlib.sha1(normalized.encode()).hexdigest()[:16], normalized
+
+
+# --- Recording ---
+
+class AgentQueryLog:
+    """
+    Records every statement the SQL agent runs: time, row count, error, its attempt number
+    within the chat turn (statements after a failed one are the agent's retries) and the
+    question behind it. Entries are buffered in memory and written in batches by a background
+    task, so the agent never waits on the log.
+    """
+
+    def __init__(self):
+        self._buffer = deque(maxlen=AGENT_SQL_LOG_BUFFER)
+        self._lock = threading.Lock()
+        self._pruned_at = 0.0
+        self.stats = {"recorded": 0, "flushed": 0, "dropped": 0, "flush_errors": 0, "rejected": 0}
+
+    def record(self, statement: str, seconds: float, row_count: int | None, error: str | None):
+        turn = current_turn.get() or {}
+        fingerprint, normalized = fingerprint_sql(statement)
+        retry = bool(turn.get("errors"))
+        if turn:
+            turn["statements"] += 1
+            turn["errors"] += error is not None
+        entry = {
+            "turn_id": turn.get("turn_id"), "user_id": turn.get("user_id"), "question": turn.get("question"),
+            "tool_input": turn.get("tool_input"), "statement": statement, "fingerprint": fingerprint,
+            "normalized": normalized, "duration_ms": round(seconds * 1000, 2), "row_count": row_count,
+            "error": error[:1000] if error else None, "attempt": turn.get("statements", 1), "retry": retry,
+        }
+        with self._lock:
+            if len(self._buffer) == self._buffer.maxlen:
+                self.stats["dropped"] += 1
+            self._buffer.append(entry)
+        self.stats["recorded"] += 1
+
+    def flush(self) -> int:
+        """Writes the buffered entries. Blocking."""
+        with self._lock:
+            entries = list(self._buffer)
+            self._buffer.clear()
+        if not entries:
+            return 0
+        try:
+            with engine.connect() as conn:
+                conn.execute(
+                    sqlalchemy.text("""
+                        INSERT INTO agent_query_log (turn_id, user_id, question, tool_input, statement, fingerprint,
+                                                     normalized, duration_ms, row_count, error, attempt, retry)
+                        VALUES (:turn_id, :user_id, :question, :tool_input, :statement, :fingerprint,
+                                :normalized, :duration_ms, :row_count, :error, :attempt, :retry)
+                    """),
+                    entries
+                )
+                if time.monotonic() - self._pruned_at > 3600:
+                    self._pruned_at = time.monotonic()
+                    conn.execute(
+                        sqlalchemy.text("DELETE FROM agent_query_log WHERE created_at < NOW() - make_interval(days => :days)"),
+                        {"days": AGENT_SQL_LOG_RETENTION_DAYS}
+                    )
+                conn.commit()
+        except Exception:
+            self.stats["flush_errors"] += 1
+            with self._lock:
+                # Put them back (oldest first) for the next attempt; the buffer bound still applies.
+                self._buffer.extendleft(reversed(entries))
+            raise
+        self.stats["flushed"] += len(entries)
+        return len(entries)
+
+    async def run(self):
+        """Background task: flushes the buffer every AGENT_SQL_LOG_FLUSH_SECONDS. Cancel it on shutdown."""
+        try:
+            while True:
+                await asyncio.sleep(AGENT_SQL_LOG_FLUSH_SECONDS)
+                try:
+                    if engine:
+                        await asyncio.to_thread(self.flush)
+                except Exception as e:
+                    print(f"⚠️ [AGENT SQL] Writing the query log failed: {e}")
+        finally:
+            if engine and self._buffer:
+                try:
+                    self.flush()
+                except Exception:
+                    pass
+
+    def status(self) -> dict:
+        return {"buffered": len(self._buffer), **self.stats}
+
+
+agent_query_log = AgentQueryLog()
+
+
+@functools.cache
+def _logged_database_class():
+    from langchain_community.utilities import SQLDatabase
+
+    class LoggedSQLDatabase(SQLDatabase):
+        """
+        SQLDatabase that records every statement the agent runs in the agent query log and, with
+        AGENT_SQL_GUARD_ENABLED, runs it through the SQL guard first (see services.sql_guard).
+        """
+
+        def _execute(self, command, fetch="all", **kwargs):
+            started = time.perf_counter()
+            try:
+                if sql_guard.AGENT_SQL_GUARD_ENABLED and isinstance(command, str) and fetch != "cursor":
+                    command, result = self._guarded_execute(command, fetch, **kwargs)
+                else:
+                    result = super()._execute(command, fetch, **kwargs)
+            except Exception as e:
+                if isinstance(e, sql_guard.QueryRejectedError):
+                    agent_query_log.stats["rejected"] += 1
+                    print(f"🛡️ [AGENT SQL] {e}")
+                agent_query_log.record(str(command), time.perf_counter() - started, None, str(e).split("\n")[0])
+                raise
+            rows = len(result) if isinstance(result, (list, tuple)) else None
+            agent_query_log.record(str(command), time.perf_counter() - started, rows, None)
+            return result
+
+        def _guarded_execute(self, command: str, fetch: str, parameters=None, execution_options=None):
+            """Checked, read-only, time-limited run of an agent statement. Returns (statement run, rows)."""
+            turn = current_turn.get() or {}
+            with self._engine.begin() as connection:
+                statement, cursor = sql_guard.guarded_execute(connection, command, turn.get("user_id"), parameters)
+                rows = cursor.fetchall() if fetch == "all" else cursor.fetchmany(1)
+                return statement, [row._asdict() for row in rows]
+
+    return LoggedSQLDatabase
+
+
+def logged_sql_database(db_engine):
+    """
+    A LangChain SQLDatabase over `db_engine` whose statements are logged. Only the user data
+    tables (sql_guard.AGENT_SQL_TABLES) are shown to the agent.
+    """
+    return _logged_database_class()(db_engine, include_tables=list(sql_guard.AGENT_SQL_TABLES))
+
+
+# --- Report ---
+
+def slow_query_report(conn, days: int = 7, order: str = "total", limit: int = 20) -> list[dict]:
+    """
+    Agent statement fingerprints over the last `days`, ranked by total time (slow x frequent),
+    p95 time or count. Shapes repeated across users with few errors are marked as candidates
+    for a parameterized fast-path template, which would answer them without an agent run.
+    """
+    order_by = {"total": "total_ms", "p95": "p95_ms", "count": "executions"}[order]
+    rows = conn.execute(
+        sqlalchemy.text(f"""
+            SELECT fingerprint, MIN(normalized), COUNT(*) AS executions, COUNT(DISTINCT user_id),
+                   SUM(duration_ms) AS total_ms, AVG(duration_ms),
+                   percentile_cont(0.5) WITHIN GROUP (ORDER BY duration_ms),
+                   percentile_cont(0.95) WITHIN GROUP (ORDER BY duration_ms) AS p95_ms,
+                   MAX(duration_ms), AVG(row_count), COUNT(error), COUNT(*) FILTER (WHERE retry),
+                   (ARRAY_AGG(statement ORDER BY created_at DESC))[1],
+                   (ARRAY_AGG(question ORDER BY created_at DESC) FILTER (WHERE question IS NOT NULL))[1],
+                   MAX(created_at)
+            FROM agent_query_log
+            WHERE created_at >= NOW() - make_interval(days => :days)
+            GROUP BY fingerprint
+            ORDER BY {order_by} DESC
+            LIMIT :limit
+        """),
+        {"days": days, "limit": limit}
+    ).fetchall()
+    report = []
+    for r in rows:
+        executions, users, errors = r[2], r[3], r[10]
+        error_rate = errors / executions if executions else 0.0
+        candidate = (executions >= AGENT_SQL_CANDIDATE_MIN_COUNT and users >= AGENT_SQL_CANDIDATE_MIN_USERS
+                     and error_rate <= AGENT_SQL_CANDIDATE_MAX_ERROR_RATE)
+        report.append({
+            "fingerprint": r[0], "normalized": r[1], "executions": executions, "users": users,
+            "total_ms": round(float(r[4]), 1), "avg_ms": round(float(r[5]), 2), "p50_ms": round(float(r[6]), 2),
+            "p95_ms": round(float(r[7]), 2), "max_ms": round(float(r[8]), 2),
+            "avg_rows": round(float(r[9]), 1) if r[9] is not None else None,
+            "errors": errors, "error_rate": round(error_rate, 3), "retries": r[11],
+            "sample_statement": r[12], "sample_question": r[13], "last_seen": r[14].isoformat(),
+            "fast_path_candidate": candidate,
+        })
+    return report
+
+
+def recent_statements(conn, limit: int = 50, user_id: str | None = None) -> list[dict]:
+    rows = conn.execute(
+        sqlalchemy.text("""
+            SELECT created_at, turn_id, user_id, question, tool_input, statement, fingerprint,
+                   duration_ms, row_count, error, attempt, retry
+            FROM agent_query_log
+            WHERE CAST(:user_id AS VARCHAR) IS NULL OR user_id = :user_id
+            ORDER BY id DESC
+            LIMIT :limit
+        """),
+        {"user_id": user_id, "limit": limit}
+    ).fetchall()
+    keys = ("created_at", "turn_id", "user_id", "question", "tool_input", "statement", "fingerprint",
+            "duration_ms", "row_count", "error", "attempt", "retry")
+    return [{**dict(zip(keys, r)), "created_at": r[0].isoformat()} for r in rows]
@@ -1,84 +1,94 @@
 # /services/ai_agent.py
 
-import os
-import time
-from collections import deque
-from langchain_groq import ChatGroq
-from langchain_community.utilities import SQLDatabase
-from langchain_community.agent_toolkits import create_sql_agent
-from langchain_classic.agents import AgentExecutor, create_openai_tools_agent
-from langchain_core.tools import Tool
-from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain_community.chat_message_histories import ChatMessageHistory
+import threading
+import contextvars
 
 from config.database import get_engine
+from services.permissions import get_user_permissions, format_permission_instructions
+from services.subscriptions import get_user_subscriptions, summarize_subscriptions
+from services.agent_sql_log import logged_sql_database, start_turn, set_tool_input, current_turn
 
-# Groq has generous rate limits, so we don't need a custom rate limiter here.
+# Provider selection, failover and hedging live in services/llm_router.py.
+# The LangChain stack is imported inside the functions below: it takes most of a second to load,
+# and the API should be serving (and answering /livez) before the agent is built.
 
 session_histories = {}
 
-def get_session_history(session_id: str) -> ChatMessageHistory:
-    """Gets the chat history for a given session ID."""
-    if session_id not in session_histories:
-        session_histories[session_id] = ChatMessageHistory()
-    return session_histories[session_id]
 
-def init_agent():
-    """Initializes and returns a conversational agent with SQL tools and memory."""
-    if "GROQ_API_KEY" not in os.environ or not os.environ["GROQ_API_KEY"]:
-        raise ValueError("Error: GROQ_API_KEY environment variable not set or empty.")
-
-    print("Initializing Conversational AI Agent with Groq...")
-    
-    llm = ChatGroq(
-        model="llama-3.3-70b-versatile",
-        temperature=0,
-        groq_api_key=os.environ.get("GROQ_API_KEY")
-    )
-    db_engine = get_engine()
-    db = SQLDatabase(db_engine)
+class TurnCancelledError(Exception):
+    """Raised by run_chat_turn when its caller cancelled the turn; nothing is written to the history."""
 
-    # Create SQL agent with user-aware prompt
-    sql_agent_prefix = """You are an agent designed to interact with a SQL database.
-Given an input question, create a syntactically correct postgresql query to run, then look at the results of the query and return the answer.
 
-CRITICAL SECURITY AND EFFICIENCY RULES:
-1. You are answering questions for a SPECIFIC user identified by their user_id.
-2. ALWAYS include 'WHERE user_id = '{user_id}'' in your SQL queries for these tables: assets, investments, liabilities, transactions
-3. The 'users' table does not need the WHERE filter when you're looking up user information by user_id.
-4. NEVER query data from other users. This is a security requirement.
-5. If you don't know which user_id to use, you MUST ask for clarification before running any query.
+# The user the current chat turn is answering for. Set by run_chat_turn, read by the database tool.
+current_user_id = contextvars.ContextVar("current_user_id", default=None)
 
-Unless the user specifies a specific number of examples they wish to obtain, always limit your query to at most 10 results.
-You can order the results by a relevant column to return the most interesting examples in the database.
-Never query for all the columns from a specific table, only ask for the relevant columns given the question.
-You have access to tools for interacting with the database.
-Only use the given tools. Only use the information returned by the tools to construct your final answer.
-You MUST double check your query before executing it. If you get an error while executing a query, rewrite the query and try again.
+# The user_id scoping rule is stated here once; the tool prefixes every question with the user_id.
+SQL_AGENT_PREFIX = """You are an agent designed to interact with a SQL database.
+Given an input question, create a syntactically correct {dialect} query to run, then look at the results of the query and return the answer.
 
-DO NOT make any DML statements (INSERT, UPDATE, DELETE, DROP etc.) to the database.
+CRITICAL SECURITY AND EFFICIENCY RULES:
+1. Every question starts with "[user_id: ...]". ALWAYS filter the assets, investments, liabilities and transactions tables with WHERE user_id = '<that user_id>', and look up the users table by that user_id. NEVER query data from other users.
+2. Unless the question asks for a specific number of examples, limit your query to at most {top_k} results, ordered by a relevant column.
+3. Only select the columns relevant to the question.
+4. Double check your query before executing it. If you get an error, rewrite the query and try again.
+5. DO NOT make any DML statements (INSERT, UPDATE, DELETE, DROP etc.) to the database.
 
+Only use the information returned by the tools to construct your final answer.
 If the question does not seem related to the database, just return "I don't know" as the answer.
 """
-    
-    sql_agent_suffix = """Begin!
 
-Question: {input}
-Thought: I should look at the tables in the database to see what I can query. Then I should query the schema of the most relevant tables.
-{agent_scratchpad}"""
+SYSTEM_PROMPT = """
+    You are FinAI, a specialized financial data analyst. 🤖
+
+    **Your Core Directive:**
+    Your primary function is to answer questions by analyzing the user's personal financial data, which you access through a secure tool.
+
+    **CRITICAL RULES OF ENGAGEMENT:**
+    1.  **ALWAYS Use the Tools:** For ANY question that is related to the user's personal finances (spending, assets, investments, budgeting, analysis, etc.), your first action MUST be to use the `financial_database_tool`, or the `recurring_payments_tool` for recurring bills, subscriptions and regular income.
+    2.  **NO General Knowledge:** Do not answer financial questions from your general knowledge. Ground all financial answers in the data retrieved from the tool.
+    3.  **NO Clarifying Questions First:** Do not ask the user for clarification on a financial question. First, use the tool to retrieve all potentially relevant data. If you still need more information after analyzing the data, you can then ask a question.
+    4.  **Handle Out-of-Scope:** If the question is clearly NOT related to personal finance (e.g., "What's the weather?"), you must politely decline and state your purpose. Example: "As FinAI, I can only help with your financial data. How can I assist with that? 📊"
+    5.  **Tool Abstraction:** Never mention your tools. Describe your actions naturally (e.g., "I analyzed your spending records...").
+    """
+
+def get_session_history(session_id: str):
+    """Gets the chat history for a given session ID."""
+    from langchain_community.chat_message_histories import ChatMessageHistory
+    if session_id not in session_histories:
+        session_histories[session_id] = ChatMessageHistory()
+    return session_histories[session_id]
+
+def init_agent(db_engine=None):
+    """
+    Initializes and returns a conversational agent with SQL tools and memory.
+    Pass `db_engine` to own the engine (and dispose it) yourself; otherwise a new one is created.
+    """
+    print("Initializing Conversational AI Agent...")
+    from langchain_community.agent_toolkits import create_sql_agent
+    from langchain_classic.agents import AgentExecutor, create_openai_tools_agent
+    from langchain_core.tools import Tool
+    from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+    from services.llm_router import build_chat_model
+
+    llm = build_chat_model()
+    # Every statement the SQL agent runs is recorded in the agent query log (services/agent_sql_log.py).
+    db = logged_sql_database(db_engine or get_engine())
 
     sql_agent_executor = create_sql_agent(
         llm, 
         db=db, 
         agent_type="openai-tools", 
         verbose=True,
-        prefix=sql_agent_prefix,
-        suffix=sql_agent_suffix
+        prefix=SQL_AGENT_PREFIX,
     )
 
+    def query_financial_database(question: str):
+        set_tool_input(question)
+        return sql_agent_executor.invoke({"input": f"[user_id: {current_user_id.get()}] {question}"})
+
     financial_database_tool = Tool(
         name="financial_database_tool",
-        func=sql_agent_executor.invoke,
+        func=query_financial_database,
         description="""
         Use this tool for any questions about the user's personal financial data.
         It can answer questions about transactions, spending, income, assets, investments, liabilities, credit score, and EPF balance.
@@ -86,25 +96,29 @@ Thought: I should look at the tables in the database to see what I can query. Th
         IMPORTANT: This tool automatically filters data to show only the requesting user's information.
         """,
     )
-    tools = [financial_database_tool]
 
-    # --- FINAL, MOST FORCEFUL SYSTEM PROMPT ---
-    system_prompt = """
-    You are FinAI, a specialized financial data analyst. 🤖
+    def list_recurring_payments(_: str = ""):
+        user_id = current_user_id.get()
+        if not get_user_permissions(user_id).get("perm_transactions"):
+            return "I'm sorry, I don't have access to that data."
+        return summarize_subscriptions(get_user_subscriptions(user_id))
 
-    **Your Core Directive:**
-    Your primary function is to answer questions by analyzing the user's personal financial data, which you access through a secure tool.
-
-    **CRITICAL RULES OF ENGAGEMENT:**
-    1.  **ALWAYS Use the Tool:** For ANY question that is related to the user's personal finances (spending, assets, investments, budgeting, analysis, etc.), your first and only initial action MUST be to use the `financial_database_tool`.
-    2.  **NO General Knowledge:** Do not answer financial questions from your general knowledge. Ground all financial answers in the data retrieved from the tool.
-    3.  **NO Clarifying Questions First:** Do not ask the user for clarification on a financial question. First, use the tool to retrieve all potentially relevant data. If you still need more information after analyzing the data, you can then ask a question.
-    4.  **Handle Out-of-Scope:** If the question is clearly NOT related to personal finance (e.g., "What's the weather?"), you must politely decline and state your purpose. Example: "As FinAI, I can only help with your financial data. How can I assist with that? 📊"
-    5.  **Tool Abstraction:** Never mention your tools. Describe your actions naturally (e.g., "I analyzed your spending records...").
-    """
+    # Answers from the detector's stored results: one cheap call instead of several SQL round trips.
+    recurring_payments_tool = Tool(
+        name="recurring_payments_tool",
+        func=list_recurring_payments,
+        description="""
+        Use this tool first for questions about recurring bills, subscriptions, EMIs, regular income or fixed monthly costs
+        (for example when optimizing a budget or analyzing spending patterns).
+        It lists the user's detected recurring payments with amount, period (weekly/monthly/...), next expected date
+        and confidence, plus the monthly total of recurring expenses. It takes no input.
+        """,
+    )
+    tools = [financial_database_tool, recurring_payments_tool]
 
+    # The per-user context sits in the system message so the whole prefix is identical from turn to turn.
     prompt = ChatPromptTemplate.from_messages([
-        ("system", system_prompt),
+        ("system", SYSTEM_PROMPT + "{user_context}"),
         MessagesPlaceholder(variable_name="chat_history"),
         ("human", "{input}"),
         MessagesPlaceholder(variable_name="agent_scratchpad"),
@@ -120,4 +134,71 @@ Thought: I should look at the tables in the database to see what I can query. Th
     )
 
     print("Conversational AI Agent is created with a data-first, forceful prompt.")
-    return agent_executor, get_session_history
\ No newline at end of file
+    return agent_executor, get_session_history
+
+def extract_answer_text(final_answer) -> str:
+    """Normalizes the agent output, which some Gemini/LangChain versions return as a list of parts."""
+    if isinstance(final_answer, list):
+        extracted_text = []
+        for item in final_answer:
+            if isinstance(item, dict) and 'text' in item:
+                extracted_text.append(item['text'])
+            elif isinstance(item, str):
+                extracted_text.append(item)
+        return "\n".join(extracted_text)
+    if not isinstance(final_answer, str):
+        return str(final_answer) if final_answer is not None else "I'm sorry, I couldn't generate a response."
+    return final_answer
+
+def run_chat_turn(agent_executor, get_session_history, user_id: str, question: str, remember: bool = True,
+                  cancelled: threading.Event | None = None) -> dict:
+    """
+    Runs one permission-aware conversational turn and records it in the user's chat history. Blocking.
+    With remember=False the turn neither sees nor joins the history (precomputed template insights).
+    Once `cancelled` is set (an AI job cancelled while it runs) the agent is not started, or its
+    answer is not written to the history; raises TurnCancelledError.
+    """
+    from services.prompt_builder import build_agent_prompt
+    from langchain_community.chat_message_histories import ChatMessageHistory
+    chat_history = get_session_history(user_id) if remember else ChatMessageHistory()
+    permissions = get_user_permissions(user_id)
+    permission_instructions = format_permission_instructions(permissions)
+
+    print(f"📝 [AI CHAT] User Question: {question}")
+    print(f"🛡️ [AI CHAT] Permissions enforced: {permissions}")
+
+    agent_prompt = build_agent_prompt(SYSTEM_PROMPT, user_id, permission_instructions, question, chat_history.messages)
+    print(f"🧮 [AI CHAT] Prompt budget: {agent_prompt.report}")
+
+    agent_input = {
+        "input": agent_prompt.question,
+        "user_context": agent_prompt.user_context,
+        "chat_history": agent_prompt.chat_history,
+    }
+
+    if cancelled is not None and cancelled.is_set():
+        raise TurnCancelledError("The chat turn was cancelled before the agent ran.")
+    print(f"⚙️ [AI CHAT] Calling LangChain Agent Executor...")
+    token = current_user_id.set(user_id)
+    turn = start_turn(user_id, question)
+    try:
+        response = agent_executor.invoke(agent_input)
+    finally:
+        current_turn.reset(turn)
+        current_user_id.reset(token)
+    final_answer = response.get("output")
+    print(f"✨ [AI CHAT] Agent execution complete. Raw output type: {type(final_answer)}")
+    final_answer = extract_answer_text(final_answer)
+
+    if cancelled is not None and cancelled.is_set():
+        print(f"🚫 [AI CHAT] Turn cancelled while the agent ran, not recording it for {user_id}.")
+        raise TurnCancelledError("The chat turn was cancelled while the agent ran.")
+    chat_history.add_user_message(question)
+    chat_history.add_ai_message(final_answer)
+
+    return {
+        "user_id": user_id,
+        "question": question,
+        "answer": final_answer,
+        "permissions_enforced": permissions
+    }
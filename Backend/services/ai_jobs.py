@@ -0,0 +1,185 @@
+# /services/ai_jobs.py
+
+import os
+import json
+import time
+import uuid
+import asyncio
+import threading
+from dataclasses import dataclass, field
+from services.agent_registry import agent_registry
+from services.llm_scheduler import llm_scheduler, SchedulerFullError, Priority
+
+AI_JOB_WORKERS = int(os.environ.get("AI_JOB_WORKERS", "4"))
+AI_JOB_MAX_PENDING = int(os.environ.get("AI_JOB_MAX_PENDING", "200"))
+AI_JOB_RESULT_TTL = int(os.environ.get("AI_JOB_RESULT_TTL", "900"))  # seconds a finished job stays pollable
+SSE_HEARTBEAT_SECONDS = 15
+
+TERMINAL_STATUSES = {"succeeded", "failed", "cancelled"}
+
+
+class JobQueueFullError(Exception):
+    """Raised when too many jobs are already waiting for a worker."""
+
+
+@dataclass
+class AIJob:
+    job_id: str
+    user_id: str
+    question: str
+    status: str = "queued"  # queued -> running -> succeeded | failed | cancelled
+    result: dict | None = None
+    error: str | None = None
+    created_at: float = field(default_factory=time.time)
+    finished_at: float | None = None
+    task: asyncio.Task | None = field(default=None, repr=False)
+    # Set on cancel: the chat turn's thread cannot be interrupted, but it checks this before
+    # starting the agent and before writing the turn to the user's history.
+    cancelled: threading.Event = field(default_factory=threading.Event, repr=False)
+    subscribers: list = field(default_factory=list, repr=False)
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.job_id,
+            "user_id": self.user_id,
+            "question": self.question,
+            "status": self.status,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class AIJobManager:
+    """
+    Runs chat turns on a fixed pool of asyncio workers so the HTTP request can return a job id at once.
+
+    Each worker hands its job to the LLM scheduler, so the worker count only bounds how many
+    jobs are being pursued; the provider-facing concurrency is still the scheduler's cap.
+    Finished jobs are kept for AI_JOB_RESULT_TTL seconds and then forgotten.
+    """
+
+    def __init__(self, workers: int = AI_JOB_WORKERS, max_pending: int = AI_JOB_MAX_PENDING, result_ttl: int = AI_JOB_RESULT_TTL):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.result_ttl = result_ttl
+        self._jobs = {}
+        self._queue = None
+        self._tasks = []
+        self._stopping = False
+
+    def start(self):
+        """Starts the workers and the expiry sweeper. Must be called from the running event loop."""
+        self._queue = asyncio.Queue()
+        self._stopping = False
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._expire_finished()))
+        print(f"🧵 AI job pool started with {self.workers} workers.")
+
+    async def stop(self):
+        self._stopping = True
+        for job in self._jobs.values():
+            if job.status not in TERMINAL_STATUSES:
+                self.cancel(job)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, user_id: str, question: str) -> AIJob:
+        if self._queue is None:
+            raise RuntimeError("AI job pool is not running.")
+        if self._queue.qsize() >= self.max_pending:
+            raise JobQueueFullError("Too many AI jobs are waiting. Please try again shortly.")
+        job = AIJob(job_id=uuid.uuid4().hex, user_id=user_id, question=question)
+        self._jobs[job.job_id] = job
+        self._queue.put_nowait(job)
+        return job
+
+    def get(self, job_id: str) -> AIJob | None:
+        return self._jobs.get(job_id)
+
+    def cancel(self, job: AIJob) -> bool:
+        """Cancels a queued or running job. Returns False if it had already finished."""
+        if job.status in TERMINAL_STATUSES:
+            return False
+        job.cancelled.set()
+        if job.task and not job.task.done():
+            # The worker notices the cancelled task and records the final status.
+            job.task.cancel()
+        else:
+            self._finish(job, "cancelled")
+        return True
+
+    async def event_stream(self, job: AIJob):
+        """Yields SSE frames for each status change of `job`, starting with its current state."""
+        queue = asyncio.Queue()
+        job.subscribers.append(queue)
+        try:
+            yield self._sse(job)
+            while job.status not in TERMINAL_STATUSES:
+                try:
+                    await asyncio.wait_for(queue.get(), timeout=SSE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield self._sse(job)
+        finally:
+            job.subscribers.remove(queue)
+
+    @staticmethod
+    def _sse(job: AIJob) -> str:
+        return f"event: {job.status}\ndata: {json.dumps(job.to_dict())}\n\n"
+
+    def _set_status(self, job: AIJob, status: str):
+        job.status = status
+        for queue in job.subscribers:
+            queue.put_nowait(status)
+
+    def _finish(self, job: AIJob, status: str):
+        job.finished_at = time.time()
+        self._set_status(job, status)
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            if job.status != "queued":
+                continue
+            self._set_status(job, "running")
+            job.task = asyncio.create_task(self._run(job))
+            try:
+                job.result = await job.task
+                self._finish(job, "succeeded")
+            except asyncio.CancelledError:
+                self._finish(job, "cancelled")
+                if self._stopping:
+                    raise
+            except Exception as e:
+                print(f"❌ [AI JOB] {job.job_id} failed: {e}")
+                job.error = str(e)
+                self._finish(job, "failed")
+
+    async def _run(self, job: AIJob) -> dict:
+        if agent_registry.current is None:
+            raise RuntimeError("AI Agent is not initialized.")
+        while True:
+            try:
+                return await llm_scheduler.submit(
+                    job.user_id, agent_registry.run_chat_turn, job.user_id, job.question, True, job.cancelled,
+                    priority=Priority.INTERACTIVE
+                )
+            except SchedulerFullError as e:
+                # Nobody is holding a connection open, so wait for the backlog instead of failing.
+                await asyncio.sleep(e.retry_after)
+
+    async def _expire_finished(self):
+        while True:
+            await asyncio.sleep(60)
+            cutoff = time.time() - self.result_ttl
+            expired = [job_id for job_id, job in self._jobs.items() if job.finished_at and job.finished_at < cutoff]
+            for job_id in expired:
+                del self._jobs[job_id]
+
+
+ai_job_manager = AIJobManager()
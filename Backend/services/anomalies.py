@@ -0,0 +1,114 @@
+# /services/anomalies.py
+
+import os
+import math
+import sqlalchemy
+
+# A transaction this many standard deviations above its category's running mean is flagged.
+ANOMALY_Z_THRESHOLD = float(os.environ.get("ANOMALY_Z_THRESHOLD", "3.0"))
+# Categories with fewer earlier transactions than this are never flagged (too little to compare with).
+ANOMALY_MIN_SAMPLES = int(os.environ.get("ANOMALY_MIN_SAMPLES", "5"))
+# Floor on the standard deviation as a share of the mean, so a category of identical amounts (rent)
+# flags a jump instead of dividing by zero, and a 2% change on it is not a 100-sigma event.
+ANOMALY_MIN_STDDEV_RATIO = float(os.environ.get("ANOMALY_MIN_STDDEV_RATIO", "0.05"))
+
+
+def welford_update(count: int, mean: float, m2: float, value: float) -> tuple[int, float, float]:
+    """One step of Welford's online algorithm; the variance is m2 / count."""
+    count += 1
+    delta = value - mean
+    mean += delta / count
+    m2 += delta * (value - mean)
+    return count, mean, m2
+
+
+def z_score(count: int, mean: float, m2: float, value: float) -> float | None:
+    """How unusual `value` is against the statistics so far; None while there are too few samples."""
+    if count < ANOMALY_MIN_SAMPLES:
+        return None
+    stddev = max(math.sqrt(max(m2, 0.0) / count), abs(mean) * ANOMALY_MIN_STDDEV_RATIO, 0.01)
+    return (value - mean) / stddev
+
+
+def score_transactions(conn, user_id: str, transactions: list[dict]):
+    """
+    Sets `anomaly_score` and `is_anomaly` on each transaction dict (scored against the user's
+    running statistics for its category before it is counted) and folds the amounts into those
+    statistics. O(1) per transaction: one statistics row per category is read and written, no
+    history is scanned. Locks the rows until the caller commits, so concurrent writes for the
+    same category are counted one after the other; run it on the write's own connection.
+    """
+    for transaction in transactions:
+        transaction["anomaly_score"], transaction["is_anomaly"] = None, False
+    categories = sorted({t["category"] for t in transactions if t.get("category")})
+    if not categories:
+        return
+    params = {"user_id": user_id, **{f"category_{i}": c for i, c in enumerate(categories)}}
+    placeholders = ", ".join(f":category_{i}" for i in range(len(categories)))
+    conn.execute(
+        sqlalchemy.text(f"""
+            INSERT INTO category_stats (user_id, category, count, mean, m2)
+            SELECT :user_id, c, 0, 0, 0 FROM unnest(ARRAY[{placeholders}]::varchar[]) AS c
+            ON CONFLICT (user_id, category) DO NOTHING
+        """),
+        params
+    )
+    stats = {
+        row[0]: (row[1], row[2], row[3])
+        for row in conn.execute(
+            sqlalchemy.text(f"""
+                SELECT category, count, mean, m2 FROM category_stats
+                WHERE user_id = :user_id AND category IN ({placeholders})
+                ORDER BY category
+                FOR UPDATE
+            """),
+            params
+        )
+    }
+
+    for transaction in transactions:
+        category = transaction.get("category")
+        if not category or transaction.get("amount") is None:
+            continue
+        value = abs(float(transaction["amount"]))
+        score = z_score(*stats[category], value)
+        transaction["anomaly_score"] = round(score, 2) if score is not None else None
+        transaction["is_anomaly"] = score is not None and score >= ANOMALY_Z_THRESHOLD
+        stats[category] = welford_update(*stats[category], value)
+
+    conn.execute(
+        sqlalchemy.text("""
+            UPDATE category_stats SET count = :count, mean = :mean, m2 = :m2, updated_at = NOW()
+            WHERE user_id = :user_id AND category = :category
+        """),
+        [{"user_id": user_id, "category": c, "count": s[0], "mean": s[1], "m2": s[2]} for c, s in stats.items()]
+    )
+
+
+# Seeds the statistics from transactions written before they were kept (population variance * n = M2).
+REBUILD_CATEGORY_STATS_SQL = """
+    INSERT INTO category_stats (user_id, category, count, mean, m2)
+    SELECT user_id, category, COUNT(*), AVG(ABS(amount)), COALESCE(VAR_POP(ABS(amount)) * COUNT(*), 0)
+    FROM Transactions
+    GROUP BY user_id, category
+    ON CONFLICT (user_id, category) DO NOTHING
+"""
+
+
+def get_anomalies(conn, user_id: str, limit: int = 20) -> list[dict]:
+    """The user's flagged transactions, newest first (served by the partial index on flagged rows)."""
+    rows = conn.execute(
+        sqlalchemy.text("""
+            SELECT date, description, category, amount, type, anomaly_score
+            FROM Transactions
+            WHERE user_id = :user_id AND is_anomaly
+            ORDER BY date DESC, id DESC
+            LIMIT :limit
+        """),
+        {"user_id": user_id, "limit": limit}
+    ).fetchall()
+    return [
+        {"date": str(row[0]), "description": row[1], "category": row[2], "amount": float(row[3]), "type": row[4],
+         "anomaly_score": float(row[5])}
+        for row in rows
+    ]
@@ -0,0 +1,196 @@
+# /services/cache.py
+
+import os
+import time
+import asyncio
+import datetime
+import threading
+from collections import OrderedDict
+import orjson
+from services.change_feed import change_feed
+
+CACHE_LOCAL_SIZE = int(os.environ.get("CACHE_LOCAL_SIZE", "2048"))
+# Keys already change with the data version and the date; the TTL only bounds memory held by idle users.
+CACHE_TTL = int(os.environ.get("CACHE_TTL", "3600"))
+# Shared tier across workers. Left empty, each worker only has its own LRU.
+CACHE_REDIS_URL = os.environ.get("CACHE_REDIS_URL", "")
+# How long other workers wait on a key another worker is already computing.
+CACHE_LOCK_TIMEOUT = float(os.environ.get("CACHE_LOCK_TIMEOUT", "10"))
+
+
+class LocalLRU:
+    """Per-worker LRU with a TTL on each entry."""
+
+    def __init__(self, max_size: int, ttl: int):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, predicate) -> int:
+        """Drops the entries whose key matches `predicate`. Returns how many."""
+        with self._lock:
+            keys = [key for key in self._entries if predicate(key)]
+            for key in keys:
+                del self._entries[key]
+        return len(keys)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RedisTier:
+    """Shared tier in Redis. Values are stored as orjson bytes; a short NX lock marks a key being computed."""
+
+    def __init__(self, url: str, ttl: int):
+        import redis
+        self.client = redis.Redis.from_url(url, socket_timeout=0.5)
+        self.ttl = ttl
+
+    def get(self, key: str):
+        raw = self.client.get(key)
+        return orjson.loads(raw) if raw is not None else None
+
+    def set(self, key: str, value):
+        self.client.set(key, orjson.dumps(value), ex=self.ttl)
+
+    def try_lock(self, key: str) -> bool:
+        return bool(self.client.set(f"{key}:lock", b"1", nx=True, px=int(CACHE_LOCK_TIMEOUT * 1000)))
+
+    def unlock(self, key: str):
+        self.client.delete(f"{key}:lock")
+
+
+class TwoTierCache:
+    """
+    Read-through cache: the worker's LRU first, then the shared tier, then `compute`.
+
+    Concurrent misses on the same key are coalesced. Within a worker the first caller computes
+    and the rest await its result; across workers the one holding the Redis lock computes while
+    the others poll the shared tier until the value appears or CACHE_LOCK_TIMEOUT passes.
+    A failing shared tier is skipped, never surfaced to the request.
+    """
+
+    def __init__(self, max_size: int = CACHE_LOCAL_SIZE, ttl: int = CACHE_TTL, redis_url: str = CACHE_REDIS_URL):
+        self.local = LocalLRU(max_size, ttl)
+        self.shared = None
+        if redis_url:
+            try:
+                self.shared = RedisTier(redis_url, ttl)
+            except ImportError:
+                print("⚠️ CACHE_REDIS_URL is set but the 'redis' package is not installed; using the local cache only.")
+        self._inflight = {}
+        self.stats = {"local_hits": 0, "shared_hits": 0, "misses": 0, "coalesced": 0, "shared_errors": 0}
+
+    async def get_or_compute(self, key: str, compute, *args):
+        """Returns the cached value for `key`, or runs the blocking `compute(*args)` in a thread and caches it."""
+        value = self.local.get(key)
+        if value is not None:
+            self.stats["local_hits"] += 1
+            return value
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.stats["coalesced"] += 1
+        else:
+            # The load runs in its own task, shared by every caller: one caller going away (client
+            # disconnect) cancels only its own wait, not the load the others are waiting on.
+            task = asyncio.create_task(self._load_and_store(key, compute, args))
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._loaded(key, done))
+        return await asyncio.shield(task)
+
+    def _loaded(self, key: str, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            # Mark the exception retrieved in case every caller went away before it was raised.
+            task.exception()
+
+    async def _load_and_store(self, key: str, compute, args):
+        value = await self._load(key, compute, args)
+        self.local.set(key, value)
+        return value
+
+    async def _load(self, key: str, compute, args):
+        if self.shared is None:
+            self.stats["misses"] += 1
+            return await asyncio.to_thread(compute, *args)
+
+        value = await self._shared_call(self.shared.get, key)
+        if value is not None:
+            self.stats["shared_hits"] += 1
+            return value
+
+        locked = await self._shared_call(self.shared.try_lock, key)
+        if locked is False:
+            deadline = time.monotonic() + CACHE_LOCK_TIMEOUT
+            while time.monotonic() < deadline:
+                await asyncio.sleep(0.05)
+                value = await self._shared_call(self.shared.get, key)
+                if value is not None:
+                    self.stats["coalesced"] += 1
+                    return value
+
+        self.stats["misses"] += 1
+        try:
+            value = await asyncio.to_thread(compute, *args)
+            await self._shared_call(self.shared.set, key, value)
+            return value
+        finally:
+            if locked:
+                await self._shared_call(self.shared.unlock, key)
+
+    async def _shared_call(self, func, *args):
+        try:
+            return await asyncio.to_thread(func, *args)
+        except Exception as e:
+            self.stats["shared_errors"] += 1
+            print(f"⚠️ Shared cache unavailable: {e}")
+            return None
+
+    def get_stats(self) -> dict:
+        lookups = self.stats["local_hits"] + self.stats["shared_hits"] + self.stats["misses"] + self.stats["coalesced"]
+        hits = lookups - self.stats["misses"]
+        return {
+            **self.stats,
+            "hit_rate": round(hits / lookups, 3) if lookups else None,
+            "local_entries": len(self.local),
+            "shared_tier": self.shared is not None,
+        }
+
+
+def chart_cache_key(chart: str, user_id: str, period: str, data_version: int) -> str:
+    """
+    Chart results only change when the user writes (data_version) or the date moves. The windows are
+    `CURRENT_DATE - INTERVAL`, so the key carries the date rather than just the month.
+    """
+    return f"chart:{chart}:{user_id}:{period}:v{data_version}:{datetime.date.today().isoformat()}"
+
+
+chart_cache = TwoTierCache()
+
+
+@change_feed.subscribe
+def drop_user_charts(event: dict):
+    """A write makes the user's cached charts unreachable (their key has the old version); free them now."""
+    chart_cache.local.invalidate(lambda key: key.split(":")[2:3] == [event["user_id"]])
@@ -0,0 +1,248 @@
+# /services/categorizer.py
+
+import os
+import re
+import bisect
+import statistics
+from collections import OrderedDict, defaultdict
+import sqlalchemy
+from services.executors import offload
+
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+# Recurring: the same description (digits and month names ignored) in this many distinct months,
+# with amounts within RECURRING_AMOUNT_TOLERANCE of their median.
+RECURRING_MIN_MONTHS = int(os.environ.get("RECURRING_MIN_MONTHS", "3"))
+RECURRING_AMOUNT_TOLERANCE = float(os.environ.get("RECURRING_AMOUNT_TOLERANCE", "0.15"))
+# Recurring expenses up to this amount are subscriptions; larger ones are bills (EMIs, rent, insurance).
+SUBSCRIPTION_MAX_AMOUNT = float(os.environ.get("SUBSCRIPTION_MAX_AMOUNT", "5000"))
+# Compiled automatons kept for users with override rules.
+CATEGORIZER_CACHE_SIZE = int(os.environ.get("CATEGORIZER_CACHE_SIZE", "256"))
+# Longest a batch may take to categorize in a worker process, in seconds.
+CATEGORIZE_TIMEOUT = float(os.environ.get("CATEGORIZE_TIMEOUT", "30"))
+
+# Category -> keywords. Keywords match whole words of the normalized description; a trailing `*`
+# matches any word starting with it. Longer keywords win over shorter ones ("gym membership" over
+# "membership"), and a user's own rules win over all of these.
+DEFAULT_RULES = {
+    "salary": ["salary", "payroll", "wages", "stipend"],
+    "bonus": ["bonus", "incentive"],
+    "freelance": ["freelance", "consulting", "upwork", "fiverr", "invoice payment"],
+    "income": ["refund", "cashback", "dividend", "interest credit", "interest earned"],
+    "rent": ["rent", "rent payment", "rent advance", "house rent", "lease", "maintenance charges"],
+    "utilities": ["electricity", "water bill", "gas bill", "utility", "utility bill", "internet", "broadband", "wifi",
+                  "recharge", "mobile bill", "postpaid", "airtel", "jio", "vodafone", "bsnl", "dth"],
+    "groceries": ["grocery", "groceries", "grocery shopping", "supermarket", "bigbasket", "blinkit", "zepto", "dmart", "vegetables",
+                  "fruits", "kirana"],
+    "dining": ["restaurant", "dining", "dinner", "lunch", "breakfast", "cafe", "coffee", "starbucks", "zomato",
+               "swiggy", "mcdonalds", "kfc", "domino*", "pizza", "food delivery", "bar"],
+    "transportation": ["fuel", "petrol", "diesel", "uber", "ola", "rapido", "taxi", "cab", "metro", "bus", "train",
+                       "irctc", "parking", "toll", "fastag"],
+    "healthcare": ["pharmacy", "medicine*", "medical", "doctor", "hospital", "clinic", "health*", "gym", "gym membership", "dental",
+                   "diagnostic*", "lab test"],
+    "entertainment": ["cinema", "movie*", "concert*", "netflix", "spotify", "prime video", "hotstar", "gaming",
+                      "bookmyshow", "subscription fee"],
+    "education": ["school", "school fees", "course*", "tuition", "college", "university", "udemy", "coursera",
+                  "book purchase", "books", "exam fee"],
+    "shopping": ["shopping", "clothing", "electronics", "amazon", "flipkart", "myntra", "ajio", "apparel", "mall"],
+    "subscriptions": ["subscription", "membership"],
+    "insurance": ["insurance", "lic", "policy premium"],
+}
+
+MONTH_WORDS = {"jan", "january", "feb", "february", "mar", "march", "apr", "april", "may", "jun", "june", "jul",
+               "july", "aug", "august", "sep", "sept", "september", "oct", "october", "nov", "november", "dec",
+               "december"}
+# Maps every ASCII byte except letters, digits and the NUL batch separator to a space.
+_WORD_BYTES = bytes(b if b >= 128 or b == 0 or chr(b).isalnum() else 32 for b in range(256))
+_DIGITS = re.compile(r"\d+")
+
+DEFAULT_RULE_PRIORITY = 1
+USER_RULE_PRIORITY = 2
+
+
+def normalize_many(descriptions: list[str | None]) -> list[str]:
+    """
+    Lowercased words separated by single spaces, padded with a space on both ends. The batch is
+    joined and mapped in one bytes.translate pass; bytes of non-ASCII characters count as letters.
+    """
+    joined = "\0".join(d.replace("\0", " ") if d else "" for d in descriptions)
+    lines = joined.lower().encode().translate(_WORD_BYTES).decode().split("\0")
+    return [" " + " ".join(line.split()) + " " for line in lines]
+
+
+def normalize(description: str | None) -> str:
+    return normalize_many([description])[0]
+
+
+def recurrence_key(normalized: str) -> str:
+    """The description without numbers or month names: 'Salary May' and 'Salary June' recur."""
+    return " ".join(w for w in _DIGITS.sub(" ", normalized).split() if w not in MONTH_WORDS)
+
+
+class _PyAutomaton:
+    """Pure-Python Aho-Corasick with the subset of pyahocorasick's API used here."""
+
+    def __init__(self):
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [[]]
+
+    def add_word(self, word: str, value):
+        state = 0
+        for char in word:
+            if char not in self.goto[state]:
+                self.goto.append({})
+                self.fail.append(0)
+                self.out.append([])
+                self.goto[state][char] = len(self.goto) - 1
+            state = self.goto[state][char]
+        self.out[state].append((len(word), value))
+
+    def make_automaton(self):
+        queue = list(self.goto[0].values())
+        for state in queue:
+            for char, child in self.goto[state].items():
+                queue.append(child)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(char, 0)
+                self.out[child] = self.out[child] + self.out[self.fail[child]]
+
+    def iter(self, text: str):
+        goto, fail, out = self.goto, self.fail, self.out
+        state = 0
+        for index, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for _, value in out[state]:
+                yield index, value
+
+
+class KeywordCategorizer:
+    """
+    All keyword rules compiled into one Aho-Corasick automaton, so a description is scanned once
+    whatever the number of rules. Uses pyahocorasick (C) when installed, else a pure-Python automaton.
+    """
+
+    def __init__(self, rules: list[tuple[str, str, int]]):
+        self.automaton = ahocorasick.Automaton() if ahocorasick else _PyAutomaton()
+        for keyword, category, priority in rules:
+            words = normalize(keyword.rstrip("*")).strip()
+            if not words:
+                continue
+            # Padding with spaces anchors matches to word boundaries; prefix rules leave the end open.
+            pattern = f" {words}" if keyword.endswith("*") else f" {words} "
+            self.automaton.add_word(pattern, (priority, len(words), category))
+        self.empty = not rules
+        if not self.empty:
+            self.automaton.make_automaton()
+
+    def match(self, normalized: str) -> str | None:
+        return self.match_many([normalized])[0]
+
+    def match_many(self, normalized: list[str]) -> list[str | None]:
+        """
+        Matches a batch in a single automaton pass over the descriptions joined by newlines (no
+        pattern contains one, so matches never span two descriptions).
+        """
+        best = [None] * len(normalized)
+        if self.empty or not normalized:
+            return best
+        starts, offset = [], 0
+        for text in normalized:
+            starts.append(offset)
+            offset += len(text) + 1
+        for end, value in self.automaton.iter("\n".join(normalized)):
+            i = bisect.bisect_right(starts, end) - 1
+            if best[i] is None or value > best[i]:
+                best[i] = value
+        return [value[2] if value else None for value in best]
+
+
+def _default_rules() -> list[tuple[str, str, int]]:
+    return [(keyword, category, DEFAULT_RULE_PRIORITY) for category, keywords in DEFAULT_RULES.items() for keyword in keywords]
+
+
+default_categorizer = KeywordCategorizer(_default_rules())
+_user_categorizers = OrderedDict()
+
+
+def get_categorizer(user_rules: tuple[tuple[str, str], ...] = ()) -> KeywordCategorizer:
+    """The default categorizer, or one compiled with the user's (pattern, category) overrides on top."""
+    if not user_rules:
+        return default_categorizer
+    categorizer = _user_categorizers.get(user_rules)
+    if categorizer is None:
+        categorizer = KeywordCategorizer(_default_rules() + [(p, c, USER_RULE_PRIORITY) for p, c in user_rules])
+        _user_categorizers[user_rules] = categorizer
+        if len(_user_categorizers) > CATEGORIZER_CACHE_SIZE:
+            _user_categorizers.popitem(last=False)
+    else:
+        _user_categorizers.move_to_end(user_rules)
+    return categorizer
+
+
+def load_user_rules(conn, user_id: str) -> tuple[tuple[str, str], ...]:
+    rows = conn.execute(
+        sqlalchemy.text("SELECT pattern, category FROM category_rules WHERE user_id = :user_id ORDER BY pattern"),
+        {"user_id": user_id}
+    ).fetchall()
+    return tuple((row[0], row[1]) for row in rows)
+
+
+def categorize_batch(transactions: list[dict], user_rules: tuple[tuple[str, str], ...] = ()) -> list[str]:
+    """
+    Categories for a batch of transactions (dicts with `description` and optionally `amount`,
+    `type`, `date`), in order. Keyword rules first; what they miss is classified as recurring
+    (same description across months at a steady amount) or by type and amount sign.
+    """
+    categorizer = get_categorizer(user_rules)
+    normalized = normalize_many([t.get("description") for t in transactions])
+    # Statements repeat descriptions a lot; each distinct one is matched once.
+    unique = list(dict.fromkeys(normalized))
+    matched = dict(zip(unique, categorizer.match_many(unique)))
+    categories = [matched[text] for text in normalized]
+
+    unmatched = [i for i, category in enumerate(categories) if category is None]
+    groups = defaultdict(list)
+    for i in unmatched:
+        if transactions[i].get("date") and transactions[i].get("amount") is not None:
+            groups[recurrence_key(normalized[i])].append(i)
+    for indexes in groups.values():
+        months = {str(transactions[i]["date"])[:7] for i in indexes}
+        if len(months) < RECURRING_MIN_MONTHS:
+            continue
+        amounts = [abs(float(transactions[i]["amount"])) for i in indexes]
+        median = statistics.median(amounts)
+        if not median or any(abs(a - median) > RECURRING_AMOUNT_TOLERANCE * median for a in amounts):
+            continue
+        for i in indexes:
+            if _is_income(transactions[i]):
+                categories[i] = "salary"
+            else:
+                categories[i] = "subscriptions" if median <= SUBSCRIPTION_MAX_AMOUNT else "bills"
+
+    for i in unmatched:
+        if categories[i] is None:
+            categories[i] = "income" if _is_income(transactions[i]) else "other"
+    return categories
+
+
+@offload("cpu", timeout=CATEGORIZE_TIMEOUT)
+def categorize_offloaded(transactions: list[dict], user_rules: tuple[tuple[str, str], ...] = ()) -> list[str]:
+    """categorize_batch in a worker process; each worker builds and caches its own automatons."""
+    return categorize_batch(transactions, user_rules)
+
+
+def _is_income(transaction: dict) -> bool:
+    return transaction.get("type") == "income"
+
+
+def categorize(description: str, amount: float | None = None, type: str | None = None,
+               user_rules: tuple[tuple[str, str], ...] = ()) -> str:
+    return categorize_batch([{"description": description, "amount": amount, "type": type}], user_rules)[0]
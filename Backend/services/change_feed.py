@@ -0,0 +1,233 @@
+# /services/change_feed.py
+
+import os
+import time
+import json
+import asyncio
+import threading
+from collections import OrderedDict
+import sqlalchemy
+from config.database import DB_HOST, DB_PORT, engine
+from config.replicas import connect_dbapi
+
+CHANGE_CHANNEL = "fintrack_changes"
+# While listening: how often the listening connection is read for notifications (a SELECT 1 round trip).
+CHANGE_FEED_LISTEN_SECONDS = float(os.environ.get("CHANGE_FEED_LISTEN_SECONDS", "0.1"))
+# Without a listener (dropped, or the database refused it): how often the outbox is polled instead.
+CHANGE_FEED_POLL_SECONDS = float(os.environ.get("CHANGE_FEED_POLL_SECONDS", "2"))
+# Polls look back this far, so events whose transaction committed after a later one's are not missed.
+CHANGE_FEED_OVERLAP_SECONDS = float(os.environ.get("CHANGE_FEED_OVERLAP_SECONDS", "30"))
+# Outbox rows older than this are deleted.
+CHANGE_FEED_RETENTION_SECONDS = int(os.environ.get("CHANGE_FEED_RETENTION_SECONDS", "3600"))
+# How often a worker deletes outbox rows older than the retention.
+CHANGE_FEED_PRUNE_SECONDS = float(os.environ.get("CHANGE_FEED_PRUNE_SECONDS", "300"))
+MAX_SEEN_EVENTS = 10000
+# NOTIFY payloads are capped at 8000 bytes by Postgres.
+NOTIFY_MAX_PAYLOAD = 7900
+
+
+def publish_change(conn, user_id: str, table: str, version: int, delta: dict | None = None):
+    """
+    Records a change of the user's data in the outbox and notifies every listening worker. Runs
+    in the write's own transaction: both only become visible when it commits, and vanish if it
+    rolls back. `delta` (what the write changed, for live dashboards) is dropped when it would not
+    fit in a notification.
+    """
+    event = {"user_id": user_id, "table": table, "version": version, "delta": delta}
+    if delta is not None and len(json.dumps(event)) > NOTIFY_MAX_PAYLOAD:
+        event["delta"] = None
+    event["id"] = conn.execute(
+        sqlalchemy.text("""
+            INSERT INTO change_events (user_id, table_name, version, delta, created_at)
+            VALUES (:user_id, :table_name, :version, :delta, clock_timestamp())
+            RETURNING id
+        """),
+        {"user_id": user_id, "table_name": table, "version": version,
+         "delta": json.dumps(event["delta"]) if event["delta"] is not None else None}
+    ).scalar_one()
+    conn.execute(sqlalchemy.text("SELECT pg_notify(:channel, :payload)"), {"channel": CHANGE_CHANNEL, "payload": json.dumps(event)})
+    # This worker applies it once the write has committed, without waiting for its own notification.
+    conn.info.setdefault("pending_changes", []).append(event)
+
+
+# The "commit" event fires before the DBAPI commit, when the write is not visible yet: a
+# concurrent request could reload and re-cache the old rows. The events are set aside there and
+# dispatched once the commit has returned, at the connection's next transaction or at checkin.
+@sqlalchemy.event.listens_for(sqlalchemy.engine.Engine, "commit")
+def _set_aside_committing_changes(conn):
+    pending = conn.info.pop("pending_changes", None)
+    if pending:
+        conn.info.setdefault("committed_changes", []).extend(pending)
+
+
+def _dispatch_committed_changes(info: dict):
+    for event in info.pop("committed_changes", ()):
+        change_feed.dispatch(event, "local")
+
+
+@sqlalchemy.event.listens_for(sqlalchemy.engine.Engine, "begin")
+def _dispatch_on_next_transaction(conn):
+    _dispatch_committed_changes(conn.info)
+
+
+@sqlalchemy.event.listens_for(sqlalchemy.pool.Pool, "checkin")
+def _dispatch_on_checkin(dbapi_connection, connection_record):
+    if connection_record is not None:
+        _dispatch_committed_changes(connection_record.info)
+
+
+@sqlalchemy.event.listens_for(sqlalchemy.engine.Engine, "rollback")
+def _discard_rolled_back_changes(conn):
+    conn.info.pop("pending_changes", None)
+
+
+class ChangeFeed:
+    """
+    Delivers change events from every worker to this worker's handlers (cache invalidations).
+
+    A dedicated connection LISTENs on CHANGE_CHANNEL and is read every CHANGE_FEED_LISTEN_SECONDS,
+    so events arrive within that of the writer's commit. On (re)connecting, and whenever the
+    listener is down, the change_events outbox is polled instead, so nothing written in the gap
+    is missed. Handlers can see an event twice and must be idempotent.
+    """
+
+    def __init__(self):
+        self.handlers = []
+        self.mode = "stopped"
+        self._seen = OrderedDict()
+        self._lock = threading.Lock()
+        self._since = None
+        self._pruned_at = 0.0
+        self._task = None
+        self.stats = {"local": 0, "notified": 0, "polled": 0, "reconnects": 0, "handler_errors": 0, "last_event_at": None}
+
+    def subscribe(self, handler):
+        """Registers `handler(event)`; event is a dict with id, user_id, table, version and delta (or None)."""
+        self.handlers.append(handler)
+        return handler
+
+    def dispatch(self, event: dict, source: str):
+        with self._lock:
+            if event["id"] in self._seen:
+                return
+            self._seen[event["id"]] = None
+            if len(self._seen) > MAX_SEEN_EVENTS:
+                self._seen.popitem(last=False)
+            self.stats[source] += 1
+        self.stats["last_event_at"] = time.time()
+        for handler in self.handlers:
+            try:
+                handler(event)
+            except Exception as e:
+                self.stats["handler_errors"] += 1
+                print(f"⚠️ [CHANGES] Handler {getattr(handler, '__name__', handler)} failed: {e}")
+
+    # --- Outbox polling ---
+
+    def poll(self) -> list[dict]:
+        """Outbox events since the last poll (with overlap). Blocking."""
+        with engine.connect() as conn:
+            if self._since is None:
+                # First poll: only start following from now.
+                self._since = conn.execute(sqlalchemy.text("SELECT clock_timestamp()")).scalar()
+                conn.commit()
+                return []
+            rows = conn.execute(
+                sqlalchemy.text("""
+                    SELECT id, user_id, table_name, version, clock_timestamp(), delta FROM change_events
+                    WHERE created_at >= :since - make_interval(secs => :overlap)
+                    ORDER BY id
+                """),
+                {"since": self._since, "overlap": CHANGE_FEED_OVERLAP_SECONDS}
+            ).fetchall()
+            self._since = rows[-1][4] if rows else conn.execute(sqlalchemy.text("SELECT clock_timestamp()")).scalar()
+            conn.commit()
+        return [{"id": r[0], "user_id": r[1], "table": r[2], "version": r[3], "delta": r[5]} for r in rows]
+
+    def prune(self):
+        """Deletes outbox rows past the retention. Blocking."""
+        self._pruned_at = time.monotonic()
+        with engine.connect() as conn:
+            conn.execute(
+                sqlalchemy.text("DELETE FROM change_events WHERE created_at < NOW() - make_interval(secs => :retention)"),
+                {"retention": CHANGE_FEED_RETENTION_SECONDS}
+            )
+            conn.commit()
+
+    async def _poll_and_dispatch(self):
+        for event in await asyncio.to_thread(self.poll):
+            self.dispatch(event, "polled")
+
+    # --- Listening ---
+
+    @staticmethod
+    def _read_notifications(conn, cursor) -> list[tuple]:
+        """
+        Notifications received on the listening connection. pg8000 reads them into
+        conn.notifications during any round trip, so a SELECT 1 collects them (and fails if the
+        connection dropped). Blocking.
+        """
+        cursor.execute("SELECT 1")
+        notifications = list(conn.notifications)
+        conn.notifications.clear()
+        return notifications
+
+    async def _listen(self):
+        conn = await asyncio.to_thread(connect_dbapi, DB_HOST, DB_PORT)
+        try:
+            conn.autocommit = True
+            cursor = conn.cursor()
+            await asyncio.to_thread(cursor.execute, f"LISTEN {CHANGE_CHANNEL}")
+            self.mode = "listening"
+            print("📡 [CHANGES] Listening for changes from other workers.")
+            # Catch up on anything committed while there was no listener.
+            await self._poll_and_dispatch()
+            while True:
+                for _, channel, payload in await asyncio.to_thread(self._read_notifications, conn, cursor):
+                    if channel == CHANGE_CHANNEL:
+                        self.dispatch(json.loads(payload), "notified")
+                if time.monotonic() - self._pruned_at > CHANGE_FEED_PRUNE_SECONDS:
+                    await asyncio.to_thread(self.prune)
+                await asyncio.sleep(CHANGE_FEED_LISTEN_SECONDS)
+        finally:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    async def run(self):
+        """Background task: follows the change feed for this worker. Cancel it on shutdown."""
+        while True:
+            try:
+                if engine:
+                    await self._listen()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if self.mode == "listening":
+                    print(f"⚠️ [CHANGES] Listener dropped, polling the outbox until it reconnects: {e}")
+                self.mode = "polling"
+                self.stats["reconnects"] += 1
+            try:
+                if engine:
+                    await self._poll_and_dispatch()
+                    if time.monotonic() - self._pruned_at > CHANGE_FEED_PRUNE_SECONDS:
+                        await asyncio.to_thread(self.prune)
+            except Exception as e:
+                print(f"⚠️ [CHANGES] Polling the outbox failed: {e}")
+            await asyncio.sleep(CHANGE_FEED_POLL_SECONDS)
+
+    def start(self):
+        """Starts following the feed. Must be called from the running event loop."""
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task and not self._task.done():
+            self._task.cancel()
+        self.mode = "stopped"
+
+    def status(self) -> dict:
+        return {"mode": self.mode, "handlers": len(self.handlers), **self.stats}
+
+
+change_feed = ChangeFeed()
@@ -0,0 +1,132 @@
+# /services/dashboard_overview.py
+
+import datetime
+import sqlalchemy
+from services.partitions import period_start
+
+# Months of the monthly chart, and days of the category breakdown.
+MONTHLY_CHART_MONTHS = 6
+CATEGORY_BREAKDOWN_DAYS = 30
+
+# Selectable section -> {response key: JSON subquery}. Every subquery is bound to :user_id only
+# (plus the window starts), and each returns one JSON value, so any subset of them is one SELECT.
+SECTIONS = {
+    "summary": {
+        "user_info": """
+            SELECT json_build_object('name', name, 'credit_score', credit_score, 'epf_balance', COALESCE(epf_balance, 0))
+            FROM Users WHERE user_id = :user_id
+        """,
+        "financial_summary": """
+            SELECT json_build_object(
+                'total_assets', a.total, 'total_liabilities', l.total, 'total_investments', i.total,
+                'net_worth', a.total + i.total - l.total,
+                'epf_balance', COALESCE((SELECT epf_balance FROM Users WHERE user_id = :user_id), 0))
+            FROM (SELECT COALESCE(SUM(value), 0) AS total FROM Assets WHERE user_id = :user_id) a,
+                 (SELECT COALESCE(SUM(outstanding_balance), 0) AS total FROM Liabilities WHERE user_id = :user_id) l,
+                 (SELECT COALESCE(SUM(current_value), 0) AS total FROM Investments WHERE user_id = :user_id) i
+        """,
+    },
+    "recent": {
+        "recent_transactions": """
+            SELECT COALESCE(json_agg(json_build_object(
+                'date', date, 'name', description, 'category', category, 'amount', amount, 'type', type
+            ) ORDER BY date DESC), '[]')
+            FROM (
+                SELECT date, description, category, amount, type FROM Transactions
+                WHERE user_id = :user_id ORDER BY date DESC LIMIT 10
+            ) t
+        """,
+    },
+    "monthly": {
+        "monthly_chart_data": """
+            SELECT COALESCE(json_agg(json_build_object(
+                'month', TO_CHAR(month, 'YYYY-MM'), 'income', income, 'expenses', expenses
+            ) ORDER BY month), '[]')
+            FROM (
+                SELECT DATE_TRUNC('month', date) AS month,
+                       SUM(CASE WHEN type = 'income' THEN amount ELSE 0 END) AS income,
+                       SUM(CASE WHEN type = 'expense' THEN ABS(amount) ELSE 0 END) AS expenses
+                FROM Transactions
+                WHERE user_id = :user_id AND date >= :monthly_since
+                GROUP BY DATE_TRUNC('month', date)
+            ) m
+        """,
+    },
+    "categories": {
+        "category_breakdown": """
+            SELECT COALESCE(json_agg(json_build_object('category', category, 'amount', total) ORDER BY total DESC), '[]')
+            FROM (
+                SELECT category, SUM(ABS(amount)) AS total FROM Transactions
+                WHERE user_id = :user_id AND type = 'expense' AND date >= :categories_since
+                GROUP BY category ORDER BY total DESC LIMIT 8
+            ) c
+        """,
+    },
+    "investments": {
+        "investment_breakdown": """
+            SELECT COALESCE(json_agg(json_build_object('type', type, 'value', total, 'count', count) ORDER BY total DESC), '[]')
+            FROM (SELECT type, SUM(current_value) AS total, COUNT(*) AS count FROM Investments WHERE user_id = :user_id GROUP BY type) x
+        """,
+    },
+    "assets": {
+        "asset_breakdown": """
+            SELECT COALESCE(json_agg(json_build_object('type', type, 'value', total, 'count', count) ORDER BY total DESC), '[]')
+            FROM (SELECT type, SUM(value) AS total, COUNT(*) AS count FROM Assets WHERE user_id = :user_id GROUP BY type) x
+        """,
+    },
+    "liabilities": {
+        "liability_breakdown": """
+            SELECT COALESCE(json_agg(json_build_object('type', type, 'balance', total, 'count', count) ORDER BY total DESC), '[]')
+            FROM (SELECT type, SUM(outstanding_balance) AS total, COUNT(*) AS count FROM Liabilities WHERE user_id = :user_id GROUP BY type) x
+        """,
+    },
+    "stats": {
+        "stats": """
+            SELECT json_build_object(
+                'transaction_count', t.n, 'asset_count', a.n, 'investment_count', i.n, 'liability_count', l.n,
+                'total_records', t.n + a.n + i.n + l.n)
+            FROM (SELECT COUNT(*) AS n FROM Transactions WHERE user_id = :user_id) t,
+                 (SELECT COUNT(*) AS n FROM Assets WHERE user_id = :user_id) a,
+                 (SELECT COUNT(*) AS n FROM Investments WHERE user_id = :user_id) i,
+                 (SELECT COUNT(*) AS n FROM Liabilities WHERE user_id = :user_id) l
+        """,
+    },
+}
+ALL_FIELDS = list(SECTIONS)
+
+
+def parse_fields(fields: str | None) -> list[str]:
+    """`fields=summary,recent` -> the sections, in canonical order. None or empty selects all. Raises ValueError."""
+    if not fields:
+        return ALL_FIELDS
+    requested = {f.strip().lower() for f in fields.split(",") if f.strip()}
+    unknown = requested - SECTIONS.keys()
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}. Choose from: {', '.join(ALL_FIELDS)}")
+    return [f for f in ALL_FIELDS if f in requested]
+
+
+def build_overview_query(fields: list[str]):
+    """One SELECT with a column per response key of the selected sections, plus whether the user exists."""
+    columns = [
+        f"({subquery}) AS {key}"
+        for field in fields
+        for key, subquery in SECTIONS[field].items()
+    ]
+    return sqlalchemy.text(
+        "SELECT EXISTS (SELECT 1 FROM Users WHERE user_id = :user_id) AS user_exists,\n" + ",\n".join(columns)
+    )
+
+
+def get_overview(conn, user_id: str, fields: list[str], today: datetime.date | None = None) -> dict | None:
+    """The selected dashboard sections in one round trip; None if the user does not exist."""
+    today = today or datetime.date.today()
+    row = conn.execute(build_overview_query(fields), {
+        "user_id": user_id,
+        # Bound as dates so the planner prunes Transactions partitions.
+        "monthly_since": period_start(MONTHLY_CHART_MONTHS, today),
+        "categories_since": today - datetime.timedelta(days=CATEGORY_BREAKDOWN_DAYS),
+    }).mappings().one()
+    if not row["user_exists"]:
+        return None
+    return {key: value for key, value in row.items() if key != "user_exists"}
@@ -0,0 +1,116 @@
+# /services/data_version.py
+
+import hashlib
+import contextlib
+import datetime
+import sqlalchemy
+from fastapi import HTTPException, Request, Response
+from config.database import engine
+from config.replicas import read_engine, replica_router
+from services.change_feed import publish_change
+
+# Counters for conditional GETs, reported by /dashboard/etag-stats.
+etag_stats = {"requests": 0, "not_modified": 0, "bytes_saved": 0, "queries_saved": 0}
+_etag_sizes = {}
+MAX_TRACKED_ETAGS = 10000
+
+
+def bump_data_version(conn, user_id: str, table: str = "*", delta: dict | None = None) -> int:
+    """
+    Increments the user's data version and publishes the change of `table` ("*": several), with
+    what it changed if given, to every worker's change feed. Call on the write's own connection,
+    before its commit.
+    """
+    version = conn.execute(
+        sqlalchemy.text("""
+            INSERT INTO user_data_versions (user_id, version, updated_at) VALUES (:user_id, 1, NOW())
+            ON CONFLICT (user_id) DO UPDATE SET version = user_data_versions.version + 1, updated_at = NOW()
+            RETURNING version
+        """),
+        {"user_id": user_id}
+    ).scalar_one()
+    publish_change(conn, user_id, table, version, delta)
+    return version
+
+
+def get_user_state(user_id: str) -> tuple[int, bool]:
+    """(data version, deleted) of a user in one round trip; version 0 if they have never written anything."""
+    with engine.connect() as conn:
+        version, deleted = conn.execute(
+            sqlalchemy.text("""
+                SELECT (SELECT version FROM user_data_versions WHERE user_id = :user_id),
+                       EXISTS (SELECT 1 FROM Users WHERE user_id = :user_id AND deleted_at IS NOT NULL)
+            """),
+            {"user_id": user_id}
+        ).one()
+    return version or 0, deleted
+
+
+def get_data_version(user_id: str) -> int:
+    """Current data version of a user; 0 if they have never written anything."""
+    return get_user_state(user_id)[0]
+
+
+@contextlib.contextmanager
+def read_connection(user_id: str, version: int | None = None):
+    """
+    A connection for the user's read-only queries: a replica when one is usable, else the primary.
+    Given the data version the request was answered for (read on the primary), a replica that has
+    not replayed it yet is swapped for the primary, so ETags and cache entries never label old data.
+    """
+    with read_engine.connect() as conn:
+        if not version or not replica_router.enabled or (conn.execute(
+            sqlalchemy.text("SELECT version FROM user_data_versions WHERE user_id = :user_id"), {"user_id": user_id}
+        ).scalar() or 0) >= version:
+            yield conn
+            return
+    with engine.connect() as conn:
+        yield conn
+
+
+def make_etag(user_id: str, version: int, request: Request) -> str:
+    """Strong ETag over the user's data version, the URL and today's date (periods are relative to CURRENT_DATE)."""
+    query = "&".join(f"{k}={v}" for k, v in sorted(request.query_params.multi_items()))
+    material = f"{user_id}|{version}|{datetime.date.today().isoformat()}|{request.url.path}?{query}"
+    return '"' + hashlib.sha256(material.encode()).hexdigest()[:32] + '"'
+
+
+def record_response_size(etag: str, size: int):
+    """Remembers how large the 200 response for an ETag was, so a later 304 can count the bytes it saved."""
+    if len(_etag_sizes) >= MAX_TRACKED_ETAGS:
+        _etag_sizes.pop(next(iter(_etag_sizes)))
+    _etag_sizes[etag] = size
+
+
+def etag_cached(queries: int):
+    """
+    Dependency for per-user GET endpoints. Answers If-None-Match with 304 before the endpoint
+    runs any of its `queries` aggregate queries; otherwise sets the ETag on the response.
+    Users whose account deletion is pending get a 404.
+    """
+    def dependency(user_id: str, request: Request, response: Response):
+        if not engine:
+            return
+        etag_stats["requests"] += 1
+        try:
+            version, deleted = get_user_state(user_id)
+            etag = make_etag(user_id, version, request)
+        except Exception as e:
+            print(f"⚠️ Could not read data version for {user_id}, skipping ETag: {e}")
+            return
+        if deleted:
+            raise HTTPException(status_code=404, detail="User not found")
+
+        if_none_match = request.headers.get("if-none-match", "")
+        if etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]:
+            etag_stats["not_modified"] += 1
+            etag_stats["queries_saved"] += queries
+            etag_stats["bytes_saved"] += _etag_sizes.get(etag, 0)
+            raise HTTPException(status_code=304, headers={"ETag": etag, "Cache-Control": "private, no-cache"})
+
+        # Endpoints keying caches on the data version can reuse it instead of reading it again.
+        request.state.data_version = version
+        response.headers["ETag"] = etag
+        response.headers["Cache-Control"] = "private, no-cache"
+
+    return dependency
@@ -0,0 +1,241 @@
+# /services/executors.py
+
+import os
+import time
+import signal
+import asyncio
+import importlib
+import functools
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+from multiprocessing import shared_memory
+import numpy as np
+from services.llm_scheduler import _percentile
+
+# Worker processes for CPU-bound work (forecasts, simulations, reports).
+EXECUTOR_PROCESSES = int(os.environ.get("EXECUTOR_PROCESSES", str(min(os.cpu_count() or 1, 4))))
+# Threads for blocking I/O that would otherwise run on the event loop.
+EXECUTOR_THREADS = int(os.environ.get("EXECUTOR_THREADS", "16"))
+# Tasks submitted to a pool and not finished yet; past this new ones are refused with a Retry-After.
+EXECUTOR_MAX_PENDING = int(os.environ.get("EXECUTOR_MAX_PENDING", "64"))
+# NumPy arguments at least this large go to worker processes through shared memory instead of the pipe.
+EXECUTOR_SHM_MIN_BYTES = int(os.environ.get("EXECUTOR_SHM_MIN_BYTES", str(64 * 1024)))
+
+
+class ExecutorBusyError(Exception):
+    """Raised when a pool already has EXECUTOR_MAX_PENDING tasks; carries a Retry-After estimate in seconds."""
+
+    def __init__(self, pool: str, retry_after: int):
+        super().__init__(f"The {pool} pool is busy, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class TaskTimeoutError(Exception):
+    """Raised when an offloaded task runs past its timeout."""
+
+
+# --- Runs in the worker (process or thread) ---
+
+@dataclass(frozen=True)
+class SharedArrayRef:
+    """A NumPy array placed in a shared memory block; pickles as just its name, shape and dtype."""
+    name: str
+    shape: tuple
+    dtype: str
+
+
+@dataclass(frozen=True)
+class FunctionRef:
+    """An @offload-ed function by module and name; the worker calls the plain function, not the wrapper."""
+    module: str
+    qualname: str
+
+    def resolve(self):
+        target = importlib.import_module(self.module)
+        for part in self.qualname.split("."):
+            target = getattr(target, part)
+        return getattr(target, "__wrapped__", target)
+
+
+def _raise_timeout(signum, frame):
+    raise TaskTimeoutError("Task ran past its timeout")
+
+
+def _run_task(func, args: tuple, kwargs: dict, timeout: float | None, in_process: bool) -> tuple[float, object]:
+    """Attaches shared arrays, runs the task (interrupted at `timeout` in a process) and returns (start time, result)."""
+    started = time.time()
+    func = func.resolve() if isinstance(func, FunctionRef) else func
+    blocks = []
+
+    def attach(value):
+        if not isinstance(value, SharedArrayRef):
+            return value
+        block = shared_memory.SharedMemory(name=value.name)
+        blocks.append(block)
+        return np.ndarray(value.shape, dtype=value.dtype, buffer=block.buf)
+
+    args = tuple(attach(a) for a in args)
+    kwargs = {k: attach(v) for k, v in kwargs.items()}
+    # Worker processes run tasks on their main thread, so a timer signal can stop a runaway task
+    # and free the process. Threads cannot be interrupted; their timeout only stops the waiting.
+    timed = in_process and timeout and hasattr(signal, "setitimer")
+    if timed:
+        signal.signal(signal.SIGALRM, _raise_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return started, func(*args, **kwargs)
+    finally:
+        if timed:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+        del args, kwargs
+        for block in blocks:
+            try:
+                block.close()
+            except BufferError:
+                pass  # The result still views the block; it is unmapped when the view goes.
+
+
+# --- Owned by the event loop ---
+
+class PoolStats:
+    def __init__(self):
+        self.pending = 0
+        self.counters = {"submitted": 0, "completed": 0, "failed": 0, "timed_out": 0, "rejected": 0, "shared_bytes": 0}
+        self.wait_times = deque(maxlen=500)
+        self.run_times = deque(maxlen=500)
+
+    def to_dict(self, workers: int) -> dict:
+        return {
+            "workers": workers,
+            "pending": self.pending,
+            "max_pending": EXECUTOR_MAX_PENDING,
+            **self.counters,
+            "queue_wait_p50_ms": round(_percentile(self.wait_times, 0.50) * 1000, 1),
+            "queue_wait_p95_ms": round(_percentile(self.wait_times, 0.95) * 1000, 1),
+            "run_time_p50_ms": round(_percentile(self.run_times, 0.50) * 1000, 1),
+            "run_time_p95_ms": round(_percentile(self.run_times, 0.95) * 1000, 1),
+        }
+
+
+class WorkExecutor:
+    """
+    Keeps blocking work off the event loop: a process pool for CPU-bound work and a thread pool
+    for blocking I/O, both started and shut down by the app's lifespan.
+
+    Tasks are awaited with a per-task timeout (queue wait included). Large NumPy arguments of
+    process tasks are copied once into shared memory and mapped by the worker, rather than
+    pickled through the pool's pipe; the block is unlinked when the task finishes. Each pool
+    refuses new work once EXECUTOR_MAX_PENDING tasks are waiting or running.
+    """
+
+    def __init__(self, processes: int = EXECUTOR_PROCESSES, threads: int = EXECUTOR_THREADS):
+        self.processes = processes
+        self.threads = threads
+        self._pools = {}
+        self.stats = {"cpu": PoolStats(), "io": PoolStats()}
+
+    def start(self):
+        # Spawned, not forked: a fork of a server with live threads and sockets is not safe.
+        self._pools["cpu"] = ProcessPoolExecutor(self.processes, mp_context=multiprocessing.get_context("spawn"))
+        self._pools["io"] = ThreadPoolExecutor(self.threads, thread_name_prefix="io-pool")
+        print(f"🧵 [EXECUTOR] Started {self.processes} worker processes and {self.threads} I/O threads.")
+
+    async def stop(self):
+        pools, self._pools = self._pools, {}
+        for pool in pools.values():
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    async def run_cpu(self, func, *args, timeout: float | None = None, **kwargs):
+        """Runs `func(*args, **kwargs)` in a worker process; `func` and its arguments must be picklable."""
+        return await self._submit("cpu", func, args, kwargs, timeout)
+
+    async def run_io(self, func, *args, timeout: float | None = None, **kwargs):
+        """Runs the blocking `func(*args, **kwargs)` on the I/O thread pool."""
+        return await self._submit("io", func, args, kwargs, timeout)
+
+    def _share(self, value, blocks: list):
+        if not isinstance(value, np.ndarray) or value.nbytes < EXECUTOR_SHM_MIN_BYTES or value.dtype.hasobject:
+            return value
+        block = shared_memory.SharedMemory(create=True, size=value.nbytes)
+        blocks.append(block)
+        np.ndarray(value.shape, dtype=value.dtype, buffer=block.buf)[...] = value
+        self.stats["cpu"].counters["shared_bytes"] += value.nbytes
+        return SharedArrayRef(block.name, value.shape, value.dtype.str)
+
+    async def _submit(self, kind: str, func, args: tuple, kwargs: dict, timeout: float | None):
+        pool = self._pools.get(kind)
+        if pool is None:
+            raise RuntimeError("The executor is not started.")
+        stats = self.stats[kind]
+        if stats.pending >= EXECUTOR_MAX_PENDING:
+            stats.counters["rejected"] += 1
+            workers = self.processes if kind == "cpu" else self.threads
+            raise ExecutorBusyError(kind, max(1, round(_percentile(stats.run_times, 0.5) * stats.pending / workers)))
+
+        blocks = []
+        if kind == "cpu":
+            args = tuple(self._share(a, blocks) for a in args)
+            kwargs = {k: self._share(v, blocks) for k, v in kwargs.items()}
+        loop = asyncio.get_running_loop()
+        submitted = time.time()
+        stats.pending += 1
+        stats.counters["submitted"] += 1
+        future = pool.submit(_run_task, func, args, kwargs, timeout, kind == "cpu")
+
+        def finished():
+            stats.pending -= 1
+            for block in blocks:
+                block.close()
+                block.unlink()
+
+        # Counted (and its shared memory released) when the work really ends, not when the caller gives up.
+        future.add_done_callback(lambda _: loop.call_soon_threadsafe(finished))
+        outcome = asyncio.wrap_future(future)
+        try:
+            started, result = await asyncio.wait_for(asyncio.shield(outcome), timeout)
+        except (asyncio.TimeoutError, TaskTimeoutError):
+            # Still queued: dropped. Already running: a process stops it at its own timer.
+            future.cancel()
+            outcome.add_done_callback(lambda done: done.cancelled() or done.exception())
+            stats.counters["timed_out"] += 1
+            name = func.qualname if isinstance(func, FunctionRef) else getattr(func, "__name__", repr(func))
+            raise TaskTimeoutError(f"{name} ran past its {timeout}s timeout")
+        except Exception:
+            stats.counters["failed"] += 1
+            raise
+        stats.counters["completed"] += 1
+        stats.wait_times.append(max(started - submitted, 0.0))
+        stats.run_times.append(max(time.time() - started, 0.0))
+        return result
+
+    def status(self) -> dict:
+        return {
+            "started": bool(self._pools),
+            "cpu": self.stats["cpu"].to_dict(self.processes),
+            "io": self.stats["io"].to_dict(self.threads),
+            "shm_min_bytes": EXECUTOR_SHM_MIN_BYTES,
+        }
+
+
+work_executor = WorkExecutor()
+
+
+def offload(pool: str = "cpu", timeout: float | None = None):
+    """
+    Declares a function as executor work: calling it returns an awaitable that runs it in the
+    "cpu" (process) or "io" (thread) pool with the given timeout. The plain function stays
+    available as `func.__wrapped__`, and is what worker processes import and run.
+    """
+    def decorate(func):
+        target = FunctionRef(func.__module__, func.__qualname__) if pool == "cpu" else func
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            return await work_executor._submit(pool, target, args, kwargs, timeout)
+
+        wrapper.__offloaded__ = pool
+        return wrapper
+
+    return decorate
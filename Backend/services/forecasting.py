@@ -0,0 +1,88 @@
+# /services/forecasting.py
+
+import os
+import datetime
+import numpy as np
+import sqlalchemy
+from dateutil.relativedelta import relativedelta
+from services.executors import offload, work_executor
+
+# Days of cash-flow history the simulation resamples from.
+FORECAST_HISTORY_DAYS = int(os.environ.get("FORECAST_HISTORY_DAYS", "365"))
+# Seconds a simulation may take (queue wait included) before the request answers 504.
+FORECAST_TIMEOUT = float(os.environ.get("FORECAST_TIMEOUT", "20"))
+DAYS_PER_MONTH = 30
+PERCENTILES = (10, 50, 90)
+
+
+def load_forecast_inputs(conn, user_id: str, today: datetime.date | None = None) -> tuple[np.ndarray, float]:
+    """
+    The user's net cash flow for each of the last FORECAST_HISTORY_DAYS days (days without
+    transactions count as zero) and their current net worth. Blocking.
+    """
+    today = today or datetime.date.today()
+    since = today - datetime.timedelta(days=FORECAST_HISTORY_DAYS)
+    rows = conn.execute(
+        sqlalchemy.text("""
+            SELECT date - :since, SUM(CASE WHEN type = 'income' THEN amount ELSE -ABS(amount) END)
+            FROM Transactions
+            WHERE user_id = :user_id AND date >= :since AND date < :today
+            GROUP BY date
+        """),
+        {"user_id": user_id, "since": since, "today": today}
+    ).fetchall()
+    daily_net = np.zeros(FORECAST_HISTORY_DAYS)
+    if rows:
+        offsets, amounts = zip(*rows)
+        daily_net[np.array(offsets)] = np.array(amounts, dtype=float)
+    net_worth = conn.execute(
+        sqlalchemy.text("""
+            SELECT (SELECT COALESCE(SUM(value), 0) FROM Assets WHERE user_id = :user_id)
+                 + (SELECT COALESCE(SUM(current_value), 0) FROM Investments WHERE user_id = :user_id)
+                 - (SELECT COALESCE(SUM(outstanding_balance), 0) FROM Liabilities WHERE user_id = :user_id)
+        """),
+        {"user_id": user_id}
+    ).scalar_one()
+    return daily_net, float(net_worth)
+
+
+@offload("cpu", timeout=FORECAST_TIMEOUT)
+def simulate_net_worth(daily_net: np.ndarray, start: float, months: int, simulations: int, seed: int | None = None) -> dict:
+    """
+    Monte Carlo projection of net worth: each simulated month is DAYS_PER_MONTH days drawn (with
+    replacement) from the daily cash-flow history. Returns the percentile paths per month and
+    the chance of ending below today's net worth. Days are drawn one month at a time, so memory
+    is simulations x DAYS_PER_MONTH draws plus the simulations x months paths.
+    """
+    rng = np.random.default_rng(seed)
+    paths = np.empty((simulations, months))
+    balance = np.full(simulations, start, dtype=float)
+    for month in range(months):
+        balance += rng.choice(daily_net, size=(simulations, DAYS_PER_MONTH)).sum(axis=1)
+        paths[:, month] = balance
+    bands = np.percentile(paths, PERCENTILES, axis=0)
+    return {
+        "percentiles": {f"p{p}": band.round(2).tolist() for p, band in zip(PERCENTILES, bands)},
+        "probability_below_start": round(float((paths[:, -1] < start).mean()), 4),
+        "probability_any_month_negative": round(float((paths < 0).any(axis=1).mean()), 4),
+    }
+
+
+async def forecast_net_worth(engine, user_id: str, months: int, simulations: int, seed: int | None = None) -> dict:
+    """Loads the history on the I/O pool and runs the simulation in a worker process."""
+    def load():
+        with engine.connect() as conn:
+            return load_forecast_inputs(conn, user_id)
+
+    daily_net, start = await work_executor.run_io(load, timeout=FORECAST_TIMEOUT)
+    result = await simulate_net_worth(daily_net, start, months, simulations, seed)
+    today = datetime.date.today().replace(day=1)
+    return {
+        "user_id": user_id,
+        "start_net_worth": round(start, 2),
+        "months": [(today + relativedelta(months=i + 1)).strftime("%Y-%m") for i in range(months)],
+        "simulations": simulations,
+        "history_days": FORECAST_HISTORY_DAYS,
+        "average_monthly_net": round(float(daily_net.mean()) * DAYS_PER_MONTH, 2),
+        **result,
+    }
@@ -0,0 +1,144 @@
+# /services/live_updates.py
+
+import os
+import asyncio
+import datetime
+from collections import defaultdict
+from services.change_feed import change_feed
+
+# Messages waiting for one slow socket; past this its backlog is replaced by a single refresh.
+LIVE_QUEUE_SIZE = int(os.environ.get("LIVE_QUEUE_SIZE", "32"))
+# A ping goes out after this long without a message, so proxies keep idle sockets open.
+LIVE_PING_SECONDS = float(os.environ.get("LIVE_PING_SECONDS", "30"))
+# Sockets per worker; further connections are refused with 1013 (try again later).
+LIVE_MAX_CONNECTIONS = int(os.environ.get("LIVE_MAX_CONNECTIONS", "20000"))
+
+
+# --- Deltas, computed by the write paths from the rows they write ---
+
+def transactions_delta(transactions: list[dict]) -> dict:
+    """
+    What inserting `transactions` adds to the dashboard: the rows themselves (recent transactions),
+    per-month spending and net savings (spending and savings charts) and per-category spending.
+    """
+    months = defaultdict(lambda: {"spending": 0.0, "savings": 0.0})
+    categories = defaultdict(float)
+    for t in transactions:
+        month = str(t["date"])[:7]
+        amount = float(t["amount"])
+        if t.get("type") == "income":
+            months[month]["savings"] += amount
+        else:
+            months[month]["spending"] += abs(amount)
+            months[month]["savings"] -= abs(amount)
+            categories[t.get("category")] += abs(amount)
+    return {
+        "transactions": [
+            {"date": str(t["date"]), "description": t.get("description"), "category": t.get("category"),
+             "amount": float(t["amount"]), "type": t.get("type")}
+            for t in sorted(transactions, key=lambda t: str(t["date"]), reverse=True)
+        ],
+        "months": [
+            {"month": month, "label": datetime.date.fromisoformat(f"{month}-01").strftime("%b"), **values}
+            for month, values in sorted(months.items())
+        ],
+        "categories": dict(categories),
+    }
+
+
+def totals_delta(field: str, amount, allocation: str | None = None) -> dict:
+    """What a new asset, liability or investment adds to the summary totals (and the allocation chart)."""
+    delta = {"totals": {field: float(amount or 0)}}
+    if allocation is not None:
+        delta["allocation"] = {allocation: float(amount or 0)}
+    return delta
+
+
+# --- Fan-out to this worker's sockets ---
+
+class LiveConnection:
+    def __init__(self, websocket, user_id: str):
+        self.websocket = websocket
+        self.user_id = user_id
+        self.queue = asyncio.Queue(maxsize=LIVE_QUEUE_SIZE)
+        self.overflowed = False
+
+    async def next_message(self) -> dict:
+        """The next message to send; after an overflow, the backlog collapses into one refresh."""
+        if self.overflowed:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.overflowed = False
+            return {"type": "refresh", "table": "*", "version": None}
+        try:
+            return await asyncio.wait_for(self.queue.get(), LIVE_PING_SECONDS)
+        except asyncio.TimeoutError:
+            return {"type": "ping"}
+
+    def offer(self, message: dict):
+        """Queues a message; a socket too slow to keep up gets one refresh instead of its backlog."""
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.overflowed = True
+            hub.stats["overflows"] += 1
+
+
+class LiveHub:
+    """
+    The dashboard sockets open on this worker, by user. Change-feed events (from any worker's
+    writes) are turned into messages and queued on each of the user's sockets:
+
+      {"type": "delta", "table": ..., "version": N, "delta": {...}}   apply to the dashboard
+      {"type": "refresh", "table": ..., "version": N}                 refetch (no delta available)
+
+    Versions are the user's data version; a client that sees one skipped refetches.
+    """
+
+    def __init__(self):
+        self.connections = defaultdict(set)
+        self.open = 0
+        self.loop = None
+        self.stats = {"connected": 0, "messages": 0, "overflows": 0, "refused": 0}
+
+    def register(self, connection: LiveConnection) -> bool:
+        if self.open >= LIVE_MAX_CONNECTIONS:
+            self.stats["refused"] += 1
+            return False
+        self.loop = asyncio.get_running_loop()
+        self.connections[connection.user_id].add(connection)
+        self.open += 1
+        self.stats["connected"] += 1
+        return True
+
+    def unregister(self, connection: LiveConnection):
+        sockets = self.connections.get(connection.user_id)
+        if sockets is not None and connection in sockets:
+            sockets.discard(connection)
+            self.open -= 1
+            if not sockets:
+                del self.connections[connection.user_id]
+
+    def publish(self, event: dict):
+        """Change-feed handler. May run on a request thread, so queuing is handed to the event loop."""
+        if event["user_id"] not in self.connections or self.loop is None:
+            return
+        if event.get("delta") is not None:
+            message = {"type": "delta", "table": event["table"], "version": event["version"], "delta": event["delta"]}
+        else:
+            message = {"type": "refresh", "table": event["table"], "version": event["version"]}
+        self.loop.call_soon_threadsafe(self._fan_out, event["user_id"], message)
+
+    def _fan_out(self, user_id: str, message: dict):
+        for connection in self.connections.get(user_id, ()):
+            connection.offer(message)
+            self.stats["messages"] += 1
+
+    def status(self) -> dict:
+        return {"connections": self.open, "users": len(self.connections), "max_connections": LIVE_MAX_CONNECTIONS, **self.stats}
+
+
+hub = LiveHub()
+change_feed.subscribe(hub.publish)
@@ -0,0 +1,203 @@
+# /services/llm_router.py
+
+import os
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from langchain_core.language_models import BaseChatModel
+from langchain_core.outputs import ChatGeneration, ChatResult
+from services.profiling import record_llm_call
+
+# Providers in order of preference. Providers whose API key is missing are skipped.
+LLM_PROVIDERS = [p.strip() for p in os.environ.get("LLM_PROVIDERS", "groq,gemini").split(",") if p.strip()]
+LLM_HEDGE_ENABLED = os.environ.get("LLM_HEDGE_ENABLED", "true").lower() == "true"
+LLM_HEDGE_MIN_SAMPLES = int(os.environ.get("LLM_HEDGE_MIN_SAMPLES", "20"))
+LLM_ERROR_THRESHOLD = float(os.environ.get("LLM_ERROR_THRESHOLD", "0.5"))  # EWMA error rate that demotes a provider
+LLM_RATE_LIMIT_COOLDOWN = float(os.environ.get("LLM_RATE_LIMIT_COOLDOWN", "30"))
+EWMA_ALPHA = 0.2
+
+# "default" runs the agents; "cheap" serves short steps like query reformulation and intent detection.
+PROVIDER_MODELS = {
+    "groq": {"default": "llama-3.3-70b-versatile", "cheap": "llama-3.1-8b-instant"},
+    "gemini": {"default": "gemini-2.5-flash", "cheap": "gemini-2.5-flash-lite"},
+    "stub": {"default": "stub", "cheap": "stub"},
+}
+
+_hedge_pool = ThreadPoolExecutor(max_workers=int(os.environ.get("LLM_ROUTER_THREADS", "16")), thread_name_prefix="llm-router")
+
+
+def _build_groq(model: str):
+    if not os.environ.get("GROQ_API_KEY"):
+        return None
+    from langchain_groq import ChatGroq
+    return ChatGroq(model=model, temperature=0, groq_api_key=os.environ["GROQ_API_KEY"])
+
+
+def _build_gemini(model: str):
+    if not os.environ.get("GOOGLE_API_KEY"):
+        return None
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    return ChatGoogleGenerativeAI(model=model, temperature=0)
+
+
+def _build_stub(model: str):
+    """Local provider for development and tests: canned answers after an optional delay."""
+    from langchain_core.language_models import FakeListChatModel
+    responses = os.environ.get("LLM_STUB_RESPONSES", "This is a stub response.").split("|")
+    return FakeListChatModel(responses=responses, sleep=float(os.environ.get("LLM_STUB_LATENCY_MS", "0")) / 1000)
+
+
+PROVIDER_BUILDERS = {"groq": _build_groq, "gemini": _build_gemini, "stub": _build_stub}
+
+
+class ProviderStats:
+    """Latency and error EWMAs for one provider/model, plus a window of recent latencies for p95."""
+
+    def __init__(self):
+        self.ewma_latency = None
+        self.ewma_error = 0.0
+        self.calls = 0
+        self.errors = 0
+        self.cooldown_until = 0.0
+        self._latencies = deque(maxlen=200)
+        self._lock = threading.Lock()
+
+    def record(self, latency: float, ok: bool, rate_limited: bool = False):
+        with self._lock:
+            self.calls += 1
+            self.ewma_error = EWMA_ALPHA * (0.0 if ok else 1.0) + (1 - EWMA_ALPHA) * self.ewma_error
+            if ok:
+                self._latencies.append(latency)
+                self.ewma_latency = latency if self.ewma_latency is None else EWMA_ALPHA * latency + (1 - EWMA_ALPHA) * self.ewma_latency
+            else:
+                self.errors += 1
+            if rate_limited:
+                self.cooldown_until = time.monotonic() + LLM_RATE_LIMIT_COOLDOWN
+
+    def p95(self) -> float | None:
+        with self._lock:
+            if len(self._latencies) < LLM_HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(self._latencies)
+            return ordered[int(len(ordered) * 0.95) - 1]
+
+    def is_degraded(self) -> bool:
+        return time.monotonic() < self.cooldown_until or self.ewma_error > LLM_ERROR_THRESHOLD
+
+    def to_dict(self) -> dict:
+        p95 = self.p95()
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "ewma_latency_ms": round(self.ewma_latency * 1000, 1) if self.ewma_latency is not None else None,
+            "ewma_error_rate": round(self.ewma_error, 3),
+            "p95_latency_ms": round(p95 * 1000, 1) if p95 is not None else None,
+            "cooling_down": time.monotonic() < self.cooldown_until,
+        }
+
+
+_provider_stats = {}
+
+
+def _stats_for(key: str) -> ProviderStats:
+    if key not in _provider_stats:
+        _provider_stats[key] = ProviderStats()
+    return _provider_stats[key]
+
+
+def _is_rate_limit_error(error: Exception) -> bool:
+    message = str(error)
+    return "429" in message or "RESOURCE_EXHAUSTED" in message or "rate limit" in message.lower()
+
+
+class ProviderRouter(BaseChatModel):
+    """
+    A chat model that spreads calls over several underlying providers.
+
+    Providers are tried in configured order, skipping any in a rate-limit cooldown or whose
+    error EWMA is above LLM_ERROR_THRESHOLD. If a call fails it fails over to the next provider.
+    If the chosen provider has not answered within its own p95 latency, one hedged request is
+    sent to the next provider and whichever answers first wins. Keyword arguments such as the
+    `tools` bound by the agent constructors are forwarded to every provider unchanged.
+    """
+
+    providers: list  # [(stats_key, chat_model), ...]
+
+    @property
+    def _llm_type(self) -> str:
+        return "provider-router"
+
+    def _ranked(self) -> list:
+        return sorted(self.providers, key=lambda p: _stats_for(p[0]).is_degraded())
+
+    def _call_provider(self, key: str, model, messages, stop, kwargs):
+        started = time.monotonic()
+        try:
+            result = model.invoke(messages, stop=stop, **kwargs)
+        except Exception as e:
+            _stats_for(key).record(time.monotonic() - started, ok=False, rate_limited=_is_rate_limit_error(e))
+            raise
+        _stats_for(key).record(time.monotonic() - started, ok=True)
+        return result
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        started = time.monotonic()
+        ranked = self._ranked()
+        pending = {}
+        next_index = 0
+        hedged = False
+        last_error = None
+
+        def launch():
+            nonlocal next_index
+            key, model = ranked[next_index]
+            next_index += 1
+            pending[_hedge_pool.submit(self._call_provider, key, model, messages, stop, kwargs)] = key
+
+        launch()
+        while pending:
+            hedge_after = None
+            if LLM_HEDGE_ENABLED and not hedged and next_index < len(ranked):
+                hedge_after = _stats_for(ranked[0][0]).p95()
+            done, _ = wait(pending, timeout=hedge_after, return_when=FIRST_COMPLETED)
+            if not done:
+                print(f"⏱️ [LLM ROUTER] {ranked[0][0]} slower than its p95, hedging with {ranked[next_index][0]}")
+                hedged = True
+                launch()
+                continue
+            for future in done:
+                key = pending.pop(future)
+                try:
+                    result = ChatResult(generations=[ChatGeneration(message=future.result())], llm_output={"provider": key})
+                    record_llm_call(key, time.monotonic() - started, hedged)
+                    return result
+                except Exception as e:
+                    print(f"⚠️ [LLM ROUTER] {key} failed: {e}")
+                    last_error = e
+            if not pending and next_index < len(ranked):
+                launch()
+        raise last_error
+
+
+def build_chat_model(tier: str = "default") -> ProviderRouter:
+    """Builds a router over every configured provider that has credentials, using the model for `tier`."""
+    providers = []
+    for name in LLM_PROVIDERS:
+        if name not in PROVIDER_BUILDERS:
+            print(f"⚠️ Unknown LLM provider '{name}' in LLM_PROVIDERS, skipping.")
+            continue
+        model_name = PROVIDER_MODELS[name][tier]
+        model = PROVIDER_BUILDERS[name](model_name)
+        if model is None:
+            print(f"⚠️ LLM provider '{name}' has no API key configured, skipping.")
+            continue
+        providers.append((f"{name}:{model_name}", model))
+    if not providers:
+        raise ValueError(f"Error: no LLM provider is configured. Set LLM_PROVIDERS ({','.join(LLM_PROVIDERS)}) and their API keys.")
+    print(f"🔀 LLM router ({tier}): {', '.join(key for key, _ in providers)}")
+    return ProviderRouter(providers=providers)
+
+
+def get_provider_stats() -> dict:
+    return {key: stats.to_dict() for key, stats in _provider_stats.items()}
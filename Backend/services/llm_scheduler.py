@@ -0,0 +1,145 @@
+# /services/llm_scheduler.py
+
+import os
+import time
+import asyncio
+from enum import IntEnum
+from collections import OrderedDict, deque
+
+# Tune to the provider quota: how many agent runs may talk to the LLM at once, and how many may wait.
+LLM_MAX_IN_FLIGHT = int(os.environ.get("LLM_MAX_IN_FLIGHT", "4"))
+LLM_MAX_QUEUE = int(os.environ.get("LLM_MAX_QUEUE", "32"))
+
+
+class Priority(IntEnum):
+    """Lower values are served first."""
+    INTERACTIVE = 0
+    BACKGROUND = 1
+
+
+class SchedulerFullError(Exception):
+    """Raised when the wait queue is full; carries a Retry-After estimate in seconds."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"LLM request queue is full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+def _percentile(values, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * pct), len(ordered) - 1)]
+
+
+class LLMScheduler:
+    """
+    Admission control in front of the agent executor.
+
+    At most `max_in_flight` jobs run at once. Waiting jobs are grouped by priority and,
+    within a priority, by user; users are served round-robin so one user's burst cannot
+    starve everyone else. When `max_queue` jobs are already waiting, new work is rejected
+    straight away instead of piling up behind a saturated provider.
+    """
+
+    def __init__(self, max_in_flight: int = LLM_MAX_IN_FLIGHT, max_queue: int = LLM_MAX_QUEUE):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self._in_flight = 0
+        self._queued = 0
+        self._queues = {priority: OrderedDict() for priority in Priority}
+        self._wait_times = deque(maxlen=500)
+        self._run_times = deque(maxlen=500)
+        self._counters = {"submitted": 0, "completed": 0, "failed": 0, "rejected": 0}
+
+    async def submit(self, user_id: str, func, *args, priority: Priority = Priority.INTERACTIVE):
+        """Waits for a slot, then runs the blocking `func(*args)` in a worker thread."""
+        self._counters["submitted"] += 1
+        await self._acquire(user_id, priority)
+        started = time.monotonic()
+        work = asyncio.ensure_future(asyncio.to_thread(func, *args))
+        # The slot is released when the thread finishes, not when the caller stops waiting:
+        # a cancelled caller cannot stop a provider call that is already under way.
+        work.add_done_callback(lambda done: self._on_work_done(done, started))
+        return await asyncio.shield(work)
+
+    def _on_work_done(self, work, started: float):
+        self._run_times.append(time.monotonic() - started)
+        self._counters["failed" if work.cancelled() or work.exception() else "completed"] += 1
+        self._release()
+
+    def retry_after(self) -> int:
+        """Rough number of seconds until the current backlog has drained."""
+        avg_run = sum(self._run_times) / len(self._run_times) if self._run_times else 5.0
+        return max(int(avg_run * (self._queued + self._in_flight) / self.max_in_flight + 0.999), 1)
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self._in_flight,
+            "max_in_flight": self.max_in_flight,
+            "queued": {priority.name.lower(): sum(len(w) for w in self._queues[priority].values()) for priority in Priority},
+            "max_queue": self.max_queue,
+            **self._counters,
+            "queue_wait_p50_ms": round(_percentile(self._wait_times, 0.50) * 1000, 1),
+            "queue_wait_p95_ms": round(_percentile(self._wait_times, 0.95) * 1000, 1),
+            "run_time_p50_ms": round(_percentile(self._run_times, 0.50) * 1000, 1),
+            "run_time_p95_ms": round(_percentile(self._run_times, 0.95) * 1000, 1),
+        }
+
+    async def _acquire(self, user_id: str, priority: Priority):
+        if self._in_flight < self.max_in_flight and self._queued == 0:
+            self._in_flight += 1
+            self._wait_times.append(0.0)
+            return
+        if self._queued >= self.max_queue:
+            self._counters["rejected"] += 1
+            raise SchedulerFullError(self.retry_after())
+
+        enqueued = time.monotonic()
+        waiter = asyncio.get_running_loop().create_future()
+        self._queues[priority].setdefault(user_id, deque()).append(waiter)
+        self._queued += 1
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed to us just as we were cancelled: pass it on.
+                self._release()
+            else:
+                self._remove(priority, user_id, waiter)
+            raise
+        self._wait_times.append(time.monotonic() - enqueued)
+
+    def _release(self):
+        self._in_flight -= 1
+        while self._in_flight < self.max_in_flight and self._queued:
+            waiter = self._next_waiter()
+            self._queued -= 1
+            if waiter.cancelled():
+                continue
+            self._in_flight += 1
+            waiter.set_result(None)
+
+    def _next_waiter(self):
+        for priority in Priority:
+            users = self._queues[priority]
+            if users:
+                user_id, waiters = next(iter(users.items()))
+                waiter = waiters.popleft()
+                # Round-robin: a user with more work waiting goes to the back of the line.
+                del users[user_id]
+                if waiters:
+                    users[user_id] = waiters
+                return waiter
+        raise RuntimeError("LLM scheduler queue count is out of sync")
+
+    def _remove(self, priority: Priority, user_id: str, waiter):
+        waiters = self._queues[priority].get(user_id)
+        if waiters and waiter in waiters:
+            waiters.remove(waiter)
+            self._queued -= 1
+            if not waiters:
+                del self._queues[priority][user_id]
+
+
+llm_scheduler = LLMScheduler()
@@ -0,0 +1,93 @@
+# /services/partitions.py
+
+import os
+import asyncio
+import datetime
+import sqlalchemy
+from dateutil.relativedelta import relativedelta
+from config.database import engine
+
+# Monthly partitions are kept this many months ahead of today so inserts never land in DEFAULT.
+PARTITION_MONTHS_AHEAD = int(os.environ.get("PARTITION_MONTHS_AHEAD", "3"))
+PARTITION_MAINTENANCE_HOURS = float(os.environ.get("PARTITION_MAINTENANCE_HOURS", "24"))
+
+# Creates the monthly partitions of Transactions covering [from_month, to_month]. Rows that had
+# fallen into the DEFAULT partition for a month are moved into that month's new partition.
+ENSURE_PARTITIONS_FUNCTION = """
+CREATE OR REPLACE FUNCTION ensure_transaction_partitions(from_month DATE, to_month DATE)
+RETURNS INTEGER AS $$
+DECLARE
+    month_start DATE := date_trunc('month', from_month)::date;
+    month_end DATE;
+    partition_name TEXT;
+    created INTEGER := 0;
+BEGIN
+    -- Serialize concurrent callers (several workers, ingestion) so each partition is created once.
+    PERFORM pg_advisory_xact_lock(hashtext('ensure_transaction_partitions'));
+    WHILE month_start <= to_month LOOP
+        month_end := (month_start + INTERVAL '1 month')::date;
+        partition_name := format('transactions_y%sm%s', to_char(month_start, 'YYYY'), to_char(month_start, 'MM'));
+        IF to_regclass(partition_name) IS NULL THEN
+            EXECUTE format('CREATE TABLE %I (LIKE transactions INCLUDING DEFAULTS INCLUDING CONSTRAINTS)', partition_name);
+            IF to_regclass('transactions_default') IS NOT NULL THEN
+                EXECUTE format(
+                    'WITH moved AS (DELETE FROM transactions_default WHERE date >= %L AND date < %L RETURNING *) '
+                    'INSERT INTO %I SELECT * FROM moved', month_start, month_end, partition_name);
+            END IF;
+            EXECUTE format('ALTER TABLE transactions ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                           partition_name, month_start, month_end);
+            created := created + 1;
+        END IF;
+        month_start := month_end;
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+
+def period_start(months: int, today: datetime.date | None = None) -> datetime.date:
+    """
+    Same date as `CURRENT_DATE - INTERVAL '<months> months'`, computed in Python. Bound as a
+    parameter, it lets the planner prune Transactions partitions when the query is planned.
+    """
+    return (today or datetime.date.today()) - relativedelta(months=months)
+
+
+def is_partitioned(conn) -> bool:
+    return bool(conn.execute(sqlalchemy.text(
+        "SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('transactions')"
+    )).scalar())
+
+
+def ensure_transaction_partitions(conn, from_date: datetime.date, to_date: datetime.date) -> int:
+    """Creates any missing monthly partitions between the two dates. No-op if Transactions is not partitioned."""
+    if not is_partitioned(conn):
+        return 0
+    if conn.execute(sqlalchemy.text("SELECT to_regprocedure('ensure_transaction_partitions(date,date)')")).scalar() is None:
+        conn.execute(sqlalchemy.text(ENSURE_PARTITIONS_FUNCTION))
+    return conn.execute(
+        sqlalchemy.text("SELECT ensure_transaction_partitions(:from_month, :to_month)"),
+        {"from_month": from_date, "to_month": to_date}
+    ).scalar_one()
+
+
+def ensure_upcoming_partitions(months_ahead: int = PARTITION_MONTHS_AHEAD) -> int:
+    """Creates partitions from the current month to `months_ahead` months out. Blocking."""
+    today = datetime.date.today()
+    with engine.connect() as conn:
+        created = ensure_transaction_partitions(conn, today, today + relativedelta(months=months_ahead))
+        conn.commit()
+    if created:
+        print(f"🗂️ Created {created} Transactions partition(s).")
+    return created
+
+
+async def maintain_partitions():
+    """Background task: keeps partitions created ahead of time. Cancel it on shutdown."""
+    while True:
+        try:
+            await asyncio.to_thread(ensure_upcoming_partitions)
+        except Exception as e:
+            print(f"⚠️ Transactions partition maintenance failed: {e}")
+        await asyncio.sleep(PARTITION_MAINTENANCE_HOURS * 3600)
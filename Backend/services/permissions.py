@@ -1,33 +1,57 @@
 # /services/permissions.py
 
+import os
+import time
 import sqlalchemy
 from config.database import engine
+from services.change_feed import change_feed
+
+# Permissions are read on every chat turn and tool call. Cached per worker; a change made on any
+# worker drops the entry through the change feed, the TTL only bounds a feed outage.
+PERMISSIONS_CACHE_TTL = float(os.environ.get("PERMISSIONS_CACHE_TTL", "300"))
+_permissions_cache = {}
+
+
+@change_feed.subscribe
+def _drop_cached_permissions(event: dict):
+    if event["table"] in ("users", "*"):
+        _permissions_cache.pop(event["user_id"], None)
+
 
 def get_user_permissions(user_id: str) -> dict:
-    """Fetch user permissions from the database."""
+    """Fetch user permissions, from this worker's cache when fresh."""
     if not engine:
         raise ConnectionError("Database engine is not available.")
+    cached = _permissions_cache.get(user_id)
+    if cached and cached[1] > time.monotonic():
+        return cached[0]
     try:
-        with engine.connect() as conn:
-            result = conn.execute(
-                sqlalchemy.text("""
-                    SELECT perm_assets, perm_liabilities, perm_transactions, 
-                           perm_investments, perm_credit_score, perm_epf_balance
-                    FROM Users WHERE user_id = :user_id
-                """),
-                {"user_id": user_id}
-            ).fetchone()
-            
-            if not result:
-                return {p: False for p in ["perm_assets", "perm_liabilities", "perm_transactions", "perm_investments", "perm_credit_score", "perm_epf_balance"]}
-            
-            return {
-                "perm_assets": result[0], "perm_liabilities": result[1], "perm_transactions": result[2],
-                "perm_investments": result[3], "perm_credit_score": result[4], "perm_epf_balance": result[5]
-            }
+        permissions = _fetch_user_permissions(user_id)
     except Exception as e:
         print(f"❌ Error fetching permissions for {user_id}: {e}")
         return {p: False for p in ["perm_assets", "perm_liabilities", "perm_transactions", "perm_investments", "perm_credit_score", "perm_epf_balance"]}
+    _permissions_cache[user_id] = (permissions, time.monotonic() + PERMISSIONS_CACHE_TTL)
+    return permissions
+
+def _fetch_user_permissions(user_id: str) -> dict:
+    """Fetch user permissions from the database."""
+    with engine.connect() as conn:
+        result = conn.execute(
+            sqlalchemy.text("""
+                SELECT perm_assets, perm_liabilities, perm_transactions, 
+                       perm_investments, perm_credit_score, perm_epf_balance
+                FROM Users WHERE user_id = :user_id AND deleted_at IS NULL
+            """),
+            {"user_id": user_id}
+        ).fetchone()
+        
+        if not result:
+            return {p: False for p in ["perm_assets", "perm_liabilities", "perm_transactions", "perm_investments", "perm_credit_score", "perm_epf_balance"]}
+        
+        return {
+            "perm_assets": result[0], "perm_liabilities": result[1], "perm_transactions": result[2],
+            "perm_investments": result[3], "perm_credit_score": result[4], "perm_epf_balance": result[5]
+        }
 
 def format_permission_instructions(permissions: dict) -> str:
     """Formats a dictionary of permissions into a string for the AI prompt."""
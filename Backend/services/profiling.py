@@ -0,0 +1,331 @@
+# /services/profiling.py
+
+import io
+import os
+import sys
+import hmac
+import json
+import time
+import uuid
+import pstats
+import asyncio
+import cProfile
+import threading
+import contextvars
+from collections import Counter, defaultdict
+from urllib.parse import parse_qs, parse_qsl, urlencode
+import sqlalchemy
+from config.database import engine
+
+try:
+    from pyinstrument import Profiler as PyinstrumentProfiler
+except ImportError:
+    PyinstrumentProfiler = None
+
+# Shared secret for the profiling surface (request flag and admin endpoints). Empty disables it.
+PROFILING_ADMIN_TOKEN = os.environ.get("PROFILING_ADMIN_TOKEN", "")
+PROFILE_HEADER = "X-Profile-Token"
+PROFILE_QUERY_FLAG = "_profile"
+PROFILE_ID_HEADER = "X-Profile-Id"
+# Stored profiles kept; older ones are deleted as new ones arrive.
+PROFILE_RETENTION = int(os.environ.get("PROFILE_RETENTION", "200"))
+# Functions listed in a cProfile report (when pyinstrument is not installed).
+PROFILE_TOP_FUNCTIONS = int(os.environ.get("PROFILE_TOP_FUNCTIONS", "40"))
+PROFILE_SQL_MAX_CHARS = 500
+# Continuous sampling rate per worker; 0 leaves it off until enabled from the admin endpoint.
+PROFILE_SAMPLE_HZ = float(os.environ.get("PROFILE_SAMPLE_HZ", "0"))
+# Distinct stacks kept per route; rarer ones past this are counted under "(other)".
+PROFILE_MAX_STACKS = int(os.environ.get("PROFILE_MAX_STACKS", "2000"))
+
+# The profile of the request being served, if it asked for one. Read by the SQL and LLM hooks.
+current_profile = contextvars.ContextVar("current_profile", default=None)
+
+
+def is_admin(token: str | None) -> bool:
+    return bool(PROFILING_ADMIN_TOKEN) and token is not None and hmac.compare_digest(token, PROFILING_ADMIN_TOKEN)
+
+
+# --- One request ---
+
+class RequestProfile:
+    """Profiler output and the SQL and LLM timings of one request."""
+
+    def __init__(self, method: str, path: str, query: str):
+        self.id = uuid.uuid4().hex
+        self.method = method
+        self.path = path
+        self.query = query
+        self.status = None
+        self.sql = []
+        self.llm = []
+        self.report = ""
+        self.profiler = "pyinstrument" if PyinstrumentProfiler else "cProfile"
+        self.started = time.perf_counter()
+        self.duration_ms = None
+        self._lock = threading.Lock()
+
+    def add_sql(self, statement: str, seconds: float, rows: int):
+        with self._lock:
+            self.sql.append({"statement": " ".join(statement.split())[:PROFILE_SQL_MAX_CHARS],
+                             "ms": round(seconds * 1000, 2), "rows": rows})
+
+    def add_llm(self, provider: str, seconds: float, hedged: bool):
+        with self._lock:
+            self.llm.append({"provider": provider, "ms": round(seconds * 1000, 1), "hedged": hedged})
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id, "method": self.method, "path": self.path, "query": self.query, "status": self.status,
+            "duration_ms": self.duration_ms, "profiler": self.profiler, "report": self.report,
+            "sql": self.sql, "sql_ms": round(sum(s["ms"] for s in self.sql), 2),
+            "llm": self.llm, "llm_ms": round(sum(c["ms"] for c in self.llm), 1),
+        }
+
+
+def record_llm_call(provider: str, seconds: float, hedged: bool = False):
+    """Called by the LLM router after each model call; a no-op outside profiled requests."""
+    profile = current_profile.get()
+    if profile is not None:
+        profile.add_llm(provider, seconds, hedged)
+
+
+@sqlalchemy.event.listens_for(sqlalchemy.engine.Engine, "before_cursor_execute")
+def _sql_started(conn, cursor, statement, parameters, context, executemany):
+    if current_profile.get() is not None:
+        conn.info.setdefault("profile_sql_started", []).append(time.perf_counter())
+
+
+@sqlalchemy.event.listens_for(sqlalchemy.engine.Engine, "after_cursor_execute")
+def _sql_finished(conn, cursor, statement, parameters, context, executemany):
+    profile = current_profile.get()
+    started = conn.info.get("profile_sql_started")
+    if profile is not None and started:
+        profile.add_sql(statement, time.perf_counter() - started.pop(), cursor.rowcount)
+
+
+class _CProfileRun:
+    """cProfile with the start/stop/report shape of pyinstrument's Profiler."""
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+
+    def output_text(self) -> str:
+        out = io.StringIO()
+        pstats.Stats(self.profile, stream=out).sort_stats("cumulative").print_stats(PROFILE_TOP_FUNCTIONS)
+        return out.getvalue()
+
+
+def _stored_query(query_string: bytes) -> str:
+    """The query string without the `_profile` flag, whose value is the admin token."""
+    query = query_string.decode()
+    if PROFILE_QUERY_FLAG not in query:
+        return query
+    return urlencode([(k, v) for k, v in parse_qsl(query, keep_blank_values=True) if k != PROFILE_QUERY_FLAG])
+
+
+class ProfilingMiddleware:
+    """
+    Runs a request under a profiler when it carries the admin token, in the X-Profile-Token
+    header (preferred: query strings end up in access logs) or the `_profile` query parameter,
+    which is stripped from the stored profile. The response gets an X-Profile-Id header; the
+    profile (report plus SQL and LLM timings) is stored once the response has been sent. One
+    profiled request at a time per worker; others run unprofiled.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._busy = threading.Lock()
+
+    @staticmethod
+    def _token(scope) -> str | None:
+        header = PROFILE_HEADER.lower().encode()
+        token = next((value.decode() for name, value in scope["headers"] if name == header), None)
+        if token is None and PROFILE_QUERY_FLAG.encode() in scope.get("query_string", b""):
+            token = parse_qs(scope["query_string"].decode()).get(PROFILE_QUERY_FLAG, [None])[0]
+        return token
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not PROFILING_ADMIN_TOKEN or not is_admin(self._token(scope)):
+            return await self.app(scope, receive, send)
+        if not self._busy.acquire(blocking=False):
+            print(f"⚠️ [PROFILING] Another profile is running, serving {scope['path']} unprofiled.")
+            return await self.app(scope, receive, send)
+
+        profile = RequestProfile(scope["method"], scope["path"], _stored_query(scope.get("query_string", b"")))
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                profile.status = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(PROFILE_ID_HEADER.lower().encode(), profile.id.encode())]
+            await send(message)
+
+        profiler = PyinstrumentProfiler(async_mode="enabled") if PyinstrumentProfiler else _CProfileRun()
+        reset = current_profile.set(profile)
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            profiler.stop()
+            current_profile.reset(reset)
+            self._busy.release()
+            profile.duration_ms = round((time.perf_counter() - profile.started) * 1000, 1)
+            profile.report = profiler.output_text()
+            print(f"🔬 [PROFILING] {profile.method} {profile.path} took {profile.duration_ms} ms, profile {profile.id}")
+            try:
+                await asyncio.to_thread(save_profile, profile)
+            except Exception as e:
+                print(f"⚠️ [PROFILING] Could not store profile {profile.id}: {e}")
+
+
+# --- Stored profiles ---
+
+def save_profile(profile: RequestProfile):
+    """Stores the profile and trims the table to PROFILE_RETENTION rows. Blocking."""
+    if not engine:
+        raise RuntimeError("Database not connected")
+    data = profile.to_dict()
+    with engine.connect() as conn:
+        conn.execute(
+            sqlalchemy.text("""
+                INSERT INTO request_profiles (id, method, path, query, status, duration_ms, profiler, report, sql, llm)
+                VALUES (:id, :method, :path, :query, :status, :duration_ms, :profiler, :report, :sql, :llm)
+            """),
+            {**{k: data[k] for k in ("id", "method", "path", "query", "status", "duration_ms", "profiler", "report")},
+             "sql": json.dumps(data["sql"]), "llm": json.dumps(data["llm"])}
+        )
+        conn.execute(
+            sqlalchemy.text("""
+                DELETE FROM request_profiles WHERE id NOT IN (
+                    SELECT id FROM request_profiles ORDER BY created_at DESC LIMIT :keep
+                )
+            """),
+            {"keep": PROFILE_RETENTION}
+        )
+        conn.commit()
+
+
+def list_profiles(conn, limit: int = 50, path: str | None = None) -> list[dict]:
+    rows = conn.execute(
+        sqlalchemy.text("""
+            SELECT id, created_at, method, path, status, duration_ms, profiler,
+                   jsonb_array_length(sql), jsonb_array_length(llm)
+            FROM request_profiles
+            WHERE CAST(:path AS VARCHAR) IS NULL OR path = :path
+            ORDER BY created_at DESC
+            LIMIT :limit
+        """),
+        {"path": path, "limit": limit}
+    ).fetchall()
+    return [
+        {"id": r[0], "created_at": r[1].isoformat(), "method": r[2], "path": r[3], "status": r[4],
+         "duration_ms": r[5], "profiler": r[6], "sql_statements": r[7], "llm_calls": r[8]}
+        for r in rows
+    ]
+
+
+def get_profile(conn, profile_id: str) -> dict | None:
+    row = conn.execute(
+        sqlalchemy.text("""
+            SELECT id, created_at, method, path, query, status, duration_ms, profiler, report, sql, llm
+            FROM request_profiles WHERE id = :id
+        """),
+        {"id": profile_id}
+    ).fetchone()
+    if row is None:
+        return None
+    return {"id": row[0], "created_at": row[1].isoformat(), "method": row[2], "path": row[3], "query": row[4],
+            "status": row[5], "duration_ms": row[6], "profiler": row[7], "report": row[8], "sql": row[9], "llm": row[10]}
+
+
+# --- Continuous sampling ---
+
+class StackSampler:
+    """
+    Low-rate statistical profiler for every request. A daemon thread reads the stack of every
+    thread `hz` times a second; a stack that passes through a route's endpoint function counts
+    one sample for that route, in folded form ("outer;inner;leaf"), so each route aggregates
+    into a flamegraph. Only time a handler is on a stack is seen (CPU and blocking calls), not
+    time it spends awaiting.
+    """
+
+    def __init__(self):
+        self.hz = 0.0
+        self.routes = {}
+        self.stacks = defaultdict(Counter)
+        self.samples = Counter()
+        self.started_at = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def bind(self, app):
+        """Maps each route's endpoint code object to its "METHOD /path" label."""
+        for route in app.routes:
+            endpoint = getattr(route, "endpoint", None)
+            if endpoint is not None and hasattr(endpoint, "__code__"):
+                methods = ",".join(sorted(getattr(route, "methods", None) or ["WS"]))
+                self.routes[endpoint.__code__] = f"{methods} {route.path}"
+
+    def start(self, hz: float):
+        self.stop()
+        if hz <= 0:
+            return
+        self.hz = hz
+        self.started_at = time.time()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+        print(f"🔬 [PROFILING] Sampling stacks at {hz:g} Hz.")
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join(timeout=1)
+            self._thread = None
+        self.hz = 0.0
+
+    def reset(self):
+        self.stacks.clear()
+        self.samples.clear()
+        self.started_at = time.time() if self.hz else None
+
+    def _run(self):
+        own = threading.get_ident()
+        interval = 1.0 / self.hz
+        while not self._stop.wait(interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id != own:
+                    self._record(frame)
+
+    def _record(self, frame):
+        names = []
+        route = None
+        while frame is not None:
+            code = frame.f_code
+            if route is None and code in self.routes:
+                route = self.routes[code]
+            names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+            frame = frame.f_back
+        if route is None:
+            return
+        folded = ";".join(reversed(names))
+        stacks = self.stacks[route]
+        if folded not in stacks and len(stacks) >= PROFILE_MAX_STACKS:
+            folded = "(other)"
+        stacks[folded] += 1
+        self.samples[route] += 1
+
+    def folded(self, route: str) -> str:
+        """Brendan Gregg's folded stack format, as read by flamegraph.pl and speedscope."""
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.get(route, Counter()).most_common())
+
+    def status(self) -> dict:
+        return {"hz": self.hz, "since": self.started_at, "routes": dict(self.samples.most_common())}
+
+
+stack_sampler = StackSampler()
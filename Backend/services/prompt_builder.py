@@ -0,0 +1,130 @@
+# /services/prompt_builder.py
+
+import os
+import time
+from dataclasses import dataclass, field
+from langchain_core.messages import BaseMessage, HumanMessage, AIMessage
+
+PROMPT_TOKEN_BUDGET = int(os.environ.get("PROMPT_TOKEN_BUDGET", "3000"))
+# Left free for the agent scratchpad (tool calls and tool results) within the budget.
+PROMPT_SCRATCHPAD_RESERVE = int(os.environ.get("PROMPT_SCRATCHPAD_RESERVE", "1200"))
+PROMPT_SUMMARY_TOKENS = int(os.environ.get("PROMPT_SUMMARY_TOKENS", "150"))
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except ImportError:
+    _encoding = None
+
+
+def count_tokens(text: str) -> int:
+    """Token count with tiktoken when installed, otherwise the usual ~4 characters per token estimate."""
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    return (len(text) + 3) // 4
+
+
+def _message_text(message: BaseMessage) -> str:
+    content = message.content
+    if isinstance(content, list):
+        return " ".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in content)
+    return content
+
+
+def count_message_tokens(messages: list) -> int:
+    # ~4 tokens of role/separator overhead per message in chat formats.
+    return sum(count_tokens(_message_text(m)) + 4 for m in messages)
+
+
+def format_user_context(user_id: str, permission_instructions: str) -> str:
+    """The per-user part of the system prompt. Stable across turns, so providers can cache the prefix."""
+    return f"""
+    **Session Context:**
+    You are answering for user_id: {user_id}. The database tool is already scoped to this user.
+
+    {permission_instructions}
+    """
+
+
+@dataclass
+class AgentPrompt:
+    user_context: str
+    chat_history: list
+    question: str
+    report: dict = field(default_factory=dict)
+
+
+def summarize_messages(messages: list, max_tokens: int = PROMPT_SUMMARY_TOKENS) -> str:
+    """Cheap extractive summary of dropped turns: the gist of each earlier question, newest kept first."""
+    topics = []
+    used = count_tokens("Earlier in this conversation the user asked about: ")
+    for message in reversed(messages):
+        if not isinstance(message, HumanMessage):
+            continue
+        gist = " ".join(_message_text(message).split())[:80]
+        cost = count_tokens(gist) + 1
+        if used + cost > max_tokens:
+            break
+        topics.append(gist)
+        used += cost
+    if not topics:
+        return ""
+    return "Earlier in this conversation the user asked about: " + "; ".join(reversed(topics))
+
+
+def trim_history(messages: list, max_tokens: int) -> tuple[list, list]:
+    """Keeps the newest messages that fit in `max_tokens`; returns (kept, dropped)."""
+    kept = []
+    used = 0
+    for message in reversed(messages):
+        cost = count_message_tokens([message])
+        if used + cost > max_tokens:
+            break
+        kept.append(message)
+        used += cost
+    kept.reverse()
+    # Never start the window on an assistant reply whose question was dropped.
+    while kept and isinstance(kept[0], AIMessage):
+        kept.pop(0)
+    return kept, messages[:len(messages) - len(kept)]
+
+
+def build_agent_prompt(system_prompt: str, user_id: str, permission_instructions: str, question: str,
+                       history: list, budget: int = PROMPT_TOKEN_BUDGET) -> AgentPrompt:
+    """
+    Assembles the agent inputs within a token budget.
+
+    Static rules live once in the system prompt together with the user context; the human turn is
+    just the question. Whatever budget is left after those and the scratchpad reserve goes to the
+    most recent history, and older turns are folded into a one-line summary.
+    """
+    started = time.perf_counter()
+    user_context = format_user_context(user_id, permission_instructions)
+    fixed_tokens = count_tokens(system_prompt) + count_tokens(user_context) + count_tokens(question) + 8
+    history_budget = max(budget - fixed_tokens - PROMPT_SCRATCHPAD_RESERVE, 0)
+
+    kept, dropped = trim_history(list(history), history_budget)
+    summary = summarize_messages(dropped) if dropped else ""
+    if summary:
+        summary_message = HumanMessage(content=summary)
+        while kept and count_message_tokens([summary_message, *kept]) > history_budget:
+            kept.pop(0)
+            while kept and isinstance(kept[0], AIMessage):
+                kept.pop(0)
+        kept = [summary_message, *kept]
+
+    history_tokens = count_message_tokens(kept)
+    report = {
+        "budget": budget,
+        "system_tokens": count_tokens(system_prompt) + count_tokens(user_context),
+        "history_tokens": history_tokens,
+        "question_tokens": count_tokens(question),
+        "total_tokens": fixed_tokens + history_tokens,
+        "history_messages_kept": len(kept) - (1 if summary else 0),
+        "history_messages_dropped": len(dropped),
+        "summarized": bool(summary),
+        "assembly_ms": round((time.perf_counter() - started) * 1000, 3),
+    }
+    return AgentPrompt(user_context=user_context, chat_history=kept, question=question, report=report)
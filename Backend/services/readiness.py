@@ -0,0 +1,61 @@
+# /services/readiness.py
+
+import os
+import time
+import asyncio
+import traceback
+from config.database import engine
+from config.replicas import replica_router
+from services.change_feed import change_feed
+
+# Backoff between agent build attempts (e.g. database or provider unreachable at boot).
+AGENT_INIT_RETRY_BASE = float(os.environ.get("AGENT_INIT_RETRY_BASE", "2"))
+AGENT_INIT_RETRY_MAX = float(os.environ.get("AGENT_INIT_RETRY_MAX", "60"))
+# Whether /readyz also waits for the agent. Off by default: the dashboard does not need it,
+# and the AI endpoints already answer 503 until it is built.
+READYZ_REQUIRE_AGENT = os.environ.get("READYZ_REQUIRE_AGENT", "false").lower() == "true"
+
+process_started = time.monotonic()
+agent_status = {"status": "pending", "attempts": 0, "error": None, "ready_after_s": None}
+
+
+async def init_agent_in_background(init_func, on_ready):
+    """
+    Builds the agent off the event loop, retrying with exponential backoff until it succeeds.
+    `on_ready` receives whatever `init_func` returns. Start it with asyncio.create_task and
+    cancel the task on shutdown.
+    """
+    while True:
+        agent_status["status"] = "initializing"
+        agent_status["attempts"] += 1
+        try:
+            result = await asyncio.to_thread(init_func)
+        except Exception as e:
+            delay = min(AGENT_INIT_RETRY_BASE * 2 ** (agent_status["attempts"] - 1), AGENT_INIT_RETRY_MAX)
+            agent_status.update(status="retrying", error=str(e))
+            print(f"🔥 AI agent initialization failed (attempt {agent_status['attempts']}), retrying in {delay:.0f}s: {e}")
+            if agent_status["attempts"] == 1:
+                print(f"Full traceback: {traceback.format_exc()}")
+            await asyncio.sleep(delay)
+            continue
+        on_ready(result)
+        agent_status.update(status="ready", error=None, ready_after_s=round(time.monotonic() - process_started, 2))
+        print(f"Startup complete. AI agent ready {agent_status['ready_after_s']}s after process start.")
+        return
+
+
+def readiness_report() -> tuple[bool, dict]:
+    """(ready, details) for /readyz. Blocking: pings the database."""
+    database = engine.status()
+    agent_ready = agent_status["status"] == "ready"
+    ready = database["ready"] and (agent_ready or not READYZ_REQUIRE_AGENT)
+    return ready, {
+        "status": "ready" if ready else "not_ready",
+        "database": database,
+        "agent": agent_status,
+        # Informational: reads fall back to the primary when no replica is usable.
+        "replicas": replica_router.status() if replica_router.enabled else None,
+        # Informational: while it is not "listening", other workers' writes reach this one by polling.
+        "change_feed": change_feed.status(),
+        "uptime_s": round(time.monotonic() - process_started, 1),
+    }
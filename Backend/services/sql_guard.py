@@ -0,0 +1,255 @@
+# /services/sql_guard.py
+
+import os
+import re
+import json
+import sqlalchemy
+from sqlalchemy.exc import SQLAlchemyError
+
+# Checks every statement the SQL agent runs before it reaches Postgres; off runs them as written.
+AGENT_SQL_GUARD_ENABLED = os.environ.get("AGENT_SQL_GUARD_ENABLED", "true").lower() == "true"
+# Rows an agent query may return; larger or missing top-level LIMITs are lowered or added.
+AGENT_SQL_MAX_ROWS = int(os.environ.get("AGENT_SQL_MAX_ROWS", "100"))
+# Planner cost (EXPLAIN total cost) above which a query is refused before it runs.
+AGENT_SQL_MAX_COST = float(os.environ.get("AGENT_SQL_MAX_COST", "50000"))
+# statement_timeout for each agent query, in milliseconds.
+AGENT_SQL_STATEMENT_TIMEOUT_MS = int(os.environ.get("AGENT_SQL_STATEMENT_TIMEOUT_MS", "5000"))
+# The only tables the SQL agent sees and may scan (their partitions included). Internal tables
+# (profiles, rate limit buckets, logs, agent versions) hold other users' data or none at all.
+AGENT_SQL_TABLES = tuple(
+    t.strip().lower() for t in
+    os.environ.get("AGENT_SQL_TABLES", "users,transactions,assets,investments,liabilities,subscriptions").split(",")
+    if t.strip()
+)
+
+# Anything that writes, changes the session or reaches outside the database.
+FORBIDDEN_KEYWORDS = {
+    "insert", "update", "delete", "merge", "truncate", "drop", "alter", "create", "grant", "revoke",
+    "copy", "call", "do", "lock", "vacuum", "analyze", "cluster", "reindex", "refresh", "set", "reset",
+    "listen", "notify", "prepare", "execute", "deallocate", "discard", "comment", "security",
+}
+FORBIDDEN_FUNCTIONS = {
+    "pg_sleep", "pg_read_file", "pg_read_binary_file", "pg_ls_dir", "pg_stat_file", "lo_import", "lo_export",
+    "dblink", "dblink_exec", "pg_terminate_backend", "pg_cancel_backend", "set_config", "pg_notify",
+}
+
+_COMMENT = re.compile(r"--[^\n]*|/\*.*?\*/", re.S)
+_LITERAL = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"")
+_TOKEN = re.compile(r"[A-Za-z_][\w$]*|\d+|[();,]")
+_USER_ID_LITERAL = re.compile(r"user_id\)?(?:::[a-z ]+?)?\s*(?:=|<>|!=|<|>|<=|>=)\s*'((?:[^']|'')*)'")
+_USER_ID_EQUALS = re.compile(r"\(?(?:\w+\.)?user_id\)?(?:::[a-z ]+?)?\s*=\s*'((?:[^']|'')*)'(?:::[a-z ]+)?")
+
+
+class QueryRejectedError(SQLAlchemyError):
+    """Raised instead of running an agent query that breaks a guard rule; the agent sees the message and rewrites."""
+
+    def __init__(self, reason: str):
+        super().__init__(f"Query rejected: {reason}")
+
+
+def _tokens(statement: str) -> list[tuple[str, int, int, int]]:
+    """
+    Lower-cased keywords and punctuation outside comments and literals, each with its parenthesis
+    depth and its (start, end) offsets in `statement`.
+    """
+    blank = lambda match: " " * len(match.group())
+    bare = _LITERAL.sub(blank, _COMMENT.sub(blank, statement))
+    depth = 0
+    tokens = []
+    for match in _TOKEN.finditer(bare):
+        token = match.group()
+        if token == ")":
+            depth -= 1
+        tokens.append((token.lower(), depth, match.start(), match.end()))
+        if token == "(":
+            depth += 1
+    return tokens
+
+
+def check_statement(statement: str, max_rows: int = AGENT_SQL_MAX_ROWS) -> str:
+    """
+    Lexical checks: one statement, SELECT (or WITH ... SELECT) only, no writes or side-effect
+    functions anywhere. Returns the statement to run, capped at `max_rows`: a larger top-level
+    LIMIT (or FETCH FIRST) count is lowered in place and a missing one appended, so ORDER BY
+    still applies; a count that is not a plain number is capped by wrapping the statement.
+    """
+    statement = statement.strip().rstrip(";").strip()
+    tokens = _tokens(statement)
+    if not tokens:
+        raise QueryRejectedError("empty statement")
+    if any(token == ";" for token, *_ in tokens):
+        raise QueryRejectedError("only one statement can be run at a time")
+    if tokens[0][0] not in ("select", "with"):
+        raise QueryRejectedError("only SELECT queries are allowed")
+    for i, (token, *_) in enumerate(tokens):
+        if token in FORBIDDEN_KEYWORDS:
+            raise QueryRejectedError(f"{token.upper()} is not allowed, only read-only SELECT queries")
+        if token in FORBIDDEN_FUNCTIONS and i + 1 < len(tokens) and tokens[i + 1][0] == "(":
+            raise QueryRejectedError(f"{token}() is not allowed")
+        if token == "into" and tokens[0][0] == "select":
+            raise QueryRejectedError("SELECT INTO is not allowed")
+
+    top_level = [t for t in tokens if t[1] == 0]
+    words = [t[0] for t in top_level]
+    count = None
+    if "limit" in words:
+        count = words.index("limit") + 1
+    elif "fetch" in words and words[words.index("fetch") + 1:words.index("fetch") + 2] in (["first"], ["next"]):
+        count = words.index("fetch") + 2
+    if count is not None and count < len(top_level) and (top_level[count][0].isdigit() or top_level[count][0] == "all"):
+        _, _, start, end = top_level[count]
+        if top_level[count][0] == "all" or int(top_level[count][0]) > max_rows:
+            return f"{statement[:start]}{max_rows}{statement[end:]}"
+        return statement
+    if count is None:
+        # On its own line, so a trailing -- comment cannot swallow it.
+        return f"{statement}\nLIMIT {max_rows}"
+    return f"SELECT * FROM (\n{statement}\n) AS guarded_query LIMIT {max_rows}"
+
+
+def user_tables(conn) -> set[str]:
+    """
+    Tables (partitions included) with a user_id column: every scan of them must be scoped to the
+    user. Read per statement, since Transactions partitions are created as dates arrive.
+    """
+    return set(conn.execute(sqlalchemy.text("""
+        SELECT DISTINCT table_name FROM information_schema.columns
+        WHERE column_name = 'user_id' AND table_schema = current_schema()
+    """)).scalars().all())
+
+
+def agent_relations(conn, tables: tuple[str, ...] = AGENT_SQL_TABLES) -> set[str]:
+    """`tables` and all their partitions, by the names EXPLAIN reports them under."""
+    return set(conn.execute(sqlalchemy.text("""
+        SELECT c.relname FROM unnest(CAST(:tables AS text[])) AS t(name)
+        CROSS JOIN LATERAL pg_partition_tree(to_regclass(t.name)) AS p
+        JOIN pg_class c ON c.oid = p.relid
+    """), {"tables": list(tables)}).scalars().all())
+
+
+def _walk(node: dict):
+    yield node
+    for child in node.get("Plans", ()):
+        yield from _walk(child)
+
+
+def _conditions(node: dict) -> list[str]:
+    """Every condition Postgres applies at a scan, including those of a bitmap scan's index children."""
+    conditions = [node[key] for key in ("Filter", "Index Cond", "Recheck Cond", "TID Cond") if node.get(key)]
+    for child in node.get("Plans", ()):
+        if child.get("Node Type", "").startswith("Bitmap"):
+            conditions += _conditions(child)
+    return conditions
+
+
+def _closing(text: str, start: int) -> int:
+    """Index of the parenthesis closing the one at `start`, skipping quoted literals."""
+    depth, quoted = 0, False
+    for i in range(start, len(text)):
+        char = text[i]
+        if char == "'":
+            quoted = not quoted
+        elif quoted:
+            continue
+        elif char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+            if depth == 0:
+                return i
+    return -1
+
+
+def _unwrap(term: str) -> str:
+    term = term.strip()
+    while term.startswith("(") and _closing(term, 0) == len(term) - 1:
+        term = term[1:-1].strip()
+    return term
+
+
+def _conjuncts(condition: str) -> list[str]:
+    """The top-level AND terms of a plan condition: "((a = 1) AND (b OR c))" -> ["a = 1", "b OR c"]."""
+    condition = _unwrap(condition)
+    terms, depth, quoted, start = [], 0, False, 0
+    for i, char in enumerate(condition):
+        if char == "'":
+            quoted = not quoted
+        elif quoted:
+            continue
+        elif char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif depth == 0 and condition.startswith(" AND ", i):
+            terms.append(condition[start:i])
+            start = i + len(" AND ")
+    terms.append(condition[start:])
+    return [_unwrap(term) for term in terms]
+
+
+def _scoped(node: dict, expected: str) -> bool:
+    """Whether a scan's conditions include `user_id = <expected>` as a conjunct, so no OR can widen it."""
+    for condition in _conditions(node):
+        for term in _conjuncts(condition):
+            match = _USER_ID_EQUALS.fullmatch(term)
+            if match is not None and match.group(1) == expected:
+                return True
+    return False
+
+
+def check_plan(plan: dict, user_id: str | None, protected: set[str], allowed: set[str] | None = None,
+               max_cost: float = AGENT_SQL_MAX_COST):
+    """
+    Plan checks on EXPLAIN (FORMAT JSON) output: no writes, no scans outside `allowed` (when
+    given), total cost under `max_cost`, and every scan of a user table restricted to `user_id`. Postgres carries a constant through
+    equality joins, so a join on user_id shows the filter on both sides. Any user_id literal
+    other than the user's is refused.
+    """
+    root = plan["Plan"]
+    nodes = list(_walk(root))
+    if any(n.get("Node Type") == "ModifyTable" for n in nodes):
+        raise QueryRejectedError("only read-only SELECT queries are allowed")
+    if allowed is not None:
+        outside = sorted({n["Relation Name"] for n in nodes if "Relation Name" in n and n["Relation Name"] not in allowed})
+        if outside:
+            raise QueryRejectedError(
+                f"{', '.join(outside)} cannot be queried; only these tables can: {', '.join(AGENT_SQL_TABLES)}"
+            )
+    cost = root.get("Total Cost", 0)
+    if cost > max_cost:
+        raise QueryRejectedError(
+            f"estimated cost {cost:,.0f} is over the limit of {max_cost:,.0f}; filter by date or category, "
+            "aggregate with GROUP BY, or avoid joins without a join condition"
+        )
+
+    scans = [n for n in nodes if n.get("Relation Name") in protected]
+    if not scans:
+        return
+    if user_id is None:
+        raise QueryRejectedError("user data can only be queried within a user's chat turn")
+    expected = user_id.replace("'", "''")
+    for node in nodes:
+        if any(literal != expected for c in _conditions(node) for literal in _USER_ID_LITERAL.findall(c)):
+            raise QueryRejectedError("queries may only read the current user's rows")
+    unscoped = sorted({scan["Relation Name"] for scan in scans if not _scoped(scan, expected)})
+    if unscoped:
+        raise QueryRejectedError(f"filter {', '.join(unscoped)} with WHERE user_id = '{user_id}'")
+
+
+def guarded_execute(connection, statement: str, user_id: str | None, parameters=None):
+    """
+    Runs an agent query on `connection` (inside its transaction) after the lexical and plan
+    checks: read-only, with a statement_timeout. The protected and allowed tables are read in the
+    same transaction as the plan. Returns the statement run and its result.
+    """
+    command = check_statement(statement)
+    connection.execute(sqlalchemy.text("SET TRANSACTION READ ONLY"))
+    protected = user_tables(connection)
+    allowed = agent_relations(connection)
+    connection.execute(sqlalchemy.text("SELECT set_config('statement_timeout', :timeout, true)"),
+                       {"timeout": str(AGENT_SQL_STATEMENT_TIMEOUT_MS)})
+    plan = connection.execute(sqlalchemy.text(f"EXPLAIN (FORMAT JSON) {command}"), parameters or {}).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    check_plan(plan[0], user_id, protected, allowed)
+    return command, connection.execute(sqlalchemy.text(command), parameters or {})
@@ -0,0 +1,341 @@
+# /services/subscriptions.py
+
+import os
+import math
+import asyncio
+import datetime
+import numpy as np
+import sqlalchemy
+from dateutil.relativedelta import relativedelta
+from config.database import engine
+from services.categorizer import normalize_many, recurrence_key
+from services.partitions import period_start
+from services.data_version import bump_data_version
+
+# Months of history a full detection reads (bounded, so it prunes Transactions partitions).
+SUBSCRIPTION_LOOKBACK_MONTHS = int(os.environ.get("SUBSCRIPTION_LOOKBACK_MONTHS", "24"))
+# Charges of one merchant whose amounts differ by more than this ratio step are separate subscriptions.
+SUBSCRIPTION_AMOUNT_BAND = float(os.environ.get("SUBSCRIPTION_AMOUNT_BAND", "0.2"))
+SUBSCRIPTION_MIN_OCCURRENCES = int(os.environ.get("SUBSCRIPTION_MIN_OCCURRENCES", "3"))
+# Share of the gaps between charges that must match the period.
+SUBSCRIPTION_MIN_REGULARITY = float(os.environ.get("SUBSCRIPTION_MIN_REGULARITY", "0.7"))
+SUBSCRIPTION_REFRESH_SECONDS = float(os.environ.get("SUBSCRIPTION_REFRESH_SECONDS", "60"))
+
+# What a client sees of a subscription; a full detection that changes none of it is not a change.
+_VISIBLE_FIELDS = ("merchant_key", "description", "category", "type", "amount", "period", "occurrences",
+                   "first_date", "last_date", "next_expected")
+
+# Period name -> (days, tolerance in days).
+PERIODS = {
+    "weekly": (7, 1),
+    "biweekly": (14, 2),
+    "monthly": (30.44, 4),
+    "quarterly": (91.31, 8),
+    "yearly": (365.25, 15),
+}
+_PERIOD_NAMES = list(PERIODS)
+_PERIOD_DAYS = np.array([days for days, _ in PERIODS.values()])
+_PERIOD_TOLERANCE = np.array([tolerance for _, tolerance in PERIODS.values()])
+_PERIOD_STEP = {
+    "weekly": relativedelta(weeks=1),
+    "biweekly": relativedelta(weeks=2),
+    "monthly": relativedelta(months=1),
+    "quarterly": relativedelta(months=3),
+    "yearly": relativedelta(years=1),
+}
+
+
+def detect_recurring(transactions: list[dict]) -> list[dict]:
+    """
+    Recurring payments and incomes among transactions (dicts with id, date, description, category,
+    amount and type). Transactions are grouped by normalized description (numbers and month names
+    dropped), direction and amount band, and every group's gaps between dates are matched against
+    the known periods in whole-array NumPy operations rather than a loop per group.
+    """
+    rows = [t for t in transactions if t.get("date") and t.get("amount")]
+    if not rows:
+        return []
+    keys = [recurrence_key(text) for text in normalize_many([t.get("description") for t in rows])]
+    keep = [i for i, key in enumerate(keys) if key]
+    if not keep:
+        return []
+    rows = [rows[i] for i in keep]
+    group_keys = [f"{'income' if rows[j].get('type') == 'income' else 'expense'}|{keys[i]}" for j, i in enumerate(keep)]
+    _, key_ids = np.unique(np.array(group_keys), return_inverse=True)
+    dates = np.array([_as_date(t["date"]).toordinal() for t in rows])
+    amounts = np.abs(np.array([float(t["amount"]) for t in rows]))
+    log_amounts = np.log(np.maximum(amounts, 0.01))
+
+    # Amount bands: within a description, sorted amounts start a new band at every step larger
+    # than SUBSCRIPTION_AMOUNT_BAND, so gradual price rises stay in one band.
+    order = np.lexsort((log_amounts, key_ids))
+    breaks = (np.diff(key_ids[order]) != 0) | (np.diff(log_amounts[order]) > math.log1p(SUBSCRIPTION_AMOUNT_BAND))
+    groups = np.empty(len(rows), dtype=np.int64)
+    groups[order] = np.concatenate(([0], np.cumsum(breaks)))
+    group_count = int(groups.max()) + 1
+
+    # Gaps between consecutive dates within each group; same-day duplicates are not gaps.
+    order = np.lexsort((dates, groups))
+    g, d = groups[order], dates[order]
+    gaps = np.diff(d)
+    gap_groups = g[1:]
+    valid = (gap_groups == g[:-1]) & (gaps > 0)
+    interval_counts = np.bincount(gap_groups[valid], minlength=group_count)
+    hits = np.abs(gaps[None, :] - _PERIOD_DAYS[:, None]) <= _PERIOD_TOLERANCE[:, None]
+    hit_counts = np.stack([np.bincount(gap_groups[valid & row], minlength=group_count) for row in hits])
+    best_period = hit_counts.argmax(axis=0)
+    regularity = hit_counts.max(axis=0) / np.maximum(interval_counts, 1)
+
+    occurrences = np.bincount(g, minlength=group_count)
+    starts = np.flatnonzero(np.concatenate(([True], g[1:] != g[:-1])))
+    ends = np.concatenate((starts[1:], [len(g)])) - 1
+    sorted_amounts = amounts[order]
+    means = np.bincount(g, weights=sorted_amounts, minlength=group_count) / occurrences
+    variances = np.bincount(g, weights=sorted_amounts ** 2, minlength=group_count) / occurrences - means ** 2
+    variation = np.sqrt(np.maximum(variances, 0)) / np.maximum(means, 0.01)
+
+    detected = []
+    candidates = np.flatnonzero((occurrences >= SUBSCRIPTION_MIN_OCCURRENCES) & (regularity >= SUBSCRIPTION_MIN_REGULARITY))
+    for group in candidates:
+        last = rows[order[ends[group]]]
+        period = _PERIOD_NAMES[best_period[group]]
+        last_date = datetime.date.fromordinal(int(d[ends[group]]))
+        detected.append({
+            "merchant_key": group_keys[order[ends[group]]].split("|", 1)[1],
+            "description": last.get("description"),
+            "category": last.get("category"),
+            "type": "income" if last.get("type") == "income" else "expense",
+            "amount": round(float(sorted_amounts[ends[group]]), 2),
+            "average_amount": round(float(means[group]), 2),
+            "period": period,
+            "occurrences": int(occurrences[group]),
+            "first_date": datetime.date.fromordinal(int(d[starts[group]])),
+            "last_date": last_date,
+            "next_expected": last_date + _PERIOD_STEP[period],
+            "confidence": round(float(regularity[group] * (1 - min(variation[group], 1.0))), 2),
+            "last_transaction_id": last.get("id"),
+        })
+    return detected
+
+
+def _as_date(value) -> datetime.date:
+    return value if isinstance(value, datetime.date) else datetime.date.fromisoformat(str(value)[:10])
+
+
+def _fetch_transactions(conn, user_id: str, since: datetime.date | None = None, after_id: int | None = None) -> list[dict]:
+    where, params = "user_id = :user_id", {"user_id": user_id}
+    if since:
+        where += " AND date >= :since"
+        params["since"] = since
+    if after_id:
+        where += " AND id > :after_id"
+        params["after_id"] = after_id
+    rows = conn.execute(
+        sqlalchemy.text(f"SELECT id, date, description, category, amount, type FROM transactions WHERE {where} ORDER BY id"),
+        params
+    ).mappings().fetchall()
+    return [dict(row) for row in rows]
+
+
+def _save(conn, user_id: str, detected: list[dict]):
+    conn.execute(sqlalchemy.text("DELETE FROM subscriptions WHERE user_id = :user_id"), {"user_id": user_id})
+    if detected:
+        conn.execute(
+            sqlalchemy.text("""
+                INSERT INTO subscriptions (user_id, merchant_key, description, category, type, amount, average_amount,
+                    period, occurrences, first_date, last_date, next_expected, confidence, updated_at)
+                VALUES (:user_id, :merchant_key, :description, :category, :type, :amount, :average_amount,
+                    :period, :occurrences, :first_date, :last_date, :next_expected, :confidence, NOW())
+            """),
+            [{**s, "user_id": user_id} for s in detected]
+        )
+
+
+def _load(conn, user_id: str) -> list[dict]:
+    rows = conn.execute(
+        sqlalchemy.text("""
+            SELECT id, merchant_key, description, category, type, amount, average_amount, period, occurrences,
+                   first_date, last_date, next_expected, confidence
+            FROM subscriptions WHERE user_id = :user_id
+        """),
+        {"user_id": user_id}
+    ).mappings().fetchall()
+    return [dict(row) for row in rows]
+
+
+def _extend(subscription: dict, transaction: dict) -> bool:
+    """
+    Advances a stored subscription by a newer charge of the same merchant and amount band landing
+    on its schedule. False when the charge does not fit it that way.
+    """
+    date = _as_date(transaction["date"])
+    amount = abs(float(transaction["amount"]))
+    days, tolerance = PERIODS[subscription["period"]]
+    if date <= subscription["last_date"] or abs((date - subscription["next_expected"]).days) > tolerance:
+        return False
+    if abs(math.log(max(amount, 0.01) / max(float(subscription["amount"]), 0.01))) > math.log1p(SUBSCRIPTION_AMOUNT_BAND):
+        return False
+    occurrences = subscription["occurrences"] + 1
+    subscription.update({
+        "description": transaction.get("description"),
+        "category": transaction.get("category"),
+        "amount": round(amount, 2),
+        "average_amount": round((float(subscription["average_amount"]) * subscription["occurrences"] + amount) / occurrences, 2),
+        "occurrences": occurrences,
+        "last_date": date,
+        "next_expected": date + _PERIOD_STEP[subscription["period"]],
+    })
+    return True
+
+
+def _visible(subscriptions: list[dict]) -> list[tuple]:
+    return sorted(
+        tuple(str(float(s[f])) if f == "amount" else str(s[f]) for f in _VISIBLE_FIELDS) for s in subscriptions
+    )
+
+
+def refresh_user_subscriptions(conn, user_id: str) -> str:
+    """
+    Brings a user's stored subscriptions up to date with their transactions. Only transactions
+    newer than the last scan are read; when each of them is the next charge of a known
+    subscription, those subscriptions are advanced in place. Anything else (a new merchant, an
+    off-schedule or backdated charge) triggers a full detection over the lookback window. When
+    the stored rows change, the user's data version is bumped. Returns "unchanged", "incremental"
+    or "full". Commits.
+    """
+    # A first scan has no row to lock yet: claim one (scanned_at NULL until the scan is stored) so
+    # concurrent first scans queue on it instead of each writing the detected rows.
+    conn.execute(
+        sqlalchemy.text("""
+            INSERT INTO subscription_scans (user_id, last_transaction_id, scanned_at) VALUES (:user_id, 0, NULL)
+            ON CONFLICT (user_id) DO NOTHING
+        """),
+        {"user_id": user_id}
+    )
+    scan = conn.execute(
+        sqlalchemy.text("SELECT last_transaction_id, scanned_at FROM subscription_scans WHERE user_id = :user_id FOR UPDATE"),
+        {"user_id": user_id}
+    ).fetchone()
+    mode = "full"
+    if scan[1] is not None:
+        new = _fetch_transactions(conn, user_id, after_id=scan[0])
+        if not new:
+            conn.commit()
+            return "unchanged"
+        stored = _load(conn, user_id)
+        by_key = {}
+        for subscription in stored:
+            by_key.setdefault((subscription["type"], subscription["merchant_key"]), []).append(subscription)
+        changed = []
+        new_keys = [recurrence_key(text) for text in normalize_many([t.get("description") for t in new])]
+        for transaction, key in zip(new, new_keys):
+            direction = "income" if transaction.get("type") == "income" else "expense"
+            match = next((s for s in by_key.get((direction, key), []) if _extend(s, transaction)), None)
+            if match is None:
+                break
+            changed.append(match)
+        else:
+            for subscription in {id(s): s for s in changed}.values():
+                conn.execute(
+                    sqlalchemy.text("""
+                        UPDATE subscriptions SET description = :description, category = :category, amount = :amount,
+                            average_amount = :average_amount, occurrences = :occurrences, last_date = :last_date,
+                            next_expected = :next_expected, updated_at = NOW()
+                        WHERE id = :id
+                    """),
+                    subscription
+                )
+            last_id = new[-1]["id"]
+            mode = "incremental"
+
+    changed_rows = mode == "incremental"
+    if mode == "full":
+        history = _fetch_transactions(conn, user_id, since=period_start(SUBSCRIPTION_LOOKBACK_MONTHS))
+        detected = detect_recurring(history)
+        changed_rows = _visible(detected) != _visible(_load(conn, user_id))
+        if changed_rows:
+            _save(conn, user_id, detected)
+        last_id = max((t["id"] for t in history), default=scan[0])
+    if changed_rows:
+        # The stored list is served behind the data-version ETag: a new version makes clients refetch it.
+        bump_data_version(conn, user_id, "subscriptions")
+    conn.execute(
+        sqlalchemy.text("""
+            INSERT INTO subscription_scans (user_id, last_transaction_id, scanned_at) VALUES (:user_id, :last_id, NOW())
+            ON CONFLICT (user_id) DO UPDATE SET last_transaction_id = GREATEST(subscription_scans.last_transaction_id, EXCLUDED.last_transaction_id),
+                scanned_at = NOW()
+        """),
+        {"user_id": user_id, "last_id": last_id}
+    )
+    conn.commit()
+    return mode
+
+
+def get_user_subscriptions(user_id: str, refresh: bool = True) -> list[dict]:
+    """
+    The user's detected subscriptions, soonest next charge first, each with its status today.
+    `refresh` brings them up to date first (row lock, possibly a full detection): request
+    handlers pass False and leave that to run_subscription_refresh. Blocking.
+    """
+    with engine.connect() as conn:
+        if refresh:
+            refresh_user_subscriptions(conn, user_id)
+        subscriptions = _load(conn, user_id)
+    today = datetime.date.today()
+    for subscription in subscriptions:
+        subscription.pop("id")
+        _, tolerance = PERIODS[subscription["period"]]
+        overdue = (today - subscription["next_expected"]).days
+        subscription["status"] = "active" if overdue <= tolerance else "lapsed"
+        for field in ("amount", "average_amount", "confidence"):
+            subscription[field] = float(subscription[field])
+        for field in ("first_date", "last_date", "next_expected"):
+            subscription[field] = subscription[field].isoformat()
+    return sorted(subscriptions, key=lambda s: (s["status"] != "active", s["next_expected"]))
+
+
+def summarize_subscriptions(subscriptions: list[dict]) -> str:
+    """Compact text for the agent: one line per active subscription and a monthly total."""
+    active = [s for s in subscriptions if s["status"] == "active"]
+    if not active:
+        return "No recurring payments detected."
+    per_month = {"weekly": 52 / 12, "biweekly": 26 / 12, "monthly": 1, "quarterly": 1 / 3, "yearly": 1 / 12}
+    lines = [
+        f"- {s['description']} ({s['category'] or 'uncategorized'}, {s['type']}): {s['amount']:.2f} {s['period']}, "
+        f"next on {s['next_expected']}, seen {s['occurrences']} times, confidence {s['confidence']:.2f}"
+        for s in active
+    ]
+    monthly_out = sum(s["amount"] * per_month[s["period"]] for s in active if s["type"] == "expense")
+    return "\n".join(lines + [f"Recurring expenses total about {monthly_out:.2f} per month."])
+
+
+def refresh_changed_users() -> int:
+    """Refreshes every user whose transactions changed since their last scan. Blocking."""
+    with engine.connect() as conn:
+        user_ids = conn.execute(sqlalchemy.text("""
+            SELECT v.user_id FROM user_data_versions v
+            JOIN Users u ON u.user_id = v.user_id AND u.deleted_at IS NULL
+            LEFT JOIN subscription_scans s ON s.user_id = v.user_id
+            WHERE s.user_id IS NULL OR s.scanned_at IS NULL OR v.updated_at > s.scanned_at
+        """)).scalars().all()
+        conn.commit()
+        for user_id in user_ids:
+            try:
+                refresh_user_subscriptions(conn, user_id)
+            except Exception as e:
+                conn.rollback()
+                print(f"⚠️ [SUBSCRIPTIONS] Refreshing {user_id} failed: {e}")
+    return len(user_ids)
+
+
+async def run_subscription_refresh():
+    """Background task: keeps detected subscriptions current as transactions arrive. Cancel it on shutdown."""
+    while True:
+        try:
+            if engine:
+                refreshed = await asyncio.to_thread(refresh_changed_users)
+                if refreshed:
+                    print(f"🔁 [SUBSCRIPTIONS] Refreshed subscriptions of {refreshed} users.")
+        except Exception as e:
+            print(f"⚠️ [SUBSCRIPTIONS] Subscription refresh failed: {e}")
+        await asyncio.sleep(SUBSCRIPTION_REFRESH_SECONDS)
@@ -0,0 +1,226 @@
+# /services/template_insights.py
+
+import os
+import time
+import asyncio
+import datetime
+import sqlalchemy
+from config.database import engine
+from services.agent_registry import agent_registry
+from services.llm_scheduler import llm_scheduler, SchedulerFullError, Priority
+
+# Local hours ("HH:MM-HH:MM", may wrap past midnight) in which insights are recomputed. Empty: any time.
+INSIGHTS_WINDOW = os.environ.get("INSIGHTS_WINDOW", "01:00-06:00")
+# Users whose insights are computed at once; each runs its templates one after the other.
+INSIGHTS_CONCURRENCY = int(os.environ.get("INSIGHTS_CONCURRENCY", "2"))
+# Users picked up per pass, most recently changed first.
+INSIGHTS_BATCH_SIZE = int(os.environ.get("INSIGHTS_BATCH_SIZE", "10"))
+INSIGHTS_POLL_SECONDS = float(os.environ.get("INSIGHTS_POLL_SECONDS", "300"))
+# A claim older than this (its worker died mid-run) can be taken over by another worker.
+INSIGHTS_CLAIM_TIMEOUT = int(os.environ.get("INSIGHTS_CLAIM_TIMEOUT", "1800"))
+
+# The AI Studio templates and the question each one puts to the agent.
+TEMPLATES = [
+    {"id": "investment-review", "title": "Investment Portfolio Review", "category": "investment", "icon": "show_chart",
+     "description": "Get personalized advice on your investment mix",
+     "prompt": "Review my investment portfolio: its allocation across asset types, concentration risks and returns, "
+               "and give me concrete suggestions to improve the mix."},
+    {"id": "budget-optimizer", "title": "Monthly Budget Optimizer", "category": "budgeting", "icon": "pie_chart",
+     "description": "Optimize your monthly spending",
+     "prompt": "Look at my income and spending over the last few months and propose a monthly budget per category, "
+               "pointing out where I could cut back and how much that would save."},
+    {"id": "spending-analysis", "title": "Spending Pattern Analysis", "category": "budgeting", "icon": "analytics",
+     "description": "Analyze your spending habits",
+     "prompt": "Analyze my spending habits: my largest categories, how they changed month to month, recurring "
+               "payments and anything unusual."},
+    {"id": "debt-payoff", "title": "Debt Payoff Strategy", "category": "loans", "icon": "payments",
+     "description": "Create a debt elimination plan",
+     "prompt": "Create a plan to pay off my debts: compare the avalanche and snowball orders for my liabilities "
+               "and tell me how much to pay on each per month."},
+]
+TEMPLATES_BY_ID = {t["id"]: t for t in TEMPLATES}
+
+
+def in_window(now: datetime.datetime | None = None, window: str = INSIGHTS_WINDOW) -> bool:
+    """Whether `now` (local time) falls in the off-peak window."""
+    if not window:
+        return True
+    start, end = (datetime.time.fromisoformat(part.strip()) for part in window.split("-"))
+    current = (now or datetime.datetime.now()).time()
+    if start <= end:
+        return start <= current < end
+    return current >= start or current < end
+
+
+# --- Storage ---
+
+def get_insights(conn, user_id: str) -> dict[str, dict]:
+    """The user's stored insights by template id, each with the data version it was computed for."""
+    rows = conn.execute(
+        sqlalchemy.text("""
+            SELECT template_id, answer, data_version, computed_at, duration_ms FROM template_insights
+            WHERE user_id = :user_id
+        """),
+        {"user_id": user_id}
+    ).fetchall()
+    return {
+        row[0]: {"template_id": row[0], "answer": row[1], "data_version": row[2],
+                 "computed_at": row[3].isoformat() if row[3] else None, "duration_ms": row[4]}
+        for row in rows
+    }
+
+
+def claim_stale_users(limit: int = INSIGHTS_BATCH_SIZE) -> list[tuple[str, int]]:
+    """
+    Claims up to `limit` users whose data changed since their insights were computed (or who have
+    none yet), with their current data version. The claim keeps other workers from running the
+    same user; it is released when the run finishes or times out. Blocking.
+    """
+    with engine.connect() as conn:
+        rows = conn.execute(
+            sqlalchemy.text("""
+                WITH stale AS (
+                    SELECT u.user_id FROM Users u
+                    -- Users who never wrote have no version row yet: they are at version 0.
+                    LEFT JOIN user_data_versions v ON v.user_id = u.user_id
+                    WHERE u.deleted_at IS NULL
+                      AND (SELECT COUNT(*) FROM template_insights i
+                           WHERE i.user_id = u.user_id AND i.data_version = COALESCE(v.version, 0)) < :templates
+                    ORDER BY v.updated_at DESC NULLS LAST
+                    LIMIT :limit
+                )
+                INSERT INTO template_insight_claims (user_id, claimed_at)
+                SELECT user_id, NOW() FROM stale
+                ON CONFLICT (user_id) DO UPDATE SET claimed_at = EXCLUDED.claimed_at
+                    WHERE template_insight_claims.claimed_at < NOW() - make_interval(secs => :timeout)
+                RETURNING user_id
+            """),
+            {"templates": len(TEMPLATES), "limit": limit, "timeout": INSIGHTS_CLAIM_TIMEOUT}
+        ).scalars().all()
+        versions = dict(conn.execute(
+            sqlalchemy.text("SELECT user_id, version FROM user_data_versions WHERE user_id = ANY(:user_ids)"),
+            {"user_ids": list(rows)}
+        ).fetchall()) if rows else {}
+        conn.commit()
+    return [(user_id, versions.get(user_id, 0)) for user_id in rows]
+
+
+def store_insight(user_id: str, template_id: str, data_version: int, answer: str, duration_ms: int):
+    """Upserts one insight, unless a newer version of it was stored meanwhile. Blocking."""
+    with engine.connect() as conn:
+        conn.execute(
+            sqlalchemy.text("""
+                INSERT INTO template_insights (user_id, template_id, data_version, answer, duration_ms, computed_at)
+                VALUES (:user_id, :template_id, :data_version, :answer, :duration_ms, NOW())
+                ON CONFLICT (user_id, template_id) DO UPDATE
+                    SET data_version = EXCLUDED.data_version, answer = EXCLUDED.answer,
+                        duration_ms = EXCLUDED.duration_ms, computed_at = EXCLUDED.computed_at
+                    WHERE template_insights.data_version <= EXCLUDED.data_version
+            """),
+            {"user_id": user_id, "template_id": template_id, "data_version": data_version,
+             "answer": answer, "duration_ms": duration_ms}
+        )
+        conn.commit()
+
+
+def release_claim(user_id: str):
+    with engine.connect() as conn:
+        conn.execute(sqlalchemy.text("DELETE FROM template_insight_claims WHERE user_id = :user_id"), {"user_id": user_id})
+        conn.commit()
+
+
+# --- Batch pipeline ---
+
+class InsightPipeline:
+    """
+    Precomputes the AI Studio template answers for users whose data changed, in the off-peak window.
+
+    Each pass claims a batch of stale users and runs their templates as BACKGROUND work on the LLM
+    scheduler (interactive chat always goes first), at most INSIGHTS_CONCURRENCY users at a time.
+    Answers are stored with the data version they were computed for; the version is read before
+    the run, so a write that lands meanwhile leaves the user stale for the next pass.
+    """
+
+    def __init__(self):
+        self.running = False
+        self._run_turn = agent_registry.run_chat_turn
+        self._is_ready = lambda: agent_registry.current is not None
+        self.stats = {"passes": 0, "users": 0, "computed": 0, "failed": 0, "deferred": 0, "last_pass_at": None}
+
+    async def _compute_user(self, user_id: str, data_version: int, semaphore: asyncio.Semaphore):
+        async with semaphore:
+            try:
+                stored = await asyncio.to_thread(self._stored_versions, user_id)
+                for template in TEMPLATES:
+                    if stored.get(template["id"]) == data_version:
+                        continue
+                    if not in_window():
+                        self.stats["deferred"] += 1
+                        return
+                    started = time.perf_counter()
+                    try:
+                        result = await llm_scheduler.submit(
+                            user_id, self._run_turn, user_id, template["prompt"], False,
+                            priority=Priority.BACKGROUND
+                        )
+                    except SchedulerFullError:
+                        self.stats["deferred"] += 1
+                        return
+                    except Exception as e:
+                        self.stats["failed"] += 1
+                        print(f"⚠️ [INSIGHTS] {template['id']} for {user_id} failed: {e}")
+                        continue
+                    duration_ms = int((time.perf_counter() - started) * 1000)
+                    await asyncio.to_thread(store_insight, user_id, template["id"], data_version, result["answer"], duration_ms)
+                    self.stats["computed"] += 1
+                self.stats["users"] += 1
+            finally:
+                await asyncio.to_thread(release_claim, user_id)
+
+    @staticmethod
+    def _stored_versions(user_id: str) -> dict[str, int]:
+        with engine.connect() as conn:
+            return {template_id: insight["data_version"] for template_id, insight in get_insights(conn, user_id).items()}
+
+    async def run_pass(self) -> int:
+        """Computes insights for one batch of stale users; returns how many insights were stored."""
+        computed = self.stats["computed"]
+        users = await asyncio.to_thread(claim_stale_users)
+        if users:
+            semaphore = asyncio.Semaphore(INSIGHTS_CONCURRENCY)
+            await asyncio.gather(*(self._compute_user(user_id, version, semaphore) for user_id, version in users))
+        self.stats["passes"] += 1
+        self.stats["last_pass_at"] = time.time()
+        return self.stats["computed"] - computed
+
+    async def run(self, run_turn=None, is_ready=None):
+        """
+        Background task: recomputes stale insights during the off-peak window. Cancel it on shutdown.
+        `run_turn(user_id, question, remember) -> {"answer": ...}` and `is_ready()` default to the
+        agent registry; an app serving another agent passes its own.
+        """
+        if run_turn is not None:
+            self._run_turn, self._is_ready = run_turn, is_ready or (lambda: True)
+        while True:
+            try:
+                if engine and self._is_ready() and in_window():
+                    self.running = True
+                    computed = await self.run_pass()
+                    if computed:
+                        print(f"💡 [INSIGHTS] Stored {computed} template insights.")
+                        # More users may be waiting; go again without sleeping while passes make progress.
+                        continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️ [INSIGHTS] Insight pass failed: {e}")
+            finally:
+                self.running = False
+            await asyncio.sleep(INSIGHTS_POLL_SECONDS)
+
+    def status(self) -> dict:
+        return {"window": INSIGHTS_WINDOW or "always", "in_window": in_window(), "running": self.running,
+                "concurrency": INSIGHTS_CONCURRENCY, **self.stats}
+
+
+insight_pipeline = InsightPipeline()
@@ -0,0 +1,92 @@
+# /services/transaction_search.py
+
+import base64
+import datetime
+import sqlalchemy
+
+# Must match the expression indexed by transactions_search_idx (see create_schema.py) for the index to be used.
+SEARCH_DOCUMENT = "to_tsvector('english', description || ' ' || category)"
+
+# A search term matches a transaction through any of:
+#   * full-text: stemmed words of description and category ("coffees" finds "Coffee")
+#   * fuzzy: trigram word similarity to the description ("starbuks" finds "Starbucks")
+#   * substring: case-insensitive, served by the same trigram index ("amaz" finds "Amazon")
+# `<%%` is pg_trgm's `<%` written for pg8000's format paramstyle.
+SEARCH_CONDITION = f"""(
+    {SEARCH_DOCUMENT} @@ websearch_to_tsquery('english', :search)
+    OR :search <%% description
+    OR description ILIKE :search_pattern
+)"""
+
+
+def encode_cursor(date: datetime.date, transaction_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{date.isoformat()}|{transaction_id}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime.date, int]:
+    """Raises ValueError for anything encode_cursor did not produce."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        date, transaction_id = raw.split("|")
+        return datetime.date.fromisoformat(date), int(transaction_id)
+    except Exception as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def build_filters(user_id: str, search: str | None = None, category: str | None = None,
+                  min_amount: float | None = None, max_amount: float | None = None,
+                  date_from: datetime.date | None = None, date_to: datetime.date | None = None) -> tuple[str, dict]:
+    """WHERE clause and parameters for a user's transactions. Amount bounds apply to the absolute amount."""
+    clauses = ["user_id = :user_id"]
+    params = {"user_id": user_id}
+    if search and search.strip():
+        clauses.append(SEARCH_CONDITION)
+        params["search"] = search.strip()
+        escaped = params["search"].replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        params["search_pattern"] = f"%{escaped}%"
+    if category:
+        clauses.append("LOWER(category) = LOWER(:category)")
+        params["category"] = category
+    if min_amount is not None:
+        clauses.append("ABS(amount) >= :min_amount")
+        params["min_amount"] = min_amount
+    if max_amount is not None:
+        clauses.append("ABS(amount) <= :max_amount")
+        params["max_amount"] = max_amount
+    # Date bounds also prune Transactions partitions.
+    if date_from:
+        clauses.append("date >= :date_from")
+        params["date_from"] = date_from
+    if date_to:
+        clauses.append("date <= :date_to")
+        params["date_to"] = date_to
+    return " AND ".join(clauses), params
+
+
+def search_transactions(conn, user_id: str, limit: int = 20, cursor: str | None = None, **filters) -> dict:
+    """
+    One page of the user's matching transactions, newest first. Pages are keyed on (date, id) of
+    the last row instead of an offset, so page N costs the same as page 1 however deep it is.
+    """
+    where, params = build_filters(user_id, **filters)
+    if cursor:
+        params["cursor_date"], params["cursor_id"] = decode_cursor(cursor)
+        where += " AND (date, id) < (:cursor_date, :cursor_id)"
+    rows = conn.execute(
+        sqlalchemy.text(f"""
+            SELECT id, date, description, category, amount, type
+            FROM transactions
+            WHERE {where}
+            ORDER BY date DESC, id DESC
+            LIMIT :limit
+        """),
+        {**params, "limit": limit + 1}
+    ).fetchall()
+    next_cursor = encode_cursor(rows[limit - 1][1], rows[limit - 1][0]) if len(rows) > limit else None
+    return {
+        "transactions": [
+            {"date": str(row[1]), "description": row[2], "category": row[3], "amount": float(row[4]), "type": row[5]}
+            for row in rows[:limit]
+        ],
+        "nextCursor": next_cursor,
+    }